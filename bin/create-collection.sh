@@ -0,0 +1,31 @@
+#!/bin/sh
+
+: ${SPATIAL_SEARCH_HOME:="${PWD}"}
+. ${SPATIAL_SEARCH_HOME}/settings.sh
+
+if [ -z $1 ]
+then
+	echo "Missing collection name."
+fi
+
+collection=$1
+shift
+
+if [ ! -z $1 ]
+then
+	data="-f $1"
+	shift
+fi
+
+# 1. Upload the default settings as a config set. This goes through
+#    ZooKeeper, as config sets uploaded with the API are not trusted, and
+#    the default settings use <lib> directives.
+docker exec ${KG_SPATIAL_SEARCH_CLOUD_SERVICE_NAME} \
+	solr zk upconfig -z zookeeper:2181 -n ${KG_SPATIAL_SEARCH_CONFIG_SET} \
+	-d /opt/solr/server/solr/configsets/${KG_SPATIAL_SEARCH_CONFIG_SET}/conf
+
+# 2. Create the collection, register the Spatial types and fields
+${PYTHON_ROOT}/register.py -u ${KG_SPATIAL_SEARCH_URL} -c ${collection} \
+	--cloud --shards=${KG_SPATIAL_SEARCH_SHARDS} \
+	--replicas=${KG_SPATIAL_SEARCH_REPLICAS} \
+	--config=${KG_SPATIAL_SEARCH_CONFIG_SET} ${data} $@
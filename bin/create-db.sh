@@ -17,12 +17,25 @@ then
 	shift
 fi
 
-# 1. Create the core
-if [ ! -d ${KG_SPATIAL_SEARCH_DATA}/${core} ]
-then
-	sudo cp -r ${KG_SPATIAL_SEARCH_DATA_DEFAULTS} ${KG_SPATIAL_SEARCH_DATA}/${core}
-	sudo chown -R 8983:8983 ${KG_SPATIAL_SEARCH_DATA}
-fi
+# 1. Create the core, and its companion core for the label summaries when
+#    they are maintained (-s)
+cores=${core}
+for arg in "$@"
+do
+	if [ "${arg}" = "-s" ]
+	then
+		cores="${core} ${core}_labels"
+	fi
+done
+
+for c in ${cores}
+do
+	if [ ! -d ${KG_SPATIAL_SEARCH_DATA}/${c} ]
+	then
+		sudo cp -r ${KG_SPATIAL_SEARCH_DATA_DEFAULTS} ${KG_SPATIAL_SEARCH_DATA}/${c}
+		sudo chown -R 8983:8983 ${KG_SPATIAL_SEARCH_DATA}
+	fi
+done
 
 # 2. Register the Spatial types and fields
 ${PYTHON_ROOT}/register.py -u ${KG_SPATIAL_SEARCH_URL} -c ${core} ${data} $@
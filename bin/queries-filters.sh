@@ -0,0 +1,22 @@
+#!/bin/sh
+
+: ${SPATIAL_SEARCH_HOME:="${PWD}"}
+. ${SPATIAL_SEARCH_HOME}/settings.sh
+
+folder=$(echo queries-filters.$(date +%Y%m%d-%H%M))
+mkdir -p $folder
+
+iterate() {
+	for f in '' $*
+	do
+		for d in 1 2 5
+		do
+			time ${PYTHON_ROOT}/queries-filters-bench.py \
+				-c $d${f}k -n 1000 -r 20 -u \
+				${KG_SPATIAL_SEARCH_URL} | tee ${folder}/$d${f}k.csv
+			echo ------------------------------------------------------------------------
+		done
+	done
+}
+
+iterate 0 00
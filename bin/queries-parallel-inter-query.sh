@@ -14,6 +14,10 @@ iterate() {
 			time ${PYTHON_ROOT}/queries-parallel-inter-query-bench.py \
 				-c $d${f}k -r 20 -t 10 -u \
 				${KG_SPATIAL_SEARCH_URL} | tee ${folder}/$d${f}k.csv
+			${PYTHON_ROOT}/queries-results.py \
+				-d ${KG_SPATIAL_SEARCH_RESULTS} store -b parallel-inter-query \
+				-c $d${f}k -r 20 -t 10 -u ${KG_SPATIAL_SEARCH_URL} \
+				${folder}/$d${f}k.csv
 			echo ------------------------------------------------------------------------
 		done
 	done
@@ -14,6 +14,10 @@ iterate() {
 			time ${PYTHON_ROOT}/queries-serial-bench.py \
 				-c $d${f}k -r 20 -u \
 				${KG_SPATIAL_SEARCH_URL} | tee ${folder}/$d${f}k.csv
+			${PYTHON_ROOT}/queries-results.py \
+				-d ${KG_SPATIAL_SEARCH_RESULTS} store -b serial \
+				-c $d${f}k -r 20 -u ${KG_SPATIAL_SEARCH_URL} \
+				${folder}/$d${f}k.csv
 			echo ------------------------------------------------------------------------
 		done
 	done
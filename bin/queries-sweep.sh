@@ -0,0 +1,17 @@
+#!/bin/sh
+
+: ${SPATIAL_SEARCH_HOME:="${PWD}"}
+. ${SPATIAL_SEARCH_HOME}/settings.sh
+
+folder=$(echo queries-sweep.$(date +%Y%m%d-%H%M))
+mkdir -p $folder
+
+if [ ! -e datasets ]
+then
+	ln -s $(ls -d data*|tail -n 1) datasets
+fi
+
+time ${PYTHON_ROOT}/queries-sweep.py \
+	-s 1,2,5,10,20,50,100,200,500,1000 -t 1,2,5,10,20 -r 20 \
+	-d datasets -o ${folder}/sweep -R ${KG_SPATIAL_SEARCH_RESULTS} \
+	-u ${KG_SPATIAL_SEARCH_URL} $@ | tee ${folder}/sweep.csv
@@ -0,0 +1,140 @@
+#!/usr/bin/python
+
+import getopt
+import json
+import random
+import sys
+
+from util.approx import Approximate
+from util.catalog import Catalog
+from util.solr import Solr
+import util.benchmarks as bench
+import util.stat as stat
+
+
+def usage(progname, retval=0):
+    print("%s -u <url> -c <core> [-n <num>] [-b <bins>] [-e <error>] "
+          "[-s <seed>]" % progname)
+    print("\t-u <url>           \turl to the Solr server")
+    print("\t-c <core>          \tCore to use for the queries")
+    print("\t-n <num>           \tnumber of random boxes (default: 100)")
+    print("\t-b <bins>          \tbins per dimension of the density "
+          "histogram (default: 16)")
+    print("\t-e <error>         \tmaximum relative error, above which the "
+          "exact count is computed (default: none)")
+    print("\t-s <seed>          \tseed of the random boxes (default: 0)")
+    sys.exit(retval)
+
+
+def random_box(rng, mbb):
+    a = [rng.uniform(mbb[0][d], mbb[1][d]) for d in [0, 1, 2]]
+    b = [rng.uniform(mbb[0][d], mbb[1][d]) for d in [0, 1, 2]]
+    return [[min(a[d], b[d]) for d in [0, 1, 2]],
+            [max(a[d], b[d]) for d in [0, 1, 2]]]
+
+
+def exact_distinct(solr, core, box):
+    facet = {'distinct': 'unique(properties.id)'}
+    rsp = solr.query(core, mbb=box, rows=0, indent='off',
+                     params=[('json.facet', json.dumps(facet))])
+    return rsp.get('facets', {}).get('distinct', 0)
+
+
+def main(argv):
+    progname = argv[0]
+    url = ''
+    core = ''
+    num_boxes = 100
+    bins = 16
+    max_error = None
+    seed = 0
+
+    try:
+        opts, args = getopt.getopt(argv[1:], 'u:c:n:b:e:s:h')
+    except getopt.GetoptError:
+        usage(progname, 1)
+
+    for opt, arg in opts:
+        if opt == '-u':
+            url = arg
+        elif opt == '-c':
+            core = arg
+        elif opt == '-n':
+            num_boxes = int(arg)
+        elif opt == '-b':
+            bins = int(arg)
+        elif opt == '-e':
+            max_error = float(arg)
+        elif opt == '-s':
+            seed = int(arg)
+        elif opt == '-h':
+            usage(progname)
+        else:
+            usage(progname, 1)
+
+    if len(opts) == 0:
+        usage(progname, 1)
+
+    assert (url != '')
+    assert (core != '')
+    assert (num_boxes > 0)
+
+    solr = Solr(url)
+    catalog = Catalog(solr, bins=bins)
+    approx = Approximate(solr, catalog, max_error)
+
+    # The statistics are computed once per index version, not timed
+    _, t = bench.timed(lambda: catalog.get(core))
+    print("Catalog computed in %.3fs" % t)
+
+    rng = random.Random(seed)
+    boxes = [random_box(rng, catalog.mbb(core)) for i in range(num_boxes)]
+
+    timings = {'exact-count': [], 'approx-count': [],
+               'exact-distinct': [], 'approx-distinct': []}
+    errors = {'count': [], 'distinct': []}
+    outside = {'count': 0, 'distinct': 0}
+    exact_results = 0
+
+    for box in boxes:
+        exact, t = bench.timed(
+            lambda: solr.query_cardinality(core, mbb=box), True)
+        timings['exact-count'].append(t)
+        r, t = bench.timed(
+            lambda: approx.query_cardinality(core, mbb=box), True)
+        timings['approx-count'].append(t)
+        exact_results += r['exact']
+        errors['count'].append(abs(r['value'] - exact) / float(max(exact, 1)))
+        outside['count'] += not (r['lower'] <= exact <= r['upper'])
+
+        exact, t = bench.timed(
+            lambda: exact_distinct(solr, core, box), True)
+        timings['exact-distinct'].append(t)
+        r, t = bench.timed(
+            lambda: approx.count_distinct(core, mbb=box), True)
+        timings['approx-distinct'].append(t)
+        exact_results += r['exact']
+        errors['distinct'].append(abs(r['value'] - exact) /
+                                  float(max(exact, 1)))
+        outside['distinct'] += not (r['lower'] <= exact <= r['upper'])
+
+    #########################################################################
+    # Output the selected statistics
+    print("Query,counts,timing")
+    for label in sorted(timings):
+        print("%s,%d,%s" % (label, num_boxes,
+                            ",".join(["%.16f" % t for t in timings[label]])))
+
+    print("Query,median exact,median approx,speedup,median error,"
+          "max error,outside bounds")
+    for q in ['count', 'distinct']:
+        e = stat.median(timings['exact-%s' % q])
+        a = stat.median(timings['approx-%s' % q])
+        print("S,%s,%.6f,%.6f,%.1f,%.4f,%.4f,%d" %
+              (q, e, a, e / max(a, 1e-9), stat.median(errors[q]),
+               max(errors[q]), outside[q]))
+    print("S,exact results,%d" % exact_results)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,110 @@
+#!/usr/bin/python
+
+import getopt
+import sys
+import time
+
+from util.backends import MemoryBackend
+from util.solr import Solr
+import util.benchmarks as bench
+import util.stat as stat
+
+
+def usage(progname, retval=0):
+    print("%s -c <core> -f <file> -r <num> [-u <url>]" % progname)
+    print("\t-c <core>          \tCore to use for the queries")
+    print("\t-f <file>          \tData file loaded in <core>, as generated by"
+          " generate_rnd_uniform.py")
+    print("\t-u <url>           \turl to the Solr server, when omitted only "
+          "the in-process backend is benchmarked")
+    print("\t-r <num>           \tnumber of repetition, per query")
+    sys.exit(retval)
+
+
+#############################################################################
+# Manage parameters & global symbols
+core = ''
+url = ''
+data_file = ''
+
+
+def repeat(count, query, *args):
+    # Warm up query, not timed
+    query(*args)
+    return [bench.timed(lambda: query(*args))[1] for i in range(0, count)]
+
+
+def run_queries(backends, workload, repetitions):
+    timings = []
+    for name, solr in backends:
+        bench.init(solr, core)
+        for label, query, args in workload:
+            timings.append(("%s-%s" % (name, label),
+                            repeat(repetitions, query, *args)))
+
+    #########################################################################
+    # Output the selected statistics
+    print("Query,counts,timing")
+    for label, ts in timings:
+        print("%s,%d,%s" % (label, repetitions,
+                            ",".join(["%.16f" % t for t in ts])))
+
+    return dict(timings)
+
+
+def main(argv):
+    global core, url, data_file
+    progname = argv[0]
+    repetitions = 0
+
+    try:
+        opts, args = getopt.getopt(argv[1:], 'c:f:r:u:h')
+    except getopt.GetoptError:
+        usage(progname, 1)
+
+    for opt, arg in opts:
+        if opt == '-c':
+            core = arg
+        elif opt == '-f':
+            data_file = arg
+        elif opt == '-r':
+            repetitions = int(arg)
+        elif opt == '-u':
+            url = arg
+        elif opt == '-h':
+            usage(progname)
+        else:
+            usage(progname, 1)
+
+    if len(opts) == 0:
+        usage(progname, 1)
+
+    assert (repetitions > 0)
+    assert (core != '')
+    assert (data_file != '')
+
+    memory = MemoryBackend()
+    start = time.time()
+    memory.load(core, data_file)
+    print("In-process backend loaded in %.3fs" % (time.time() - start))
+
+    # The workload is computed once, from the in-process backend, so both
+    # backends run exactly the same queries.
+    backends = [('memory', Solr('memory://', backend=memory))]
+    bench.init(backends[0][1], core)
+    workload = bench.workload()
+    if url != '':
+        backends.append(('solr', Solr(url)))
+
+    timings = run_queries(backends, workload, repetitions)
+
+    if url != '':
+        print("Query,median memory,median solr,speedup")
+        for label, _, _ in workload:
+            m = stat.median(timings['memory-%s' % label])
+            s = stat.median(timings['solr-%s' % label])
+            print("S,%s,%.6f,%.6f,%.1f" % (label, m, s, s / max(m, 1e-9)))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,174 @@
+#!/usr/bin/python
+
+import getopt
+import json
+import sys
+import time
+
+import requests
+
+from util.solr import Solr
+from util.standin import Settings, StandIn
+import util.stat as stat
+
+
+def usage(progname, retval=0):
+    print("%s -r <num> [-n <docs>] [-l <ms>] [-u <url>]" % progname)
+    print("\t-r <num>           \tnumber of repetition, per query")
+    print("\t-n <docs>          \tnumber of documents returned by the "
+          "stand-in, per query (default 1000)")
+    print("\t-l <ms>            \tlatency added by the stand-in (default 0)")
+    print("\t-u <url>           \turl to an already running stand-in, see "
+          "solr-standin.py")
+    sys.exit(retval)
+
+
+#############################################################################
+# Request capture
+class _Captured(Exception):
+    def __init__(self, endpoint, params):
+        Exception.__init__(self, endpoint)
+        self.endpoint = endpoint
+        self.params = params
+
+
+class CapturingSolr(Solr):
+    """Client stopping at the first request to a core, to time how long it
+    takes to build the request, and to get its parameters."""
+
+    def _get_core(self, core, endpoint, params,
+                  print_timing=False, verbose=False):
+        raise _Captured('%s/%s' % (core, endpoint), params)
+
+
+def build(solr, call):
+    try:
+        call(solr)
+    except _Captured as c:
+        return c
+    raise AssertionError('no request built')
+
+
+#############################################################################
+# Manage parameters & global symbols
+core = 'standin'
+solr = None
+capture = None
+session = None
+
+queries = [
+    ('oid', lambda s: s.query(core, oid='oid1', rows=num_docs,
+                              indent='off')),
+    ('geometry', lambda s: s.query(core, geometry=[0.5, 0.5, 0.5],
+                                   rows=num_docs, indent='off')),
+    ('mbb', lambda s: s.query(core, mbb=[[0., 0., 0.], [.5, .5, .5]],
+                              rows=num_docs, indent='off')),
+    ('space', lambda s: s.query(core, reference_space='space0',
+                                rows=num_docs, indent='off')),
+    ('cardinality', lambda s: s.query_cardinality(core, oid='oid1')),
+    ('spatial_mbb', lambda s: s.spatial_mbb(core))
+]
+num_docs = 1000
+
+
+def timed(f):
+    start = time.perf_counter()
+    r = f()
+    return time.perf_counter() - start, r
+
+
+def measure(label, call, repetitions):
+    """Times, for one query type, each stage separately:
+        build       query parameters built by the client
+        encode      URL and HTTP request preparation
+        transport   round trip to the stand-in, body received
+        decode      JSON decoding of the body
+        total       the whole client call, including its extra requests
+    """
+    url = '%s/%s' % (solr.service_url,
+                     build(capture, call).endpoint)
+    params = build(capture, call).params
+    body = session.get(url, params=params).content
+
+    # Warm up, not timed
+    call(solr)
+
+    stages = dict([(s, []) for s in
+                   ['build', 'encode', 'transport', 'decode', 'total']])
+    for i in range(0, repetitions):
+        stages['build'].append(timed(lambda: build(capture, call))[0])
+        stages['encode'].append(timed(lambda: requests.Request(
+            'GET', url, params=params).prepare())[0])
+        stages['transport'].append(timed(lambda: session.get(
+            url, params=params).content)[0])
+        stages['decode'].append(timed(lambda: json.loads(body))[0])
+        stages['total'].append(timed(lambda: call(solr))[0])
+
+    return len(body), stages
+
+
+def main(argv):
+    global solr, capture, session, num_docs
+    progname = argv[0]
+    repetitions = 0
+    latency = 0.0
+    url = ''
+
+    try:
+        opts, args = getopt.getopt(argv[1:], 'r:n:l:u:h')
+    except getopt.GetoptError:
+        usage(progname, 1)
+
+    for opt, arg in opts:
+        if opt == '-r':
+            repetitions = int(arg)
+        elif opt == '-n':
+            num_docs = int(arg)
+        elif opt == '-l':
+            latency = float(arg) / 1000.0
+        elif opt == '-u':
+            url = arg
+        elif opt == '-h':
+            usage(progname)
+        else:
+            usage(progname, 1)
+
+    if len(opts) == 0:
+        usage(progname, 1)
+
+    assert (repetitions > 0)
+
+    standin = None
+    if url == '':
+        standin = StandIn(Settings(num_found=num_docs, latency=latency,
+                                   cores=[core])).start()
+        url = standin.url
+
+    try:
+        solr = Solr(url)
+        capture = CapturingSolr(url)
+        session = requests.Session()
+
+        results = [(label,) + measure(label, call, repetitions)
+                   for label, call in queries]
+    finally:
+        if standin is not None:
+            standin.stop()
+
+    #########################################################################
+    # Output the selected statistics
+    print("Query,counts,timing")
+    for label, size, stages in results:
+        for stage, ts in stages.items():
+            print("%s-%s,%d,%s" % (label, stage, repetitions,
+                                   ",".join(["%.16f" % t for t in ts])))
+
+    print("Query,bytes,median build [us],encode,transport,decode,total")
+    for label, size, stages in results:
+        print("S,%s,%d,%s" % (label, size, ",".join(
+            ["%.1f" % (stat.median(stages[s]) * 1e6)
+             for s in ['build', 'encode', 'transport', 'decode', 'total']])))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -1,28 +1,45 @@
 #!/usr/bin/python
 
 import getopt
+import os
 import sys
-import copy
 
+from util.catalog import Catalog
+from util.lod import extent
 from util.plot_3d import Fig
 from util.solr import Solr
 
 
 def usage(progname, retval=0):
-    print("%s -c <core> -u <url> [(-s|-S)]" % progname)
+    print("%s -c <core> -u <url> [(-s|-S)] [-C <folder>] [-o <folder> [-H]]"
+          % progname)
     print("\t-c <core>          \tCore to use for the queries")
     print("\t-u <url>           \turl to the Solr server")
     print("\t-S                 \tShow universe bounds")
     print("\t-s                 \tHide universe bounds")
+    print("\t-C <folder>        \tCache the statistics of the core, "
+          "universe bounds included, in <folder>")
+    print("\t-o <folder>        \tWrite the figures as PNG files in <folder>"
+          " instead of showing them")
+    print("\t-H                 \tWith -o, write interactive HTML files "
+          "instead, requires plotly")
     sys.exit(retval)
 
 
 #############################################################################
 # Query utils
 def draw_universe(fig):
+    global universe_mbb
     if show_universe:
-        # Add a box around all the points in the dataset
-        universe_mbb = solr.spatial_mbb(core)
+        # Add a box around all the points in the dataset, read from the
+        # catalog when its statistics are cached, as computing them is
+        # heavier than a single stats query. Computed once, and reused by
+        # all the figures.
+        if universe_mbb is None:
+            if catalog is not None:
+                universe_mbb = catalog.mbb(core)
+            else:
+                universe_mbb = solr.spatial_mbb(core)
 
         # Draw the box
         fig.plot_mbb(universe_mbb, linecolor='grey', linestyle='dotted')
@@ -33,27 +50,18 @@ def draw_query_box(fig, box):
     fig.plot_mbb(box, linecolor='grey', linestyle='dashed')
 
 
-def average_point(group):
-    # FIXME: Most likely not good python code, might even be uber slow
-    # FIXME: We arbitrarily take the first point properties for the group of
-    #        points. This is most likely not correct in most situations.
+def show(fig, name):
+    # Show the figure, or write it in the output folder
+    if output is None:
+        fig.show()
+    else:
+        fig.show(path=os.path.join(output, '%s.%s' % (name, output_format)))
 
-    c = len(group)      # Number of points
-    n = len(group[0])   # Number of dimensions
-    a = copy.deepcopy(group[0])
-    for i in range(0, n, 1):
-        a['geometry.coordinates_%d___pdouble' % i] = 0.0
 
-    for p in group:
-        for i in range(0, n, 1):
-            a['geometry.coordinates_%d___pdouble' % i] += \
-                p['geometry.coordinates_%d___pdouble' % i]
-
-    for i in range(0, n, 1):
-        a['geometry.coordinates_%d___pdouble' % i] = (
-                    a['geometry.coordinates_%d___pdouble' % i] / float(c))
-
-    return a
+def oid_of(doc):
+    # properties.id is multi-valued
+    oid = doc['properties.id']
+    return oid[0] if isinstance(oid, list) else oid
 
 
 #############################################################################
@@ -74,11 +82,10 @@ def query_oid(oid):
     # Add a box containing all the points of the query
     draw_query_box(f, box)
 
-    # Plot each point individually, be careful w.r.t the number of points,
-    # as this can be very slow if there are a lots of points
+    # Plot all the points at once
     f.add_points(points)
 
-    f.show()
+    show(f, 'oid')
 
 
 def query_geometry(geometry):
@@ -86,8 +93,7 @@ def query_geometry(geometry):
     # Find out all the points at the given position
 
     # Strictly speaking there might be a mismatch as the following calls are
-    # not atomic, between the call to cardinality, the actual query and
-    # create_colors.
+    # not atomic, between the call to cardinality and the actual query.
     num_points = solr.query_cardinality(core, geometry=geometry)
     points = solr.query(core, geometry=geometry,
                         fl=spatial_fields+',properties.id',
@@ -105,15 +111,10 @@ def query_geometry(geometry):
     # Add a box containing all the points of the query
     draw_query_box(f, box)
 
-    # Generates multiple colors, one per point
-    f.create_colors(num_points)
+    # Plot all the points at once, one color per OID
+    f.add_points(points, labels=[oid_of(p) for p in points])
 
-    # Plot each point individually, be careful w.r.t the number of points,
-    # as this can be very slow if there are a lot of points
-    for p in points:
-        f.add_points([p], label=p['properties.id'][0], color=f.next_color())
-
-    f.show()
+    show(f, 'geometry')
 
 
 def query_mbb(mbb):
@@ -121,7 +122,8 @@ def query_mbb(mbb):
     # Find out all the points included in the minimum bounding box
     num_points = solr.query_cardinality(core, mbb=mbb)
     print("#Points: %d" % num_points)
-    points = solr.query(core, mbb=mbb, rows=num_points)["response"]["docs"]
+    points = solr.query(core, mbb=mbb, fl=spatial_fields+',properties.id',
+                        rows=num_points)["response"]["docs"]
 
     #########################################################################
     # Create a figure to present the results
@@ -133,26 +135,24 @@ def query_mbb(mbb):
     # Draw the query box
     f.plot_mbb(mbb, linecolor='red')
 
-    # Generates multiple colors, one per point
-    f.create_colors(len(points))
+    # Plot all the points at once, one color per OID
+    f.add_points(points, labels=[oid_of(p) for p in points])
 
-    # Plot each point individually, be careful w.r.t the number of points,
-    # as this can be very slow if there are a lots of points
-    for p in points:
-        f.add_points([p], color=f.next_color())
+    show(f, 'mbb')
 
-    f.show()
 
-
-def query_space(reference_space, bucket_size, page_size):
-    # page_size : Max number of rows per query
-    # bucket_size: Number of points to group together, per page
+def query_space(reference_space, k):
+    # k: Maximum number of points drawn
 
     #########################################################################
-    # Find out all the points linked to the reference space
+    # Find out a level of detail view of the points linked to the reference
+    # space: the centroids of at most k cells, aggregated by Solr
     num_points = solr.query_cardinality(core, reference_space=reference_space)
-    box = solr.spatial_mbb(core, query='geometry.referenceSpace:%s' %
-                                       reference_space)
+    # The extent of the points, which the grid of the centroids covers
+    box = extent(solr, core, reference_space=reference_space)
+    coordinates, counts = solr.lod(core, k, mbb=box,
+                                   reference_space=reference_space)
+    print("#Points: %d, drawn: %d" % (num_points, len(coordinates)))
 
     #########################################################################
     # Create a figure to present the results
@@ -161,41 +161,17 @@ def query_space(reference_space, bucket_size, page_size):
     # Add a box around all the points in the dataset
     draw_universe(f)
 
-    # Generates multiple boxes, as slices along X
-    pages = int((num_points / float(page_size)) + 1)
-
-    length = (box[1][0] - box[0][0])
-    box_width = length / pages
-    pb = box[:][:]
-    pb[0][0] = pb[1][0] - box_width
-
-    # Generates multiple colors, one per page (or slice of the dataset)
-    f.create_colors(pages)
+    # Add a box containing all the points of the query, not only their
+    # centroids
+    if box is not None:
+        draw_query_box(f, box)
 
-    page = 0
-    while page < pages:
-        # Grab the next set of rows of the query
-        points = solr.query(core, reference_space=reference_space,
-                            fl=spatial_fields, rows=page_size,
-                            start=page_size*page)["response"]["docs"]
+    # All the centroids at once, their size growing with the number of
+    # points they stand for
+    f.add_points(coordinates, s=1 + 9 * counts / float(max(counts.max(
+        initial=0), 1)))
 
-        color = f.next_color()
-
-        # Skip some points, as a way to display huge datasets
-        pp = [average_point(group)
-              for group in zip(*[iter(points)] * bucket_size)]
-        f.add_points(pp, color=color)
-
-        # Add a box around the current slice of the dataset
-        f.plot_mbb(pb, linecolor=color, linestyle="dotted")
-
-        # Compute the next box_width box
-        pb[0][0] -= box_width
-        pb[1][0] -= box_width
-
-        page += 1
-
-    f.show()
+    show(f, 'space')
 
 
 def query_labels(labels):
@@ -228,17 +204,23 @@ def query_labels(labels):
     for l in labels:
         f.add_points(points[l], label=l, color=f.next_color())
 
-    f.show()
+    show(f, 'labels')
 
 
 #############################################################################
 # Manage parameters & global symbols
 core = ''
 solr = None
+catalog = None
 url = ''
 
+# Folder and format of the figures, None to show them
+output = None
+output_format = 'png'
+
 # Set to true to draw the bounding box of all the points available in Solr
 show_universe = False
+universe_mbb = None
 
 # comma separated names of spatial fields used in the index:
 spatial_fields = \
@@ -248,14 +230,15 @@ spatial_fields = \
 
 
 def main(argv):
-    global core, url, solr, show_universe
+    global core, url, solr, catalog, show_universe, output, output_format
     progname = argv[0]
+    catalog_folder = None
 
     # url = 'https://nexus-dev.humanbrainproject.org/solr/' # CSCS
     # url = 'http://M64006A327BAE.dyn.epfl.ch:8983/solr'
 
     try:
-        opts, args = getopt.getopt(argv[1:], 'c:u:sS')
+        opts, args = getopt.getopt(argv[1:], 'c:u:sSC:o:Hh')
     except getopt.GetoptError:
         usage(progname, 1)
 
@@ -268,6 +251,12 @@ def main(argv):
             show_universe = True
         elif opt == '-s':
             show_universe = False
+        elif opt == '-C':
+            catalog_folder = arg
+        elif opt == '-o':
+            output = arg
+        elif opt == '-H':
+            output_format = 'html'
         elif opt == '-h':
             usage(progname)
         else:
@@ -279,7 +268,12 @@ def main(argv):
     assert (core != '')
     assert (url != '')
 
+    if output is not None and not os.path.isdir(output):
+        os.makedirs(output)
+
     solr = Solr(url)
+    if catalog_folder is not None:
+        catalog = Catalog(solr, catalog_folder)
 
     ####
     # Uncomment below to execute a specific query
@@ -302,8 +296,8 @@ def main(argv):
 
     # query_mbb([[380, 100, 50], [400, 300, 200]])
 
-    # query_space('MNI', 1, 20)
-    # query_space('WHS_SD_rat_v1.01', 100, 20000)
+    # query_space('MNI', 10000)
+    # query_space('WHS_SD_rat_v1.01', 50000)
 
     # query_labels(['75422678_s0152_object'])
     # query_labels(['75422652_s0152_object', '75422676_s0064_object'])
@@ -0,0 +1,137 @@
+#!/usr/bin/python
+
+import getopt
+import sys
+import time
+
+from util.sinks import check, open_sink
+from util.solr import Solr
+
+
+def usage(progname, retval=0):
+    print("%s -u <url> -c <core> -o <output> [options]" % progname)
+    print("\t-u <url>           \turl to the Solr server")
+    print("\t-c <core>          \tCore to export the points from")
+    print("\t-o <output>        \tOutput, the format is selected by the "
+          "extension:")
+    print("\t                   \t  .parquet Parquet, one row group per batch")
+    print("\t                   \t  .arrow   Arrow IPC file")
+    print("\t                   \t  .ply     binary PLY")
+    print("\t                   \t  otherwise a folder of .npy files")
+    print("\t-b <num>           \tPoints per batch, bounds the memory used"
+          " (default: 10000)")
+    print("\t--oid=<oid>        \tExport the points of <oid>")
+    print("\t--space=<space>    \tExport the points of the reference space "
+          "<space>")
+    print("\t--mbb=<x,y,z,x,y,z>\tExport the points within the box")
+    print("\t-p <num>           \tWith --mbb, number of parts fetched "
+          "concurrently (default: 1)")
+    print("\t-w <num>           \tWith --mbb, number of workers "
+          "(default: <parts>)")
+    print("\t-v                 \tprint the progress")
+    print("\t-k                 \tcheck the sink of <output>: write random "
+          "batches to it and read them back, no server needed")
+    sys.exit(retval)
+
+
+def main(argv):
+    progname = argv[0]
+    url = ''
+    core = ''
+    output = ''
+    batch = 10000
+    parts = 1
+    workers = 0
+    filters = {}
+    verbose = False
+    check_sink = False
+
+    try:
+        opts, args = getopt.getopt(argv[1:], 'u:c:o:b:p:w:vkh',
+                                   ['oid=', 'space=', 'mbb='])
+    except getopt.GetoptError:
+        usage(progname, 1)
+
+    for opt, arg in opts:
+        if opt == '-u':
+            url = arg
+        elif opt == '-c':
+            core = arg
+        elif opt == '-o':
+            output = arg
+        elif opt == '-b':
+            batch = int(arg)
+        elif opt == '-p':
+            parts = int(arg)
+        elif opt == '-w':
+            workers = int(arg)
+        elif opt == '--oid':
+            filters['oid'] = arg
+        elif opt == '--space':
+            filters['reference_space'] = arg
+        elif opt == '--mbb':
+            v = [float(x) for x in arg.split(',')]
+            assert (len(v) == 6)
+            filters['mbb'] = [v[0:3], v[3:6]]
+        elif opt == '-v':
+            verbose = True
+        elif opt == '-k':
+            check_sink = True
+        elif opt == '-h':
+            usage(progname)
+        else:
+            usage(progname, 1)
+
+    if len(opts) == 0:
+        usage(progname, 1)
+
+    assert (output != '')
+
+    if check_sink:
+        ok = check(output)
+        if ok is None:
+            print("Skipped, the sink of %s is not available" % output)
+        else:
+            print("Round-trip of %s: %s" % (output, 'ok' if ok else 'FAILED'))
+        sys.exit(0 if ok is not False else 1)
+
+    assert (url != '')
+    assert (core != '')
+    assert (batch > 0)
+    assert (parts > 0)
+
+    solr = Solr(url)
+    start = time.time()
+
+    with open_sink(output) as sink:
+        if parts > 1:
+            if 'mbb' not in filters:
+                print("-p requires --mbb")
+                sys.exit(1)
+            fq = []
+            if 'oid' in filters:
+                fq.append('properties.id:%s' % filters['oid'])
+            if 'reference_space' in filters:
+                fq.append('geometry.referenceSpace:%s' %
+                          filters['reference_space'])
+            _, report = solr.export_region(core, filters['mbb'], parts,
+                                           workers or parts, sink=sink,
+                                           page_size=batch, fq=fq)
+        else:
+            for coordinates, labels in solr.stream(core, batch, **filters):
+                sink.write(coordinates, labels)
+                if verbose:
+                    print("%d points, %.1f points/s" %
+                          (sink.count, sink.count / (time.time() - start)))
+
+    elapsed = time.time() - start
+    print("Exported %d points, %d labels, to %s in %.3fs, %.1f points/s" %
+          (sink.count, len(sink.oids), output, elapsed,
+           sink.count / elapsed if elapsed > 0 else 0.0))
+    if parts > 1:
+        print("Transferred %.1f MB, %.2f MB/s" %
+              (report['bytes'] / 1e6, report['mb_per_s']))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,142 @@
+#!/usr/bin/python
+
+import getopt
+import random
+import sys
+
+from util.filters import FilterOptimizer
+from util.solr import Solr
+import util.benchmarks as bench
+import util.stat as stat
+
+
+def usage(progname, retval=0):
+    print("%s -u <url> -c <core> [-n <num>] [-r <num>] [-l <slack>] "
+          "[-m <num>] [-s <seed>]" % progname)
+    print("\t-u <url>           \turl to the Solr server")
+    print("\t-c <core>          \tCore to use for the queries")
+    print("\t-n <num>           \tmaximum number of labels (default: 500)")
+    print("\t-r <num>           \tnumber of repetition, per query "
+          "(default: 10)")
+    print("\t-l <slack>         \tslack of the box merges (default: 0)")
+    print("\t-m <num>           \tmaximum number of boxes per filter() "
+          "group (default: 64)")
+    print("\t-s <seed>          \tseed of the label selection (default: 0)")
+    sys.exit(retval)
+
+
+def repeat(count, solr, core, fq):
+    # The filter is evaluated on every request, not read from the
+    # filterCache, to measure its evaluation cost. This only applies to the
+    # outer filter: the nested filter(...) groups of a grouped filter are
+    # still read from the filterCache after the first request.
+    fq = '{!cache=false}' + fq
+    solr._query(core, fq=[fq], rows=0)
+    return [bench.timed(lambda: solr._query(core, fq=[fq], rows=0))[1]
+            for i in range(0, count)]
+
+
+def main(argv):
+    progname = argv[0]
+    url = ''
+    core = ''
+    max_labels = 500
+    repetitions = 10
+    slack = 0.0
+    max_clauses = 64
+    seed = 0
+
+    try:
+        opts, args = getopt.getopt(argv[1:], 'u:c:n:r:l:m:s:h')
+    except getopt.GetoptError:
+        usage(progname, 1)
+
+    for opt, arg in opts:
+        if opt == '-u':
+            url = arg
+        elif opt == '-c':
+            core = arg
+        elif opt == '-n':
+            max_labels = int(arg)
+        elif opt == '-r':
+            repetitions = int(arg)
+        elif opt == '-l':
+            slack = float(arg)
+        elif opt == '-m':
+            max_clauses = int(arg)
+        elif opt == '-s':
+            seed = int(arg)
+        elif opt == '-h':
+            usage(progname)
+        else:
+            usage(progname, 1)
+
+    if len(opts) == 0:
+        usage(progname, 1)
+
+    assert (url != '')
+    assert (core != '')
+    assert (repetitions > 0)
+
+    solr = Solr(url)
+    optimizer = FilterOptimizer(slack, max_clauses)
+    rng = random.Random(seed)
+
+    labels = solr.list_field(core, 'properties.id')
+    # Never groups the boxes into filter(...), so that the whole optimized
+    # filter is evaluated on every request, as the raw one is
+    flat = FilterOptimizer(slack, max(1, len(labels)))
+    counts = [n for n in [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000]
+              if n <= min(max_labels, len(labels))]
+
+    timings = []
+    summary = []
+    for n in counts:
+        selected = rng.sample(labels, n)
+        # Computed once, the MBBs of the labels are not what is measured
+        mbbs = solr.label_mbbs(core, selected)
+
+        raw = ' OR '.join([solr.mbb_to_fq(m) for m in mbbs
+                           if m is not None and None not in m[0]])
+        optimized = flat.union_fq(mbbs, solr.mbb_to_fq)
+        grouped = optimizer.union_fq(mbbs, solr.mbb_to_fq)
+        boxes = len(optimizer.simplify(mbbs))
+
+        # Distinct filter strings for the same labels in other orders, each
+        # one being a separate filterCache entry
+        shuffled = [rng.sample(mbbs, n) for i in range(3)]
+        raw_distinct = len(set([raw] + [
+            ' OR '.join([solr.mbb_to_fq(m) for m in s
+                         if m is not None and None not in m[0]])
+            for s in shuffled]))
+        opt_distinct = len(set([grouped] + [
+            optimizer.union_fq(s, solr.mbb_to_fq) for s in shuffled]))
+
+        raw_t = repeat(repetitions, solr, core, raw)
+        opt_t = repeat(repetitions, solr, core, optimized)
+        # Timed separately, its filter(...) groups being cached
+        grouped_t = repeat(repetitions, solr, core, grouped)
+        timings.append(('raw-%d' % n, raw_t))
+        timings.append(('optimized-%d' % n, opt_t))
+        timings.append(('grouped-cached-%d' % n, grouped_t))
+        summary.append((n, len(mbbs), boxes, len(raw), len(optimized),
+                        raw_distinct, opt_distinct,
+                        stat.median(raw_t), stat.median(opt_t),
+                        stat.median(grouped_t)))
+
+    #########################################################################
+    # Output the selected statistics
+    print("Query,counts,timing")
+    for label, ts in timings:
+        print("%s,%d,%s" % (label, repetitions,
+                            ",".join(["%.16f" % t for t in ts])))
+
+    print("Query,labels,boxes,optimized boxes,bytes,optimized bytes,"
+          "distinct strings,grouped distinct strings,median,"
+          "optimized median,grouped median (cached groups)")
+    for s in summary:
+        print("S,%d,%d,%d,%d,%d,%d,%d,%.6f,%.6f,%.6f" % s)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -4,18 +4,22 @@ import getopt
 import random
 import sys
 
+from functools import partial
 from multiprocessing import Pool
 
 from util.solr import Solr
 import util.benchmarks as bench
+import util.profiling as profiling
 
 
 def usage(progname, retval=0):
-    print("%s -c <core> -r <num> -t <num>" % progname)
+    print("%s -c <core> -r <num> -t <num> [--profile=<folder>]" % progname)
     print("\t-c <core>          \tCore to use for the queries")
     print("\t-u <url>           \turl to the Solr server")
     print("\t-r <num>           \tnumber of repetition, per query")
     print("\t-t <num>           \tnumber of threads, per query")
+    print("\t--profile=<folder> \tprofile the client, per query, and write "
+          "the results in <folder>")
     print("")
     print("NOTE: the total number of run per query is defined by -r <R>, which means with\n"
           "      -t <T> threads, each thread will execute R/T times each query.")
@@ -27,6 +31,7 @@ def usage(progname, retval=0):
 core = ''
 solr = None
 url = ''
+profile_dir = ''
 
 # Tasks lists
 warm_ups = []
@@ -42,13 +47,21 @@ def enqueue(label, count, query, *args):
         tasks.append((label, query, args))
 
 
-def wrapper(args):
+def wrapper(args, profile=False):
+    profiler = None
+    if profile:
+        profiler = profiling.Profiler()
+
     rs = []
     for arg in args:
         l, f, a = arg
-        r, t = bench.timed(lambda: f(*a))
+        with profiling.profile(profiler, l):
+            r, t = bench.timed(lambda: f(*a))
         rs.append((l, t))
-    return rs
+
+    if profiler is not None:
+        return rs, profiler.state()
+    return rs, None
 
 
 def run_threads(threads):
@@ -75,17 +88,20 @@ def run_threads(threads):
 
     # Run the benchmarks, in parallel:
     pool = Pool(processes=threads)
-    ar = pool.map_async(wrapper, cookies)
+    ar = pool.map_async(partial(wrapper, profile=profile_dir != ''), cookies)
     pool.close()
     pool.join()
 
     # Flatten the list
     rs = []
-    for r in ar.get():
+    states = []
+    for r, state in ar.get():
         if r is not None:
             rs = rs + r
+        if state is not None:
+            states.append(state)
 
-    return [(l, [""], t) for l, t in rs]
+    return [(l, [""], t) for l, t in rs], states
 
 
 def run_queries(threads, repetitions):
@@ -120,7 +136,7 @@ def run_queries(threads, repetitions):
 
     random.shuffle(tasks)
 
-    rs = run_threads(threads)
+    rs, states = run_threads(threads)
 
     #########################################################################
     # Output the selected statistics
@@ -136,15 +152,19 @@ def run_queries(threads, repetitions):
               (k, repetitions,
                ",".join(["%.16f" % t for lp, _, t in rs if lp == k])))
 
+    if profile_dir != '':
+        stacks, peaks = profiling.merge(states)
+        profiling.print_summary(profiling.write(profile_dir, stacks, peaks))
+
 
 def main(argv):
-    global core, url, solr
+    global core, url, solr, profile_dir
     progname = argv[0]
     repetitions = 0
     threads = 0
 
     try:
-        opts, args = getopt.getopt(argv[1:], 'c:r:t:u:')
+        opts, args = getopt.getopt(argv[1:], 'c:r:t:u:', ['profile='])
     except getopt.GetoptError:
         usage(progname, 1)
 
@@ -157,6 +177,8 @@ def main(argv):
             threads = int(arg)
         elif opt == '-u':
             url = arg
+        elif opt == '--profile':
+            profile_dir = arg
         elif opt == '-h':
             usage(progname)
         else:
@@ -3,21 +3,29 @@
 import getopt
 import sys
 
-from multiprocessing import Pool
-
 from util.solr import Solr
+from util.workers import WorkerPool
 import util.benchmarks as bench
+import util.profiling as profiling
+import util.workers as workers
 
 
 def usage(progname, retval=0):
-    print("%s -c <core> -r <num> -t <num>" % progname)
+    print("%s -c <core> -r <num> -t <num> [-d <seconds>] [--profile=<folder>]"
+          % progname)
     print("\t-c <core>          \tCore to use for the queries")
     print("\t-u <url>           \turl to the Solr server")
     print("\t-r <num>           \tnumber of repetition, per query")
     print("\t-t <num>           \tnumber of threads, per query")
+    print("\t-d <seconds>       \trun each query for a fixed wall-clock "
+          "window instead")
+    print("\t--profile=<folder> \tprofile the client, per query, and write "
+          "the results in <folder>")
     print("")
     print("NOTE: the total number of run per query is defined by -r <R>, which means with\n"
-          "      -t <T> threads, each thread will execute R/T times each query.")
+          "      -t <T> threads, each thread will execute R/T times each query.\n"
+          "      With -d, each thread runs each query as many times as possible\n"
+          "      during the window, -r is then ignored.")
     sys.exit(retval)
 
 
@@ -26,107 +34,110 @@ def usage(progname, retval=0):
 core = ''
 solr = None
 url = ''
+pool = None
+profile_dir = ''
 
 
-def wrapper(arg):
-    f, a = arg
-    r, t = bench.timed(lambda: f(*a))
-#    print("R {} T {}".format(r, t))
-    return t
-
-
-def repeat(count, threads, query, *args):
-    pool = Pool(processes=threads)
-    cookies = [(query, args) for _ in range(0, count, 1)]
-
-    query(*args)
-
-    ar = pool.map_async(wrapper, cookies)
+def repeat(label, count, duration, query, *args):
+    # The workers are started once, see run_queries(), they warm up and
+    # start at the same time for each query type.
+    return pool.run(label, query, args, duration=duration, count=count)
 
-    pool.close()
-    pool.join()
 
-    return [([""], t) for t in ar.get()]
+def run_queries(threads, repetitions, duration=None):
+    global pool
 
-
-def run_queries(threads, repetitions):
     # Generate Timing statistics
-    oids = bench.list_oids()
-    spaceids = bench.list_spaces()
-    a_point = bench.query_oid(oids[0])[0]
-
     qs = []
 
-    print("Stats per queries (%d samples/query, %s core):" %
-          (repetitions, core))
-
-    # 1. Query all points with a specific OID
-    qs.append(("Q1", repeat(repetitions, threads,
-                            bench.query_oid, oids[0])))
-
-    # 2. Query all points at a specific position in space
-    position = [a_point["geometry.coordinates_%d___pdouble" % x]
-                for x in range(0, 3)]
-    qs.append(("Q2", repeat(repetitions, threads,
-                            bench.query_geometry, position)))
-
-    # 3. Query all the points in a specific reference space
-    qs.append(("Q3", repeat(repetitions, threads,
-                            bench.query_space, spaceids[0])))
-
-    # 4. Query all points contained in a specific volume, defined by volume.
-    qs.append(("Q4", repeat(repetitions, threads,
-                            bench.query_mbb,
-                            [[0., 0., 0.], [0.1, 0.1, 0.1]])))
-    # 5. Query all points contained in a specific volume, defined by label,
-    #    a.k.a OID.
-    if len(oids) < 5:
-        qs.append(("Q5", repeat(repetitions, threads,
-                                bench.query_labels, oids[:])))
+    if duration is None:
+        print("Stats per queries (%d samples/query, %s core):" %
+              (repetitions, core))
     else:
-        qs.append(("Q5", repeat(repetitions, threads,
-                                bench.query_labels, oids[2:5])))
+        print("Stats per queries (%f seconds/query, %s core):" %
+              (duration, core))
+
+    pool = WorkerPool(url, core, threads, profile=profile_dir != '')
+    try:
+        for label, query, args in bench.workload():
+            qs.append((label, repeat(label, repetitions, duration,
+                                     query, *args)))
+        if profile_dir != '':
+            stacks, peaks = pool.profiles()
+    finally:
+        pool.close()
 
     #########################################################################
     # Output the selected statistics
     print("Query,counts,timing")
     for q in qs:
+        timings = bench.flatten([w['timings'] for w in q[1]])
         print("%s,%d,%s" %
-              (q[0], repetitions,
-               ",".join(["%.16f" % v for v in [t for r, t in q[1]]])))
+              (q[0], len(timings),
+               ",".join(["%.16f" % t for t in timings])))
+
+    # Per-worker statistics, to tell client-side bottlenecks apart from the
+    # server limits: a low fairness or a CPU usage close to 1 points to the
+    # client.
+    print("")
+    print("Worker,query,worker,queries,throughput,cpu")
+    for q in qs:
+        for w in q[1]:
+            print("W,%s,%d,%d,%f,%f" %
+                  (q[0], w['worker'], len(w['timings']), w['throughput'],
+                   w['cpu'] / w['elapsed'] if w['elapsed'] > 0 else 0.0))
+    print("Fairness,query,total throughput,fairness")
+    for q in qs:
+        throughputs = [w['throughput'] for w in q[1]]
+        print("F,%s,%f,%f" %
+              (q[0], sum(throughputs), workers.fairness(throughputs)))
+
+    if profile_dir != '':
+        profiling.print_summary(profiling.write(profile_dir, stacks, peaks))
 
 
 def test_query(threads, repetitions):
     # TESTS TO CHECK QUERY RESULTS
+    global pool
+
     print("START")
     oids = bench.list_oids()
     # spaceids = bench.list_spaces()
 
-    qr = repeat(repetitions, threads, bench.query_oid, oids[0])
+    pool = WorkerPool(url, core, threads)
+    try:
+        qr = repeat("Q1", repetitions, None, bench.query_oid, oids[0])
+    finally:
+        pool.close()
     print(qr)
     print("END")
 
 
 def main(argv):
-    global core, url, solr
+    global core, url, solr, profile_dir
     progname = argv[0]
     repetitions = 0
     threads = 0
+    duration = None
 
     try:
-        opts, args = getopt.getopt(argv[1:], 'c:r:t:u:')
+        opts, args = getopt.getopt(argv[1:], 'c:d:r:t:u:', ['profile='])
     except getopt.GetoptError:
         usage(progname, 1)
 
     for opt, arg in opts:
         if opt == '-c':
             core = arg
+        elif opt == '-d':
+            duration = float(arg)
         elif opt == '-r':
             repetitions = int(arg)
         elif opt == '-t':
             threads = int(arg)
         elif opt == '-u':
             url = arg
+        elif opt == '--profile':
+            profile_dir = arg
         elif opt == '-h':
             usage(progname)
         else:
@@ -136,14 +147,14 @@ def main(argv):
         usage(progname, 1)
 
     assert (threads > 0)
-    assert (repetitions > 0)
+    assert (repetitions > 0 or duration is not None)
     assert (core != '')
     assert (url != '')
 
     solr = Solr(url)
     bench.init(solr, core)
 
-    run_queries(threads, repetitions)
+    run_queries(threads, repetitions, duration)
     # test_query(threads, repetitions)
 
 
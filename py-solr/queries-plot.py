@@ -11,9 +11,12 @@ import util.plot as plot
 
 
 def usage(progname, retval=0):
-    print("%s [-h] [-vV] [-o graph.pdf] <input files>" % progname)
+    print("%s [-h] [-vV] [-o graph.pdf] [-x min,max] [-y min,max] "
+          "<input files>" % progname)
     print("\t-o graph.pdf  \tSpecify the PDF filename, by default 'graph.pdf'.")
     print("\t-v            \tEnable print of the statistics gathered.")
+    print("\t-x min,max    \tLimits of the X axis, automatic by default.")
+    print("\t-y min,max    \tLimits of the Y axis, automatic by default.")
     print("\t-h            \tThis help message.")
     sys.exit(retval)
 
@@ -22,9 +25,11 @@ def main(argv):
     progname = argv[0]
     plot_file = ""
     verbose = False
+    xlim = None
+    ylim = None
 
     try:
-        opts, args = getopt.getopt(argv[1:], 'o:hvV')
+        opts, args = getopt.getopt(argv[1:], 'o:hvVx:y:')
     except getopt.GetoptError:
         usage(progname, 1)
 
@@ -33,6 +38,10 @@ def main(argv):
             plot_file = arg
         elif opt == '-v':
             verbose = True
+        elif opt == '-x':
+            xlim = [float(v) for v in arg.split(',')]
+        elif opt == '-y':
+            ylim = [float(v) for v in arg.split(',')]
         elif opt == '-h':
             usage(progname)
         else:
@@ -41,32 +50,32 @@ def main(argv):
     if len(args) < 1:
         usage(progname, 1)
 
-    converter = (str, int,
-                 float, float, float, float, float,
-                 float, float, float, float, float,
-                 float, float, float, float, float,
-                 float, float, float, float, float)
-
     labels = {
         "Q1": "id", "Q2": "coord", "Q4": "mbb", "Q3": "space id", "Q5": "labels"
     }
-    x = {
-        "Q1": [], "Q2": [], "Q3": [], "Q4": [], "Q5": []
-    }
-    y = {
-        "Q1": [], "Q2": [], "Q3": [], "Q4": [], "Q5": []
-    }
-    lo = {
-        "Q1": [], "Q2": [], "Q3": [], "Q4": [], "Q5": []
-    }
-    up = {
-        "Q1": [], "Q2": [], "Q3": [], "Q4": [], "Q5": []
-    }
+    x = {}
+    y = {}
+    lo = {}
+    up = {}
 
     results = []
     skipped = []
 
-    # Load the data form the files
+    # Load the data form the files, the number of timings per query is taken
+    # from the first record found.
+    converter = None
+    for f in args:
+        with open(f, 'r') as fd:
+            timings = data.parse_timings(fd)
+        if timings:
+            converter = (str, int) + \
+                tuple([float] * len(list(timings.values())[0]))
+            break
+
+    if converter is None:
+        print("No timings found.")
+        sys.exit(1)
+
     data.load_csv(args, converter, results, skipped)
 
     # Compute statistics per data series
@@ -87,10 +96,10 @@ def main(argv):
             t_median = stat.median(values)
             # t_stddev = stat.stddev(values)
 
-            x[query_name].append(dataset_size)
-            y[query_name].append(t_mean)
-            lo[query_name].append(-(t_min-t_median))
-            up[query_name].append(t_max-t_median)
+            x.setdefault(query_name, []).append(dataset_size)
+            y.setdefault(query_name, []).append(t_mean)
+            lo.setdefault(query_name, []).append(-(t_min-t_median))
+            up.setdefault(query_name, []).append(t_max-t_median)
 
             if verbose:
                 print("  Query %s : repeats %s" % (query[0], query[1]))
@@ -99,8 +108,11 @@ def main(argv):
                 print("    %f [%f;%f]" % (t_median, t_min, t_max))
 
     # Plot for PowerPoint
-    plot.plot_presentation(x, y, lo, up, labels,
-                           ["Q1", "Q2", "Q3", "Q4", "Q5"], "upper left",
+    queries = sorted(x.keys())
+    for q in queries:
+        labels.setdefault(q, q)
+
+    plot.plot_presentation(x, y, lo, up, labels, queries, "upper left",
                            xscale='log', yscale='log', show_grid=False,
                            figsize=(14, 7), dpi=200,
                            concept_graph=False
@@ -110,8 +122,10 @@ def main(argv):
     plt.xlabel("Dataset Size [# points]")
     plt.ylabel("Timing [seconds]")
 
-    plt.xlim(5E2, 1E7)
-    plt.ylim(3E-3, 1E3)
+    if xlim is not None:
+        plt.xlim(*xlim)
+    if ylim is not None:
+        plt.ylim(*ylim)
 
     # plt.hlines(1, 0, 1E9, linestyle="-", color="navy", label="1 sec")
     # plt.hlines(10, 0, 1E9, linestyle="-", color="navy", label="10 sec")
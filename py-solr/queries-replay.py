@@ -0,0 +1,95 @@
+#!/usr/bin/python
+
+import getopt
+import sys
+
+import util.querylog as querylog
+import util.replay as replay
+import util.stat as stat
+
+
+def usage(progname, retval=0):
+    print("%s -u <url> -f <query.log> [-c <core>] [-s <speed>] [-t <num>] "
+          "[-w]" % progname)
+    print("\t-u <url>           \turl to the Solr server")
+    print("\t-f <query.log>     \tquery log to replay")
+    print("\t-c <core>          \treplay against <core> instead of the "
+          "recorded cores")
+    print("\t-s <speed>         \ttime scaling factor, 1 by default, or "
+          "'max' to send as fast as possible")
+    print("\t-t <num>           \tmaximum number of requests in flight, 1 "
+          "by default")
+    print("\t-w                 \treplay the update requests as well")
+    print("")
+    print("NOTE: query logs are recorded by the Solr client when created with\n"
+          "      Solr(url, query_log='query.log').")
+    sys.exit(retval)
+
+
+def main(argv):
+    progname = argv[0]
+    url = ''
+    log_file = ''
+    core = None
+    speed = 1.0
+    threads = 1
+    writes = False
+
+    try:
+        opts, args = getopt.getopt(argv[1:], 'c:f:hs:t:u:w')
+    except getopt.GetoptError:
+        usage(progname, 1)
+
+    for opt, arg in opts:
+        if opt == '-c':
+            core = arg
+        elif opt == '-f':
+            log_file = arg
+        elif opt == '-s':
+            speed = None if arg == 'max' else float(arg)
+        elif opt == '-t':
+            threads = int(arg)
+        elif opt == '-u':
+            url = arg
+        elif opt == '-w':
+            writes = True
+        elif opt == '-h':
+            usage(progname)
+        else:
+            usage(progname, 1)
+
+    if len(opts) == 0:
+        usage(progname, 1)
+
+    assert (url != '')
+    assert (log_file != '')
+    assert (threads > 0)
+    assert (speed is None or speed > 0)
+
+    elapsed, rs = replay.replay(url, querylog.read(log_file), speed, threads,
+                                core, writes)
+
+    keys = list(set([k for k, _, _, _ in rs]))
+    keys.sort()
+
+    # Same format as the queries-*-bench.py scripts, so replays can be
+    # stored, compared and plotted the same way.
+    print("Stats per queries (replay of %s, speed %s, %d threads):" %
+          (log_file, 'max' if speed is None else speed, threads))
+    print("Query,counts,timing")
+    for k in keys:
+        timings = [t for kp, t, _, _ in rs if kp == k]
+        print("%s,%d,%s" %
+              (k, len(timings), ",".join(["%.16f" % t for t in timings])))
+
+    print("")
+    print("Summary,requests,errors,throughput,max lag,p95 lag")
+    lags = [lag for _, _, _, lag in rs]
+    if lags:
+        print("S,%d,%d,%f,%f,%f" %
+              (len(rs), len([s for _, _, s, _ in rs if s != 200]),
+               len(rs) / elapsed, max(lags), stat.percentile(lags, 95)))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,196 @@
+#!/usr/bin/python
+
+import getopt
+import sys
+import time
+
+from util.results import ResultStore
+import util.data as data
+import util.results as results
+
+
+def usage(progname, retval=0):
+    print("%s -d <results.db> <command> [options]" % progname)
+    print("\t-d <results.db>    \tResults database, created if needed")
+    print("")
+    print("Commands:")
+    print("  store -b <name> -c <core> [-u <url>] [-t <num>] [-r <num>] "
+          "<files>")
+    print("\t-b <name>          \tBenchmark name, i.e. serial")
+    print("\t-c <core>          \tCore used for the queries")
+    print("\t-u <url>           \turl to the Solr server, to collect the "
+          "index and Solr metadata")
+    print("\t-t <num>           \tnumber of threads used by the client")
+    print("\t-r <num>           \tnumber of repetition, per query")
+    print("  list [-b <name>] [-c <core>]")
+    print("  compare [-n <num>] [-a <level>] [-e <ratio>] <baseline id> "
+          "<candidate id>")
+    print("\t-n <num>           \tnumber of bootstrap iterations, 2000 by "
+          "default")
+    print("\t-a <level>         \tconfidence level, 0.95 by default")
+    print("\t-e <ratio>         \tminimum relative change to report, 0.05 "
+          "by default")
+    print("")
+    print("compare exits with 2 if a regression is detected.")
+    sys.exit(retval)
+
+
+def store(progname, db, argv):
+    benchmark = ''
+    core = ''
+    url = ''
+    settings = {}
+
+    try:
+        opts, args = getopt.getopt(argv, 'b:c:r:t:u:')
+    except getopt.GetoptError:
+        usage(progname, 1)
+
+    for opt, arg in opts:
+        if opt == '-b':
+            benchmark = arg
+        elif opt == '-c':
+            core = arg
+        elif opt == '-r':
+            settings['repetitions'] = int(arg)
+        elif opt == '-t':
+            settings['threads'] = int(arg)
+        elif opt == '-u':
+            url = arg
+
+    assert (benchmark != '')
+    assert (core != '')
+
+    if len(args) < 1:
+        usage(progname, 1)
+
+    if url != '':
+        from util.solr import Solr
+        metadata = results.run_metadata(Solr(url), core, **settings)
+    else:
+        metadata = settings
+
+    for f in args:
+        with open(f, 'r') as fd:
+            timings = data.parse_timings(fd)
+
+        if not timings:
+            print("%s: no timings found, skipping..." % f)
+            continue
+
+        metadata['file'] = f
+        run_id = db.add_run(benchmark, core, timings, metadata)
+        print("%s: stored as run %d" % (f, run_id))
+
+
+def list_runs(progname, db, argv):
+    benchmark = None
+    core = None
+
+    try:
+        opts, args = getopt.getopt(argv, 'b:c:')
+    except getopt.GetoptError:
+        usage(progname, 1)
+
+    for opt, arg in opts:
+        if opt == '-b':
+            benchmark = arg
+        elif opt == '-c':
+            core = arg
+
+    print("id,date,benchmark,core,dataset size,Solr version")
+    for r in db.runs(benchmark, core):
+        print("%d,%s,%s,%s,%s,%s" %
+              (r['id'],
+               time.strftime('%Y-%m-%d %H:%M:%S',
+                             time.localtime(r['created'])),
+               r['benchmark'], r['core'], r['dataset_size'],
+               r['solr_version']))
+
+
+def compare(progname, db, argv):
+    iterations = 2000
+    confidence = 0.95
+    threshold = 0.05
+
+    try:
+        opts, args = getopt.getopt(argv, 'a:e:n:')
+    except getopt.GetoptError:
+        usage(progname, 1)
+
+    for opt, arg in opts:
+        if opt == '-a':
+            confidence = float(arg)
+        elif opt == '-e':
+            threshold = float(arg)
+        elif opt == '-n':
+            iterations = int(arg)
+
+    if len(args) != 2:
+        usage(progname, 1)
+
+    b_meta, b_timings = db.run(int(args[0]))
+    c_meta, c_timings = db.run(int(args[1]))
+
+    for k in ['core', 'dataset_size', 'solr_version', 'threads']:
+        if b_meta.get(k) != c_meta.get(k):
+            print("Warning: %s differs, baseline %s, candidate %s" %
+                  (k, b_meta.get(k), c_meta.get(k)))
+
+    report = results.compare(b_timings, c_timings, iterations, confidence,
+                             threshold)
+
+    regressions = 0
+    print("Query,metric,baseline,candidate,diff low,diff high,regression")
+    for e in report:
+        for metric in ['latency', 'throughput']:
+            base, cand, low, high = e[metric]
+            flagged = e['%s_regression' % metric]
+            if flagged:
+                regressions += 1
+            print("%s,%s,%.6f,%.6f,%.6f,%.6f,%s" %
+                  (e['query'], metric, base, cand, low, high,
+                   'REGRESSION' if flagged else ''))
+
+    if regressions > 0:
+        sys.exit(2)
+
+
+def main(argv):
+    progname = argv[0]
+    db_file = ''
+
+    try:
+        opts, args = getopt.getopt(argv[1:], 'd:h')
+    except getopt.GetoptError:
+        usage(progname, 1)
+
+    for opt, arg in opts:
+        if opt == '-d':
+            db_file = arg
+        elif opt == '-h':
+            usage(progname)
+        else:
+            usage(progname, 1)
+
+    if db_file == '' or len(args) < 1:
+        usage(progname, 1)
+
+    commands = {
+        'store': store,
+        'list': list_runs,
+        'compare': compare
+    }
+
+    if args[0] not in commands:
+        usage(progname, 1)
+
+    db = ResultStore(db_file)
+    try:
+        commands[args[0]](progname, db, args[1:])
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv)
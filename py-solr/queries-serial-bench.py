@@ -5,24 +5,28 @@ import sys
 
 from util.solr import Solr
 import util.benchmarks as bench
+import util.profiling as profiling
 
 
 def usage(progname, retval=0):
-    print("%s -c <core> -r <num>" % progname)
+    print("%s -c <core> -r <num> [--profile=<folder>]" % progname)
     print("\t-c <core>          \tCore to use for the queries")
     print("\t-u <url>           \turl to the Solr server")
     print("\t-r <num>           \tnumber of repetition, per query")
+    print("\t--profile=<folder> \tprofile the client, per query, and write "
+          "the results in <folder>")
     sys.exit(retval)
 
 
-def repeat(count, query, *args):
+def repeat(label, count, query, *args):
     qr = []
 
     # Warm up query, not timed
     query(*args)
 
-    for i in range(0, count):
-        qr.append(bench.timed(lambda: query(*args)))
+    with profiling.profile(profiler, label):
+        for i in range(0, count):
+            qr.append(bench.timed(lambda: query(*args)))
 
     return qr
 
@@ -32,39 +36,18 @@ def repeat(count, query, *args):
 core = ''
 solr = None
 url = ''
+profiler = None
 
 
 def run_queries(repetitions):
     # Generate Timing statistics
-    oids = bench.list_oids()
-    spaceids = bench.list_spaces()
-    a_point = bench.query_oid(oids[0])[0]
-
     qs = []
 
     print("Stats per queries (%d samples/query, %s core):" %
           (repetitions, core))
 
-    # 1. Query all points with a specific OID
-    qs.append(("Q1", repeat(repetitions, bench.query_oid, oids[0])))
-
-    # 2. Query all points at a specific position in space
-    position = [a_point["geometry.coordinates_%d___pdouble" % x]
-                for x in range(0, 3)]
-    qs.append(("Q2", repeat(repetitions, bench.query_geometry, position)))
-
-    # 3. Query all the points in a specific reference space
-    qs.append(("Q3", repeat(repetitions, bench.query_space, spaceids[0])))
-
-    # 4. Query all points contained in a specific volume, defined by volume.
-    qs.append(("Q4", repeat(repetitions, bench.query_mbb,
-                                  [[0., 0., 0.], [0.1, 0.1, 0.1]])))
-    # 5. Query all points contained in a specific volume, defined by label,
-    #    a.k.a OID.
-    if len(oids) < 5:
-        qs.append(("Q5", repeat(repetitions, bench.query_labels, oids[:])))
-    else:
-        qs.append(("Q5", repeat(repetitions, bench.query_labels, oids[2:5])))
+    for label, query, args in bench.workload():
+        qs.append((label, repeat(label, repetitions, query, *args)))
 
     #########################################################################
     # Output the selected statistics
@@ -111,12 +94,13 @@ def test_query(x=0):
 
 
 def main(argv):
-    global core, url, solr
+    global core, url, solr, profiler
     progname = argv[0]
     repetitions = 0
+    profile_dir = ''
 
     try:
-        opts, args = getopt.getopt(argv[1:], 'c:r:u:')
+        opts, args = getopt.getopt(argv[1:], 'c:r:u:', ['profile='])
     except getopt.GetoptError:
         usage(progname, 1)
 
@@ -127,6 +111,8 @@ def main(argv):
             repetitions = int(arg)
         elif opt == '-u':
             url = arg
+        elif opt == '--profile':
+            profile_dir = arg
         elif opt == '-h':
             usage(progname)
         else:
@@ -142,9 +128,17 @@ def main(argv):
     solr = Solr(url)
     bench.init(solr, core)
 
+    if profile_dir != '':
+        profiler = profiling.Profiler()
+
     run_queries(repetitions)
     # test_query(3)
 
+    if profiler is not None:
+        stacks, peaks = profiling.merge([profiler.state()])
+        profiling.print_summary(
+            profiling.write(profile_dir, stacks, peaks, profiler.interval))
+
 
 if __name__ == "__main__":
     main(sys.argv)
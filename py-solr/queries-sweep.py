@@ -0,0 +1,208 @@
+#!/usr/bin/python
+
+import getopt
+import os
+import sys
+
+from util.solr import Solr
+import util.sweep as sweep
+
+
+def usage(progname, retval=0):
+    print("%s -u <url> -s <sizes> -t <threads> -r <num> [-d <folder>] "
+          "[-o <prefix>] [-R <results.db>] [-P <points>] [-n] [-l]"
+          % progname)
+    print("\t-u <url>           \turl to the Solr server")
+    print("\t-s <sizes>         \tcomma separated list of dataset sizes, in "
+          "thousands of points, i.e. 1,2,5,10")
+    print("\t-t <threads>       \tcomma separated list of concurrency "
+          "levels, i.e. 1,2,4,8")
+    print("\t-r <num>           \tnumber of repetition, per query and "
+          "concurrency level")
+    print("\t-d <folder>        \tdatasets folder, 'datasets' by default")
+    print("\t-o <prefix>        \tprefix of the PDF graphs, 'sweep' by "
+          "default")
+    print("\t-R <results.db>    \talso store every run in the results "
+          "database")
+    print("\t-P <points>        \tdataset size to extrapolate to, 1E9 by "
+          "default")
+    print("\t-n                 \tregenerate and reload the datasets, even "
+          "if they exist")
+    print("\t-l                 \tdo not generate nor load, use the existing "
+          "cores")
+    sys.exit(retval)
+
+
+def plot(prefix, sizes, threads, throughputs, latencies):
+    import matplotlib.pyplot as plt
+    import util.plot as plot
+
+    # Throughput as a function of the concurrency, one series per dataset
+    x = {}
+    y = {}
+    lo = {}
+    up = {}
+    labels = {}
+    for s in sizes:
+        k = sweep.core_name(s)
+        x[k] = threads
+        y[k] = [throughputs[(s, t)] for t in threads]
+        lo[k] = [0.0 for _ in threads]
+        up[k] = [0.0 for _ in threads]
+        labels[k] = '%d points' % (s * 1000)
+
+    keys = [sweep.core_name(s) for s in sizes]
+    plot.plot_presentation(x, y, lo, up, labels, keys, "upper left",
+                           xscale='log', figsize=(14, 7), dpi=200)
+    plt.xlabel("Concurrency [# clients]")
+    plt.ylabel("Throughput [queries / second]")
+    plt.savefig('%s-throughput.pdf' % prefix, facecolor='white',
+                edgecolor='none', bbox_inches='tight', dpi=200)
+    plt.close('all')
+
+    # Latency as a function of the dataset size, one graph per concurrency
+    # level, one series per query type, with a 5th-95th percentile band.
+    queries = sorted(set([q for _, _, q in latencies.keys()]))
+    for t in threads:
+        x = {}
+        y = {}
+        lo = {}
+        up = {}
+        for q in queries:
+            x[q] = [s * 1000 for s in sizes]
+            bands = [latencies[(s, t, q)] for s in sizes]
+            y[q] = [p50 for _, p50, _ in bands]
+            lo[q] = [p50 - p5 for p5, p50, _ in bands]
+            up[q] = [p95 - p50 for _, p50, p95 in bands]
+
+        plot.plot_presentation(x, y, lo, up, dict(zip(queries, queries)),
+                               queries, "upper left", xscale='log',
+                               yscale='log', error_area=True,
+                               figsize=(14, 7), dpi=200)
+        plt.xlabel("Dataset Size [# points]")
+        plt.ylabel("Timing [seconds]")
+        plt.savefig('%s-latency-t%d.pdf' % (prefix, t), facecolor='white',
+                    edgecolor='none', bbox_inches='tight', dpi=200)
+        plt.close('all')
+
+
+def main(argv):
+    progname = argv[0]
+    url = ''
+    folder = 'datasets'
+    prefix = 'sweep'
+    results_db = ''
+    sizes = []
+    threads = []
+    repetitions = 0
+    predict = 1E9
+    reuse = True
+    prepare = True
+
+    try:
+        opts, args = getopt.getopt(argv[1:], 'd:hlno:r:s:t:u:P:R:')
+    except getopt.GetoptError:
+        usage(progname, 1)
+
+    for opt, arg in opts:
+        if opt == '-d':
+            folder = arg
+        elif opt == '-l':
+            prepare = False
+        elif opt == '-n':
+            reuse = False
+        elif opt == '-o':
+            prefix = arg
+        elif opt == '-r':
+            repetitions = int(arg)
+        elif opt == '-s':
+            sizes = [int(v) for v in arg.split(',')]
+        elif opt == '-t':
+            threads = [int(v) for v in arg.split(',')]
+        elif opt == '-u':
+            url = arg
+        elif opt == '-P':
+            predict = float(arg)
+        elif opt == '-R':
+            results_db = arg
+        elif opt == '-h':
+            usage(progname)
+        else:
+            usage(progname, 1)
+
+    if len(opts) == 0:
+        usage(progname, 1)
+
+    assert (url != '')
+    assert (repetitions > 0)
+    assert (len(sizes) > 0)
+    assert (len(threads) > 0)
+
+    sizes.sort()
+    threads.sort()
+
+    solr = Solr(url)
+    project_bin = os.environ.get(
+        'PROJECT_BIN',
+        os.path.join(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))), 'bin'))
+
+    store = None
+    if results_db != '':
+        from util.results import ResultStore
+        import util.results as results
+        store = ResultStore(results_db)
+
+    throughputs = {}
+    latencies = {}
+
+    print("size,threads,query,count,throughput,p5,p50,p95")
+    for s in sizes:
+        core = sweep.core_name(s)
+        if prepare:
+            data_file = sweep.generate(folder, s, reuse=reuse)
+            sweep.load(solr, core, data_file, project_bin, reuse=reuse)
+
+        for t in threads:
+            qps, timings = sweep.run_workload(url, core, t, repetitions)
+            throughputs[(s, t)] = qps
+
+            for q in sorted(timings.keys()):
+                latencies[(s, t, q)] = sweep.summarize(timings[q])
+                print("%d,%d,%s,%d,%f,%.16f,%.16f,%.16f" %
+                      ((s * 1000, t, q, len(timings[q]), qps) +
+                       tuple(latencies[(s, t, q)])))
+
+            if store is not None:
+                metadata = results.run_metadata(solr, core, threads=t,
+                                                repetitions=repetitions,
+                                                throughput=qps)
+                store.add_run('sweep', core, timings, metadata)
+
+    if store is not None:
+        store.close()
+
+    #########################################################################
+    # Scaling exponents, and extrapolation
+    if len(sizes) > 1:
+        points = [s * 1000 for s in sizes]
+        print("")
+        print("Scaling fits, value = a * size^b, predicted at %d points:" %
+              predict)
+        print("threads,metric,a,b,predicted")
+        for t in threads:
+            a, b, p = sweep.fit_scaling(
+                points, [throughputs[(s, t)] for s in sizes], predict)
+            print("%d,throughput,%g,%f,%g" % (t, a, b, p))
+
+            for q in sorted(set([q for _, _, q in latencies.keys()])):
+                a, b, p = sweep.fit_scaling(
+                    points, [latencies[(s, t, q)][1] for s in sizes],
+                    predict)
+                print("%d,%s p50,%g,%f,%g" % (t, q, a, b, p))
+
+    plot(prefix, sizes, threads, throughputs, latencies)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -3,15 +3,32 @@
 import sys
 import getopt
 from util.solr import Solr
+import util.routing
 
 
 def usage(progname, retval=0):
-    print("%s -c <core> -u <url to solr> [-f <data_file.json> [-l]]" % progname)
+    print("%s -c <core> -u <url to solr> [-f <data_file.json> [-l]] [-s] "
+          "[--cloud [--shards=<num>] [--replicas=<num>] [--config=<name>] "
+          "[--route-cells=<num>] [--route-bits=<num>]]" % progname)
     print("\t-c <core>          \tcreate a new core, named <core>")
     print("\t-u <url>           \turl to the Solr server")
     print("\t-f <data_file.json>\tload data from <data_file.json> after "
           "registering the core")
     print("\t-l                 \tload data only")
+    print("\t-s                 \tmaintain the label summaries in the "
+          "companion core <core>_labels")
+    print("\t--cloud            \tSolrCloud mode, <core> is a collection, "
+          "whose documents are routed spatially, see util/routing.py")
+    print("\t--shards=<num>     \tnumber of shards (default 2)")
+    print("\t--replicas=<num>   \tnumber of replicas per shard (default 1)")
+    print("\t--config=<name>    \tconfig set of the collection (default "
+          "_default)")
+    print("\t--route-cells=<num>\tcells of the routing grid, per dimension "
+          "(default 4)")
+    print("\t--route-bits=<num> \tbits of the routing hash taken from the "
+          "reference space (default 4)")
+    print("\t                   \tthe routing settings are stored with the "
+          "collection, and reused by later loads (-l)")
     sys.exit(retval)
 
 
@@ -21,9 +38,19 @@ def main(argv):
     url = ''
     data_file = ''
     register = True
+    summaries = False
+    cloud = False
+    shards = 2
+    replicas = 1
+    config_set = '_default'
+    route_cells = None
+    route_bits = None
 
     try:
-        opts, args = getopt.getopt(argv[1:], 'c:f:hlu:')
+        opts, args = getopt.getopt(argv[1:], 'c:f:hlsu:',
+                                   ['cloud', 'shards=', 'replicas=',
+                                    'config=', 'route-cells=',
+                                    'route-bits='])
     except getopt.GetoptError:
         usage(progname, 1)
 
@@ -34,8 +61,22 @@ def main(argv):
             data_file = arg
         elif opt == '-l':
             register = False
+        elif opt == '-s':
+            summaries = True
         elif opt == '-u':
             url = arg
+        elif opt == '--cloud':
+            cloud = True
+        elif opt == '--shards':
+            shards = int(arg)
+        elif opt == '--replicas':
+            replicas = int(arg)
+        elif opt == '--config':
+            config_set = arg
+        elif opt == '--route-cells':
+            route_cells = int(arg)
+        elif opt == '--route-bits':
+            route_bits = int(arg)
         elif opt == '-h':
             usage(progname)
         else:
@@ -47,14 +88,36 @@ def main(argv):
     assert(core != '')
     assert(url != '')
 
-    solr = Solr(url)
+    solr = Solr(url, cloud_mode=cloud)
+
+    router = None
+    if cloud and register:
+        router = util.routing.SpatialRouter(
+            cells=route_cells if route_cells is not None else 4,
+            bits=route_bits if route_bits is not None else 4)
+    elif cloud:
+        # Later loads use the grid the collection was created with
+        router = util.routing.load_router(solr, core)
+        if router is None:
+            print('Collection "%s" is not routed spatially, skipping...' %
+                  core)
+            exit(1)
+        if (route_cells is not None and route_cells != router.cells) or \
+                (route_bits is not None and route_bits != router.bits):
+            print('Collection "%s" uses %d cells and %d bits, ignoring the '
+                  'routing options' % (core, router.cells, router.bits))
+    solr.router = router
 
     if register:
         # 1. Create collection with *default_* schema configs
         if [True for c in solr.cores() if c == core]:
             print('Core "%s" exists, skipping...' % core)
             exit(1)
-        solr.core_load(core)
+        if cloud:
+            solr.collection_create(core, shards, replicas, config_set,
+                                   router.field)
+        else:
+            solr.core_load(core)
 
         # 2. Define Types
         solr.create_kd_double_point_type(core, "Point3D", 3)
@@ -74,13 +137,37 @@ def main(argv):
         solr.field_add(core, 'properties.id', 'string', stored='true',
                        indexed='true', doc_values='true')
 
+        if cloud:
+            util.routing.save_settings(solr, core, router)
+
     if not [True for c in solr.cores() if c == core]:
         print('Core "%s" does not exist, skipping...' % core)
         exit(1)
 
+    if summaries:
+        # The summaries only use dynamic fields of the default schema
+        labels_core = solr.labels_core(core)
+        if not [True for c in solr.cores() if c == labels_core]:
+            if cloud:
+                solr.collection_create(labels_core, 1, replicas, config_set)
+            else:
+                solr.core_load(labels_core)
+
     # Load data, if a file was provided
     if data_file != '':
-        solr.index_spatial_json(data_file, core, True, True)
+        if cloud:
+            # The routing field is computed on the client side
+            util.routing.load(solr, core, data_file, router)
+        else:
+            solr.index_spatial_json(data_file, core, True, True)
+
+        if summaries:
+            import util.summaries
+            if register:
+                util.summaries.build(solr, core, data_file)
+            else:
+                # The core may already hold points of the loaded labels
+                util.summaries.update(solr, core, data_file)
 
 
 if __name__ == "__main__":
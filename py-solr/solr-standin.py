@@ -0,0 +1,64 @@
+#!/usr/bin/python
+
+import getopt
+import sys
+
+from util.standin import Settings, serve
+
+
+def usage(progname, retval=0):
+    print("%s -p <port> [-c <core>]... [-n <docs>] [-o <num>] [-l <ms>] "
+          "[-j <ms>]" % progname)
+    print("\t-p <port>          \tport to listen to, on localhost")
+    print("\t-c <core>          \tname of a core, can be repeated (default "
+          "standin)")
+    print("\t-n <docs>          \tnumber of documents per core (default "
+          "1000)")
+    print("\t-o <num>           \tnumber of distinct OIDs (default 10)")
+    print("\t-l <ms>            \tlatency added to every answer (default 0)")
+    print("\t-j <ms>            \tmaximum random jitter added to the latency "
+          "(default 0)")
+    sys.exit(retval)
+
+
+def main(argv):
+    progname = argv[0]
+    port = 0
+    cores = []
+    settings = Settings()
+
+    try:
+        opts, args = getopt.getopt(argv[1:], 'p:c:n:o:l:j:h')
+    except getopt.GetoptError:
+        usage(progname, 1)
+
+    for opt, arg in opts:
+        if opt == '-p':
+            port = int(arg)
+        elif opt == '-c':
+            cores.append(arg)
+        elif opt == '-n':
+            settings.num_found = int(arg)
+        elif opt == '-o':
+            settings.labels = int(arg)
+        elif opt == '-l':
+            settings.latency = float(arg) / 1000.0
+        elif opt == '-j':
+            settings.jitter = float(arg) / 1000.0
+        elif opt == '-h':
+            usage(progname)
+        else:
+            usage(progname, 1)
+
+    if port == 0:
+        usage(progname, 1)
+
+    if cores:
+        settings.cores = cores
+
+    print("Solr stand-in listening on http://127.0.0.1:%d/solr" % port)
+    serve(port, settings)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,83 @@
+#!/usr/bin/python
+
+import getopt
+import sys
+import time
+
+from util.solr import Solr
+from util.tiles import TilePyramid
+
+
+def usage(progname, retval=0):
+    print("%s -u <url> -c <core> -f <folder> [-s <space>]... [-l <num>] "
+          "[-k <num>]" % progname)
+    print("\t-u <url>           \turl to the Solr server")
+    print("\t-c <core>          \tCore to build the tile pyramids of")
+    print("\t-f <folder>        \tFolder where the pyramids are stored")
+    print("\t-s <space>         \tReference space, can be repeated (default:"
+          " all the spaces of <core>)")
+    print("\t-l <num>           \tNumber of levels (default: 8)")
+    print("\t-k <num>           \tMaximum number of sample points per tile "
+          "(default: 64)")
+    sys.exit(retval)
+
+
+def main(argv):
+    progname = argv[0]
+    url = ''
+    core = ''
+    folder = ''
+    spaces = []
+    levels = 8
+    sample = 64
+
+    try:
+        opts, args = getopt.getopt(argv[1:], 'u:c:f:s:l:k:h')
+    except getopt.GetoptError:
+        usage(progname, 1)
+
+    for opt, arg in opts:
+        if opt == '-u':
+            url = arg
+        elif opt == '-c':
+            core = arg
+        elif opt == '-f':
+            folder = arg
+        elif opt == '-s':
+            spaces.append(arg)
+        elif opt == '-l':
+            levels = int(arg)
+        elif opt == '-k':
+            sample = int(arg)
+        elif opt == '-h':
+            usage(progname)
+        else:
+            usage(progname, 1)
+
+    if len(opts) == 0:
+        usage(progname, 1)
+
+    assert (url != '')
+    assert (core != '')
+    assert (folder != '')
+    assert (levels > 0)
+
+    solr = Solr(url)
+    pyramid = TilePyramid(solr, folder, levels, sample)
+    if not spaces:
+        spaces = solr.list_field(core, 'geometry.referenceSpace')
+
+    for space in spaces:
+        start = time.time()
+        meta = pyramid.build(core, space)
+        print("%s: %d points, %d levels, built in %.3fs" %
+              (space, meta['count'], levels, time.time() - start))
+        if meta['count'] > 0:
+            for level in range(levels):
+                t = pyramid.tiles(core, space, level, max_tiles=8 ** level)
+                print("\tlevel %d: %d tiles, %d sample points" %
+                      (level, len(t), len(t.samples)))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,117 @@
+import json
+import math
+
+from util.export import bounds, estimate, histogram_density
+
+
+#############################################################################
+# Approximate analytics
+#
+# Every method returns a dictionary:
+#     value   the estimate, or the exact value
+#     lower   lower bound of the exact value
+#     upper   upper bound of the exact value
+#     exact   whether value was computed exactly, lower and upper are then
+#             equal to it. Estimates are never exact, even with equal bounds.
+
+# Precision of the HyperLogLog sketches of the hll() facet function of Solr,
+# the relative standard error being 1.04 / sqrt(2^HLL_LOG2M).
+HLL_LOG2M = 11
+HLL_SIGMAS = 3
+
+
+def _exact(value):
+    return {'value': value, 'lower': value, 'upper': value, 'exact': True}
+
+
+def _fallback(result, threshold, max_error):
+    """Whether the estimate can not be used: threshold is within the
+    bounds, or the bounds are wider than max_error times the value."""
+    if threshold is not None and \
+            result['lower'] <= threshold <= result['upper']:
+        return True
+    if max_error is not None and \
+            result['upper'] - result['lower'] > \
+            2 * max_error * max(result['value'], 1):
+        return True
+    return False
+
+
+class Approximate:
+    """Approximate counts for dashboards, answered in milliseconds instead
+    of running the exact queries:
+
+        * query_cardinality() estimates the number of points within a box
+          from the density histogram of the Catalog, without any request
+          once the statistics are known. The bounds always hold for the
+          index version of the statistics: the points of the cells within
+          the box, and of the cells it intersects, faces included.
+        * count_distinct() estimates the number of distinct values of a
+          field with the HyperLogLog sketches of Solr, hll(), which is
+          cheaper than an exact unique() on large results.
+
+    When a threshold is given, and the bounds contain it, or when the bounds
+    are wider than max_error times the estimate, the exact value is
+    computed instead, so decisions taken on the result are the same as with
+    the exact value.
+    """
+
+    def __init__(self, solr, catalog, max_error=None):
+        """
+            :param Solr solr:
+            :param Catalog catalog: statistics of the cores, its number of
+                                    bins sets the precision of the counts
+            :param float max_error: maximum relative half-width of the
+                                    bounds, None to always use the estimate
+        """
+        self.solr = solr
+        self.catalog = catalog
+        self.max_error = max_error
+
+    def query_cardinality(self, core, mbb=None, reference_space=None,
+                          threshold=None):
+        """Number of points of core, or of reference_space, within mbb."""
+        stats = self.catalog.stats(core, reference_space)
+        if stats['count'] == 0:
+            return _exact(0)
+        if mbb is None:
+            return _exact(stats['count'])
+
+        density = histogram_density(stats['histogram'])
+        lower, upper = bounds(density, mbb)
+        result = {'value': min(max(estimate(density, mbb), lower), upper),
+                  'lower': lower, 'upper': upper, 'exact': False}
+
+        if _fallback(result, threshold, self.max_error):
+            return _exact(self.solr.query_cardinality(
+                core, mbb=mbb, reference_space=reference_space))
+        return result
+
+    def count_distinct(self, core, field='properties.id', threshold=None,
+                       **filters):
+        """Number of distinct values of field among the matching documents.
+
+            :param filters: the ones of Solr.query()
+        """
+        facet = {'distinct': 'hll(%s)' % field}
+        rsp = self.solr.query(core, rows=0, indent='off',
+                              params=[('json.facet', json.dumps(facet))],
+                              **filters)
+        facets = rsp.get('facets', {})
+        value = facets.get('distinct', 0)
+        count = facets.get('count', 0)
+
+        # At most one distinct value per document
+        error = HLL_SIGMAS * 1.04 / math.sqrt(2 ** HLL_LOG2M)
+        result = {'value': value,
+                  'lower': max(int(math.floor(value * (1 - error))), 0),
+                  'upper': min(int(math.ceil(value * (1 + error))), count),
+                  'exact': False}
+
+        if _fallback(result, threshold, self.max_error):
+            facet = {'distinct': 'unique(%s)' % field}
+            rsp = self.solr.query(core, rows=0, indent='off',
+                                  params=[('json.facet', json.dumps(facet))],
+                                  **filters)
+            return _exact(rsp.get('facets', {}).get('distinct', 0))
+        return result
@@ -0,0 +1,321 @@
+import re
+import time
+
+import numpy as np
+
+from util.summaries import load_features
+
+
+#############################################################################
+# Query backends
+#
+# A backend answers query(), query_cardinality(), spatial_mbb() and
+# list_field() in place of the Solr server, for the cores it serves, with
+# responses shaped like the Solr ones. See Solr(url, backend=...).
+COORDINATES = ['geometry.coordinates_%d___pdouble' % d for d in [0, 1, 2]]
+
+
+class Backend:
+    """Interface of the query backends."""
+
+    def serves(self, core):
+        """Whether the backend answers the queries on core."""
+        raise NotImplementedError
+
+    def query(self, core, oid=None, labels=None, geometry=None, mbb=None,
+              reference_space=None, fl=None, q='*:*', params=None,
+              rows=10, start=0, indent='on', print_timing=False,
+              verbose=False):
+        raise NotImplementedError
+
+    def query_cardinality(self, core, oid=None, labels=None, geometry=None,
+                          mbb=None, reference_space=None, fl=None, q='*:*',
+                          params=None, print_timing=False, verbose=False):
+        return self.query(core, oid, labels, geometry, mbb, reference_space,
+                          fl, q, params, rows=0, start=0)['response'][
+            'numFound']
+
+    def spatial_mbb(self, core, query='*:*', params=None,
+                    print_timing=False, verbose=False):
+        raise NotImplementedError
+
+    def list_field(self, core, field):
+        raise NotImplementedError
+
+
+#############################################################################
+# In-process backend
+def _inverted_index(values):
+    """Returns (names, {name: sorted array of row indices})."""
+    names, inverse = np.unique(np.array(values, dtype=object),
+                               return_inverse=True)
+    order = np.argsort(inverse, kind='stable')
+    bounds = np.searchsorted(inverse[order], np.arange(len(names) + 1))
+    return names, dict([(names[i], order[bounds[i]:bounds[i + 1]])
+                        for i in range(len(names))])
+
+
+class PackedKDTree:
+    """Static KD-tree over a (N, 3) array of points.
+
+    The points are reordered so that every node covers a contiguous range
+    of rows, the nodes are stored in flat arrays: bounding box, range of
+    rows and children. A range query collects the whole range of the nodes
+    inside the box, and filters the leaves crossing it with a vectorized
+    test.
+    """
+
+    def __init__(self, coordinates, leaf_size=64):
+        self.leaf_size = leaf_size
+        n = coordinates.shape[0]
+        self.order = np.arange(n)
+
+        lo, hi, start, end, left, right = [], [], [], [], [], []
+
+        def build(s, e):
+            i = len(start)
+            block = self.points[s:e]
+            lo.append(block.min(axis=0) if e > s else np.zeros(3))
+            hi.append(block.max(axis=0) if e > s else np.zeros(3))
+            start.append(s)
+            end.append(e)
+            left.append(-1)
+            right.append(-1)
+
+            if e - s > leaf_size:
+                # Split at the median of the largest dimension
+                d = int(np.argmax(hi[i] - lo[i]))
+                m = (e - s) // 2
+                part = np.argpartition(block[:, d], m)
+                self.points[s:e] = block[part]
+                self.order[s:e] = self.order[s:e][part]
+                left[i] = build(s, s + m)
+                right[i] = build(s + m, e)
+            return i
+
+        self.points = np.array(coordinates, dtype=np.float64)
+        if n > 0:
+            build(0, n)
+
+        self.lo = np.array(lo).reshape((-1, 3))
+        self.hi = np.array(hi).reshape((-1, 3))
+        self.start = np.array(start, dtype=np.int64)
+        self.end = np.array(end, dtype=np.int64)
+        self.left = np.array(left, dtype=np.int64)
+        self.right = np.array(right, dtype=np.int64)
+
+    def query_box(self, mbb):
+        """Rows, in the original order, of the points within mbb, bounds
+        included."""
+        q_lo = np.asarray(mbb[0], dtype=np.float64)
+        q_hi = np.asarray(mbb[1], dtype=np.float64)
+
+        found = []
+        stack = [0] if len(self.start) > 0 else []
+        while stack:
+            i = stack.pop()
+            if np.any(self.lo[i] > q_hi) or np.any(self.hi[i] < q_lo):
+                continue
+
+            s, e = self.start[i], self.end[i]
+            if np.all(self.lo[i] >= q_lo) and np.all(self.hi[i] <= q_hi):
+                found.append(self.order[s:e])
+            elif self.left[i] < 0:
+                block = self.points[s:e]
+                mask = np.all((block >= q_lo) & (block <= q_hi), axis=1)
+                found.append(self.order[s:e][mask])
+            else:
+                stack.append(self.left[i])
+                stack.append(self.right[i])
+
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(found))
+
+
+class _Index:
+    def __init__(self, labels, spaces, coordinates, leaf_size):
+        self.labels = np.array(labels, dtype=object)
+        self.spaces = np.array(spaces, dtype=object)
+        self.coordinates = np.asarray(coordinates, dtype=np.float64)
+        self.tree = PackedKDTree(self.coordinates, leaf_size)
+
+        self.label_names, self.by_label = _inverted_index(labels)
+        self.space_names, self.by_space = _inverted_index(spaces)
+
+        self.label_mbb = {}
+        for l, rows in self.by_label.items():
+            c = self.coordinates[rows]
+            self.label_mbb[l] = [c.min(axis=0).tolist(),
+                                 c.max(axis=0).tolist()]
+
+
+class MemoryBackend(Backend):
+    """In-process backend, holding the points of each core in memory.
+
+    Filters are answered from a packed KD-tree over the coordinates and
+    inverted indexes of the labels and reference spaces. Only the queries
+    the client builds are understood: q can be '*:*' or an OR of
+    properties.id:<label> or geometry.referenceSpace:<space> terms. Amongst
+    the extra params, only the fq, rows and start ones are taken into
+    account, the others are ignored.
+    """
+
+    _term = re.compile(r'^\s*(properties\.id|geometry\.referenceSpace):'
+                       r'"?([^"\s]+)"?\s*$')
+
+    def __init__(self, leaf_size=64):
+        self.leaf_size = leaf_size
+        self.indexes = {}
+
+    def add(self, core, labels, spaces, coordinates):
+        """Replaces the content of core."""
+        self.indexes[core] = _Index(labels, spaces, coordinates,
+                                    self.leaf_size)
+
+    def load(self, core, data_file):
+        """Loads a GeoJSON-like file, as written by generate_rnd_uniform.py,
+        as the content of core."""
+        self.add(core, *load_features(data_file))
+
+    def serves(self, core):
+        return core in self.indexes
+
+    def _q_rows(self, index, q):
+        if q is None or q.strip() in ['', '*:*']:
+            return None
+
+        rows = []
+        for term in q.split(' OR '):
+            m = self._term.match(term)
+            if m is None:
+                raise ValueError('Unsupported query: %s' % q)
+            field, value = m.groups()
+            by = index.by_label if field == 'properties.id' \
+                else index.by_space
+            rows.append(by.get(value, np.empty(0, dtype=np.int64)))
+
+        return np.unique(np.concatenate(rows))
+
+    def _rows(self, index, oid, labels, geometry, mbb, reference_space, q,
+              params):
+        """Rows matching all the filters, in index order; None stands for
+        all of them."""
+        selected = self._q_rows(index, q)
+        for k, v in (params or []):
+            if k == 'fq':
+                selected = self._intersect(selected, self._q_rows(index, v))
+
+        empty = np.empty(0, dtype=np.int64)
+        if oid is not None:
+            selected = self._intersect(selected, index.by_label.get(oid, empty))
+        if reference_space is not None:
+            selected = self._intersect(
+                selected, index.by_space.get(reference_space, empty))
+
+        boxes = []
+        if geometry is not None:
+            boxes.append([[geometry[d] for d in [0, 1, 2]]] * 2)
+        if mbb is not None:
+            boxes.append(mbb)
+        for box in boxes:
+            selected = self._intersect(selected, self._box(index, selected,
+                                                           box))
+
+        if labels is not None:
+            # Union of the MBBs of the labels, as Solr.query() does
+            union = [self._box(index, selected, index.label_mbb[l])
+                     for l in labels if l in index.label_mbb]
+            union = np.unique(np.concatenate(union)) if union else empty
+            selected = self._intersect(selected, union)
+
+        return selected
+
+    @staticmethod
+    def _intersect(a, b):
+        if a is None:
+            return b
+        if b is None:
+            return a
+        return np.intersect1d(a, b, assume_unique=True)
+
+    @staticmethod
+    def _box(index, selected, box):
+        # Filter small candidate sets directly, use the tree otherwise
+        if selected is not None and len(selected) < index.tree.leaf_size * 8:
+            c = index.coordinates[selected]
+            lo = np.asarray(box[0], dtype=np.float64)
+            hi = np.asarray(box[1], dtype=np.float64)
+            return selected[np.all((c >= lo) & (c <= hi), axis=1)]
+        return index.tree.query_box(box)
+
+    @staticmethod
+    def _doc(index, row, fields):
+        c = index.coordinates[row]
+        doc = {
+            'id': str(row),
+            'properties.id': index.labels[row],
+            'geometry.referenceSpace': index.spaces[row],
+            'geometry.coordinates': '%r,%r,%r' % tuple(c.tolist())
+        }
+        for d in [0, 1, 2]:
+            doc[COORDINATES[d]] = float(c[d])
+        if fields is not None:
+            doc = dict([(f, doc[f]) for f in fields if f in doc])
+        return doc
+
+    def query(self, core, oid=None, labels=None, geometry=None, mbb=None,
+              reference_space=None, fl=None, q='*:*', params=None,
+              rows=10, start=0, indent='on', print_timing=False,
+              verbose=False):
+        t = time.time()
+        index = self.indexes[core]
+
+        for k, v in (params or []):
+            if k == 'rows':
+                rows = int(v)
+            elif k == 'start':
+                start = int(v)
+
+        selected = self._rows(index, oid, labels, geometry, mbb,
+                              reference_space, q, params)
+        count = len(index.labels) if selected is None else len(selected)
+        page = range(start, min(start + int(rows), count))
+        if selected is not None:
+            page = selected[start:start + int(rows)]
+
+        fields = None
+        if fl is not None and fl.strip() not in ['', '*']:
+            fields = [f.strip() for f in fl.split(',')]
+
+        elapsed = time.time() - t
+        if print_timing:
+            print('Backend query: %f ms' % (elapsed * 1000))
+
+        return {
+            'responseHeader': {'status': 0, 'QTime': int(elapsed * 1000)},
+            'response': {
+                'numFound': count,
+                'start': start,
+                'docs': [self._doc(index, int(r), fields) for r in page]
+            }
+        }
+
+    def spatial_mbb(self, core, query='*:*', params=None,
+                    print_timing=False, verbose=False):
+        index = self.indexes[core]
+        selected = self._rows(index, None, None, None, None, None, query,
+                              params)
+        c = index.coordinates if selected is None \
+            else index.coordinates[selected]
+        if len(c) == 0:
+            return [[None] * 3, [None] * 3]
+        return [c.min(axis=0).tolist(), c.max(axis=0).tolist()]
+
+    def list_field(self, core, field):
+        index = self.indexes[core]
+        if field == 'properties.id':
+            return list(index.label_names)
+        if field == 'geometry.referenceSpace':
+            return list(index.space_names)
+        raise ValueError('Unsupported field: %s' % field)
@@ -0,0 +1,256 @@
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+
+
+#############################################################################
+# Load balancing over replicas
+def _failed(result):
+    """Whether the replica answered with an error of its own, server error
+    or overloaded, rather than an error of the request."""
+    status = getattr(result, 'status_code', None)
+    return status is not None and \
+        (status >= 500 or status == requests.codes.too_many_requests)
+
+
+class Replica:
+    def __init__(self, url):
+        self.url = url
+        self.ewma = 0.0         # Smoothed latency, in seconds
+        self.outstanding = 0    # Requests waiting for a response
+        self.healthy = True
+        self.requests = 0
+        self.errors = 0
+
+
+class Balancer:
+    """Spreads read requests over several replicas of the same data.
+
+    Each request goes to the healthy replica with the lowest expected
+    latency: with policy='ewma' the exponentially weighted moving average
+    of its latency, scaled by its number of outstanding requests plus one;
+    with policy='least_outstanding' the replica with the fewest outstanding
+    requests, ties broken by the moving average.
+
+    Replicas failing to connect, or answering with a server error (5xx) or
+    as overloaded (429), are marked unhealthy, and a background thread
+    checks every health_interval seconds whether they are back. These
+    answers count as failures: they do not update the latency average, and
+    the request is sent to another replica.
+
+    With hedge=True, when a request did not get an answer after the
+    hedge_percentile of the recent latencies, the same request is sent to
+    a second replica, and the first answer is kept. A request which fails
+    is sent once more to another replica.
+    """
+
+    def __init__(self, urls, policy='ewma', decay=0.3, health_interval=5.0,
+                 health_timeout=2.0, hedge=False, hedge_percentile=95,
+                 hedge_min_samples=20, window=1000, workers=32,
+                 registry=None):
+        assert (len(urls) > 0)
+        assert (policy in ['ewma', 'least_outstanding'])
+
+        self.replicas = [Replica(u) for u in urls]
+        self.policy = policy
+        self.decay = decay
+        self.health_timeout = health_timeout
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=window)
+        self.fired = 0
+        self.won = 0
+
+        self.executor = None
+        if hedge:
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+
+        self.metrics = None
+        if registry is not None:
+            self.metrics = (
+                registry.counter('solr_client_hedges_fired',
+                                 'Hedged requests sent'),
+                registry.counter('solr_client_hedges_won',
+                                 'Hedged requests answered first'),
+                registry.gauge('solr_client_replica_healthy',
+                               'Whether the replica is healthy',
+                               ('replica',)),
+                registry.gauge('solr_client_replica_outstanding',
+                               'Requests waiting for a response',
+                               ('replica',)))
+            for r in self.replicas:
+                self.metrics[2].set((r.url,), 1)
+
+        self.stopped = threading.Event()
+        self.checker = None
+        if health_interval > 0:
+            self.checker = threading.Thread(
+                target=self._check_health, args=(health_interval,),
+                daemon=True)
+            self.checker.start()
+
+    @property
+    def primary(self):
+        """The first replica, which receives the requests not balanced."""
+        return self.replicas[0].url
+
+    def _score(self, r):
+        if self.policy == 'ewma':
+            return (r.ewma * (r.outstanding + 1), r.outstanding)
+        return (r.outstanding, r.ewma)
+
+    def pick(self, exclude=()):
+        """Returns the replica to send the next request to, None when all
+        of them are excluded."""
+        with self.lock:
+            candidates = [r for r in self.replicas if r not in exclude]
+            healthy = [r for r in candidates if r.healthy]
+            if healthy:
+                candidates = healthy
+            if not candidates:
+                return None
+            return min(candidates, key=self._score)
+
+    def _set_healthy(self, r, healthy):
+        r.healthy = healthy
+        if self.metrics is not None:
+            self.metrics[2].set((r.url,), 1 if healthy else 0)
+
+    def _run(self, r, fn):
+        with self.lock:
+            r.outstanding += 1
+            r.requests += 1
+        if self.metrics is not None:
+            self.metrics[3].inc((r.url,))
+
+        start = time.time()
+        try:
+            result = fn(r.url)
+            if _failed(result):
+                # Fast error responses must not lower the latency average
+                raise requests.HTTPError('%s: %d' % (r.url,
+                                                     result.status_code),
+                                         response=result)
+        except requests.RequestException as e:
+            with self.lock:
+                r.errors += 1
+                if isinstance(e, (requests.ConnectionError,
+                                  requests.HTTPError)):
+                    self._set_healthy(r, False)
+            raise
+        finally:
+            latency = time.time() - start
+            with self.lock:
+                r.outstanding -= 1
+            if self.metrics is not None:
+                self.metrics[3].dec((r.url,))
+
+        with self.lock:
+            if r.requests == 1:
+                r.ewma = latency
+            else:
+                r.ewma = self.decay * latency + (1 - self.decay) * r.ewma
+            self.latencies.append(latency)
+
+        return result
+
+    def hedge_delay(self):
+        """Time after which a request is hedged, None while too few
+        latencies are known."""
+        with self.lock:
+            if len(self.latencies) < self.hedge_min_samples:
+                return None
+            s = sorted(self.latencies)
+        return s[min(int(len(s) * self.hedge_percentile / 100.0),
+                     len(s) - 1)]
+
+    def call(self, fn, on_retry=None):
+        """Runs fn(url) on a replica, and returns its result.
+
+        on_retry() is called each time the request is sent again, hedged or
+        after a failure.
+        """
+        r = self.pick()
+        delay = self.hedge_delay() if self.hedge else None
+
+        if delay is None or len(self.replicas) == 1:
+            try:
+                return self._run(r, fn)
+            except requests.RequestException:
+                other = self.pick(exclude=[r])
+                if other is None:
+                    raise
+                if on_retry is not None:
+                    on_retry()
+                return self._run(other, fn)
+
+        first = self.executor.submit(self._run, r, fn)
+        done, _ = wait([first], timeout=delay)
+        if done and first.exception() is None:
+            return first.result()
+
+        other = self.pick(exclude=[r])
+        if other is None:
+            return first.result()
+
+        hedged = not done
+        if hedged:
+            with self.lock:
+                self.fired += 1
+            if self.metrics is not None:
+                self.metrics[0].inc()
+        if on_retry is not None:
+            on_retry()
+
+        second = self.executor.submit(self._run, other, fn)
+        pending = [first, second]
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                pending.remove(f)
+                if f.exception() is None:
+                    if hedged and f is second:
+                        with self.lock:
+                            self.won += 1
+                        if self.metrics is not None:
+                            self.metrics[1].inc()
+                    return f.result()
+
+        # Both failed
+        return first.result()
+
+    def _check_health(self, interval):
+        params = {'action': 'STATUS', 'indexInfo': 'false', 'wt': 'json'}
+        while not self.stopped.wait(interval):
+            for r in self.replicas:
+                try:
+                    ok = requests.get('%s/admin/cores' % r.url, params,
+                                      timeout=self.health_timeout)\
+                        .status_code == requests.codes.ok
+                except requests.RequestException:
+                    ok = False
+                with self.lock:
+                    self._set_healthy(r, ok)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hedges_fired': self.fired,
+                'hedges_won': self.won,
+                'replicas': dict([(r.url, {
+                    'healthy': r.healthy, 'ewma': r.ewma,
+                    'outstanding': r.outstanding, 'requests': r.requests,
+                    'errors': r.errors}) for r in self.replicas])
+            }
+
+    def close(self):
+        self.stopped.set()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
@@ -97,3 +97,33 @@ def query_labels(labels):
                        rows=num_points)["response"]["docs"]
 
     return flatten(points)
+
+
+###########################################################################
+# Reference workload
+def workload():
+    """ Returns the reference workload, Q1 to Q5, as a list of
+        (label, query, args) tuples, using the current core.
+    """
+    oids = list_oids()
+    spaceids = list_spaces()
+    a_point = query_oid(oids[0])[0]
+
+    # 2. Query all points at a specific position in space
+    position = [a_point["geometry.coordinates_%d___pdouble" % x]
+                for x in range(0, 3)]
+
+    # 5. Query all points contained in a specific volume, defined by label,
+    #    a.k.a OID.
+    if len(oids) < 5:
+        labels = oids[:]
+    else:
+        labels = oids[2:5]
+
+    return [
+        ("Q1", query_oid, (oids[0],)),
+        ("Q2", query_geometry, (position,)),
+        ("Q3", query_space, (spaceids[0],)),
+        ("Q4", query_mbb, ([[0., 0., 0.], [0.1, 0.1, 0.1]],)),
+        ("Q5", query_labels, (labels,))
+    ]
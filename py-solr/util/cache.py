@@ -0,0 +1,204 @@
+import sys
+import threading
+import time
+
+from collections import OrderedDict
+
+
+def sizeof(value):
+    """Approximate memory size, in bytes, of a decoded JSON value."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum([sizeof(k) + sizeof(v) for k, v in value.items()])
+    elif isinstance(value, list):
+        size += sum([sizeof(v) for v in value])
+    return size
+
+
+def copy(value):
+    """Deep copy of a decoded JSON value, faster than copy.deepcopy() as
+    only dictionaries and lists are copied, the other values being
+    immutable."""
+    if isinstance(value, dict):
+        return dict([(k, copy(v)) for k, v in value.items()])
+    if isinstance(value, list):
+        return [copy(v) for v in value]
+    return value
+
+
+#############################################################################
+# Query results cache
+class ResultCache:
+    """Client-side cache of decoded query results.
+
+    The cache is bounded by the memory size of the decoded results, see
+    sizeof(), and evicts the least recently used (policy='lru') or least
+    frequently used (policy='lfu') entries first, both in constant time.
+
+    Each entry is tagged with the index version of its core at the time it
+    was stored. A hit is only served when the core's current index version
+    matches, so a commit invalidates all the entries of the core. With the
+    default version_ttl=0, the index version is checked on every lookup,
+    and no stale result is ever served, at the cost of a small request per
+    hit.
+
+    A positive version_ttl is an opt-in to stale reads: the index version
+    is then fetched at most every version_ttl seconds, and after a commit
+    made by another client or process, stale results may be served for up
+    to version_ttl seconds. Commits made through Solr.commit() invalidate
+    the entries of the core at once in any case.
+
+    put() stores its own copy of the value, see copy(), so the caller keeps
+    its object. The results returned by get() must not be modified,
+    Solr.query() returns copies of them.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, policy='lru',
+                 version_ttl=0.0, registry=None):
+        assert (policy in ['lru', 'lfu'])
+
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.version_ttl = version_ttl
+
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()    # key -> [version, value, size, hits]
+        self.frequencies = {}           # hits -> OrderedDict of keys, LFU
+        self.least = 0                  # lowest hits of the entries, LFU
+        self.versions = {}              # core -> (version, fetched at)
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.metrics = None
+        if registry is not None:
+            self.metrics = (
+                registry.counter('solr_client_cache_hits', 'Cache hits'),
+                registry.counter('solr_client_cache_misses', 'Cache misses'),
+                registry.counter('solr_client_cache_evictions',
+                                 'Cache evictions'),
+                registry.gauge('solr_client_cache_bytes',
+                               'Size of the cached results'))
+
+    @staticmethod
+    def key(core, q, fq, fl, params, rows, start):
+        """Normalized key of a query, the order of the filters and of the
+        parameters does not matter."""
+        p = tuple(sorted([(k, str(v)) for k, v in (params or [])
+                          if k not in ['indent', 'wt']]))
+        return (core, q, tuple(sorted(fq or [])), fl, p, int(rows),
+                int(start))
+
+    def version(self, core, fetch):
+        """Returns the index version of core, calling fetch() when the known
+        version is older than version_ttl."""
+        now = time.time()
+        with self.lock:
+            v = self.versions.get(core)
+        if v is not None and now - v[1] < self.version_ttl:
+            return v[0]
+
+        version = fetch()
+        with self.lock:
+            self.versions[core] = (version, now)
+        return version
+
+    def get(self, key, version):
+        with self.lock:
+            e = self.entries.get(key)
+            if e is not None and e[0] != version:
+                self._remove(key)
+                e = None
+
+            if e is None:
+                self.misses += 1
+                if self.metrics is not None:
+                    self.metrics[1].inc()
+                return None
+
+            if self.policy == 'lru':
+                self.entries.move_to_end(key)
+            else:
+                self._link(key, e[3] + 1)
+                self._unlink(key, e[3])
+            e[3] += 1
+            self.hits += 1
+            if self.metrics is not None:
+                self.metrics[0].inc()
+            return e[1]
+
+    def put(self, key, version, value, size=None):
+        """Stores a copy of value, size being its memory size, computed when
+        None."""
+        if size is None:
+            size = sizeof(value)
+        if size > self.max_bytes:
+            return
+        value = copy(value)
+
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+
+            while self.bytes + size > self.max_bytes:
+                self._evict()
+
+            self.entries[key] = [version, value, size, 0]
+            if self.policy == 'lfu':
+                self._link(key, 0)
+                self.least = 0
+            self.bytes += size
+            if self.metrics is not None:
+                self.metrics[3].set(value=self.bytes)
+
+    def invalidate(self, core=None):
+        """Drops the entries of core, or all of them."""
+        with self.lock:
+            for key in [k for k in self.entries
+                        if core is None or k[0] == core]:
+                self._remove(key)
+            if core is None:
+                self.versions.clear()
+            else:
+                self.versions.pop(core, None)
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'entries': len(self.entries),
+                    'bytes': self.bytes}
+
+    def _link(self, key, hits):
+        self.frequencies.setdefault(hits, OrderedDict())[key] = None
+
+    def _unlink(self, key, hits):
+        keys = self.frequencies[hits]
+        del keys[key]
+        if not keys:
+            del self.frequencies[hits]
+            if hits == self.least:
+                # hits + 1 after a hit, otherwise searched amongst the
+                # distinct hit counts, not the entries
+                self.least = hits + 1 if hits + 1 in self.frequencies \
+                    else min(self.frequencies, default=0)
+
+    def _remove(self, key):
+        e = self.entries.pop(key)
+        if self.policy == 'lfu':
+            self._unlink(key, e[3])
+        self.bytes -= e[2]
+        if self.metrics is not None:
+            self.metrics[3].set(value=self.bytes)
+
+    def _evict(self):
+        if self.policy == 'lru':
+            key = next(iter(self.entries))
+        else:
+            # Least hits, the oldest first amongst equals
+            key = next(iter(self.frequencies[self.least]))
+        self._remove(key)
+        self.evictions += 1
+        if self.metrics is not None:
+            self.metrics[2].inc()
@@ -0,0 +1,191 @@
+import json
+import os
+import threading
+import time
+
+
+#############################################################################
+# Statistics catalog
+def _range_facet(d, mbb, bins, nested=None, mincount=0):
+    # The gap is slightly enlarged so the upper bound of the box falls in
+    # the last bucket, as range facet buckets are [start, start + gap).
+    lo = mbb[0][d]
+    hi = mbb[1][d]
+    gap = max(hi - lo, 1e-12) / bins * (1.0 + 1e-9)
+    facet = {
+        'type': 'range',
+        'field': 'geometry.coordinates_%d___pdouble' % d,
+        'start': lo,
+        'end': lo + gap * bins,
+        'gap': gap
+    }
+    if mincount > 0:
+        facet['mincount'] = mincount
+    if nested is not None:
+        facet['facet'] = nested
+    return facet
+
+
+def histogram_facet(mbb, bins, aggregations=None, mincount=0):
+    """JSON facet computing the number of points per cell of a regular grid
+    of bins^3 cells over mbb, and the given aggregations per cell.
+
+    With mincount, the buckets with fewer points are left out of the
+    response, which then can not be read by parse_histogram()."""
+    return {
+        'x': _range_facet(0, mbb, bins, {
+            'y': _range_facet(1, mbb, bins, {
+                'z': _range_facet(2, mbb, bins, aggregations, mincount)},
+                mincount)}, mincount)
+    }
+
+
+def parse_histogram(facets, bins):
+    """Flattens the nested range facets, the count of cell (i, j, k) is at
+    index (i * bins + j) * bins + k."""
+    counts = [0] * (bins ** 3)
+    for i, bx in enumerate(facets.get('x', {}).get('buckets', [])[:bins]):
+        for j, by in enumerate(bx.get('y', {}).get('buckets', [])[:bins]):
+            for k, bz in enumerate(by.get('z', {}).get('buckets', [])[:bins]):
+                counts[(i * bins + j) * bins + k] = bz['count']
+    return counts
+
+
+def cells(histogram):
+    """Iterates over the cells of a histogram, as (mbb, count)."""
+    bins = histogram['bins']
+    lo, hi = histogram['mbb']
+    size = [(hi[d] - lo[d]) / float(bins) for d in range(3)]
+    for i in range(bins):
+        for j in range(bins):
+            for k in range(bins):
+                c = [i, j, k]
+                yield ([[lo[d] + c[d] * size[d] for d in range(3)],
+                        [lo[d] + (c[d] + 1) * size[d] for d in range(3)]],
+                       histogram['counts'][(i * bins + j) * bins + k])
+
+
+class Catalog:
+    """Statistics of the points of a core, and of each reference space:
+    MBB, number of points, number of distinct OIDs and a coarse density
+    histogram over the MBB.
+
+    The statistics are computed once per index version, kept in memory and,
+    when a folder is given, persisted in a <core>.catalog.json sidecar file.
+    The index version is checked at most every version_ttl seconds, reads in
+    between are served from memory without contacting Solr.
+    """
+
+    def __init__(self, solr, folder=None, bins=8, version_ttl=10.0):
+        self.solr = solr
+        self.folder = folder
+        self.bins = bins
+        self.version_ttl = version_ttl
+
+        self.lock = threading.Lock()
+        self.entries = {}   # core -> entry
+        self.checked = {}   # core -> time of the last version check
+
+    def _sidecar(self, core):
+        return os.path.join(self.folder, '%s.catalog.json' % core)
+
+    def _compute_stats(self, core, space=None):
+        q = '*:*'
+        if space is not None:
+            q = 'geometry.referenceSpace:%s' % space
+
+        facet = {'oids': 'unique(properties.id)'}
+        count = self.solr.query_cardinality(core, q=q)
+        if count == 0:
+            return {'mbb': None, 'count': 0, 'oids': 0, 'histogram': None}
+
+        mbb = self.solr.spatial_mbb(core, q)
+        facet.update(histogram_facet(mbb, self.bins))
+        rsp = self.solr.query(core, q=q, rows=0, indent='off',
+                              params=[('json.facet', json.dumps(facet))])
+        facets = rsp.get('facets', {})
+
+        return {
+            'mbb': mbb,
+            'count': count,
+            'oids': facets.get('oids', 0),
+            'histogram': {
+                'bins': self.bins,
+                'mbb': mbb,
+                'counts': parse_histogram(facets, self.bins)
+            }
+        }
+
+    def compute(self, core, version=None):
+        """Computes the statistics of core, ignoring what is known."""
+        if version is None:
+            version = self.solr.index_version(core)
+
+        spaces = self.solr.list_field(core, 'geometry.referenceSpace')
+        entry = {
+            'version': version,
+            'computed': time.time(),
+            'universe': self._compute_stats(core),
+            'spaces': dict([(s, self._compute_stats(core, s))
+                            for s in spaces])
+        }
+
+        if self.folder is not None:
+            if not os.path.isdir(self.folder):
+                os.makedirs(self.folder)
+            tmp = self._sidecar(core) + '.tmp'
+            with open(tmp, 'w') as fd:
+                json.dump(entry, fd)
+            os.rename(tmp, self._sidecar(core))
+
+        return entry
+
+    def get(self, core):
+        """Returns the statistics of core, computing them if the index
+        changed since they were computed."""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(core)
+            if entry is not None and \
+                    now - self.checked.get(core, 0) < self.version_ttl:
+                return entry
+
+        version = self.solr.index_version(core)
+
+        if entry is None and self.folder is not None and \
+                os.path.exists(self._sidecar(core)):
+            with open(self._sidecar(core), 'r') as fd:
+                entry = json.load(fd)
+
+        if entry is None or entry['version'] != version:
+            entry = self.compute(core, version)
+
+        with self.lock:
+            self.entries[core] = entry
+            self.checked[core] = now
+
+        return entry
+
+    def invalidate(self, core=None):
+        with self.lock:
+            if core is None:
+                self.entries.clear()
+                self.checked.clear()
+            else:
+                self.entries.pop(core, None)
+                self.checked.pop(core, None)
+
+    def stats(self, core, space=None):
+        entry = self.get(core)
+        if space is None:
+            return entry['universe']
+        return entry['spaces'][space]
+
+    def mbb(self, core, space=None):
+        return self.stats(core, space)['mbb']
+
+    def count(self, core, space=None):
+        return self.stats(core, space)['count']
+
+    def spaces(self, core):
+        return list(self.get(core)['spaces'].keys())
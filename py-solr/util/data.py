@@ -14,7 +14,7 @@ def parse_results(fd, converter):
             length = len(fields)
             if length == converter_len:
                 record = tuple(
-                    [converter[i](fields[i]) for i in xrange(length)])
+                    [converter[i](fields[i]) for i in range(length)])
                 results.append(record)
             else:
                 skipped.append(fields)
@@ -35,3 +35,27 @@ def load_csv(files, converter, results, skipped):
             skipped.append((name, s))
         except IOError:
             pass
+
+
+def parse_timings(fd):
+    """ Parses the output of the queries-*-bench.py scripts.
+
+    Returns a dictionary of query label -> list of timings, the lines which
+    are not timing records (headers, comments, ...) are ignored.
+    """
+    timings = {}
+    for line in fd:
+        fields = re.split(r',', line.strip())
+        if len(fields) < 3:
+            continue
+
+        try:
+            count = int(fields[1])
+            values = [float(v) for v in fields[2:]]
+        except ValueError:
+            continue
+
+        if count > 0:
+            timings.setdefault(fields[0], []).extend(values)
+
+    return timings
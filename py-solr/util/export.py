@@ -0,0 +1,233 @@
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from util.pointcache import Points
+
+
+#############################################################################
+# Parallel export of a region
+COORDINATES = ['geometry.coordinates_%d___pdouble' % d for d in [0, 1, 2]]
+
+
+def histogram_density(histogram):
+    """Histogram counts as a (bins, bins, bins) array, with the edges of
+    the cells along each dimension."""
+    bins = histogram['bins']
+    lo, hi = histogram['mbb']
+    counts = np.array(histogram['counts'], dtype=np.float64)\
+        .reshape((bins, bins, bins))
+    edges = [np.linspace(lo[d], hi[d], bins + 1) for d in [0, 1, 2]]
+    return counts, edges
+
+
+def _overlap(edges, lo, hi):
+    """Fraction of each cell of edges within [lo, hi]. The cells of a
+    degenerate dimension, all the points sharing the same coordinate, are
+    entirely within [lo, hi] when it contains that coordinate."""
+    width = edges[1:] - edges[:-1]
+    inter = np.clip(np.minimum(edges[1:], hi) - np.maximum(edges[:-1], lo),
+                    0, None)
+    flat = (width <= 0) & (lo <= edges[:-1]) & (edges[:-1] <= hi)
+    return np.where(width > 0, inter / np.maximum(width, 1e-300),
+                    flat.astype(np.float64))
+
+
+def _marginal(density, mbb, d, positions):
+    """Estimated number of points of mbb below each of positions along
+    dimension d, assuming a uniform density within the cells."""
+    counts, edges = density
+    w = [_overlap(edges[k], mbb[0][k], mbb[1][k]) for k in [0, 1, 2]]
+    others = [k for k in [0, 1, 2] if k != d]
+    # Weight of each cell along d, the other dimensions summed out
+    weights = np.einsum('ijk,i,j,k->' + 'ijk'[d], counts,
+                        *[w[k] if k in others else np.ones(len(w[k]))
+                          for k in [0, 1, 2]])
+    return np.array([np.sum(weights * _overlap(edges[d], mbb[0][d], p))
+                     for p in positions])
+
+
+def estimate(density, mbb):
+    """Estimated number of points within mbb."""
+    if density is None:
+        return float(np.prod([mbb[1][d] - mbb[0][d] for d in [0, 1, 2]]))
+    return float(_marginal(density, mbb, 0, [mbb[1][0]])[0])
+
+
+def _cover(edges, lo, hi):
+    """Cells of edges entirely within [lo, hi], and cells whose closed
+    interval intersects it. The edges are widened by a relative tolerance,
+    to account for the slightly larger gap of the range facets."""
+    eps = max(edges[-1] - edges[0], 1.0) * 1e-6
+    if edges[-1] <= edges[0]:
+        # Degenerate dimension, all the points in the first cell
+        inside = np.full(len(edges) - 1, lo <= edges[0] <= hi)
+        return inside, inside
+    inside = (lo <= edges[:-1] - eps) & (edges[1:] + eps <= hi)
+    touched = (edges[:-1] - eps <= hi) & (lo <= edges[1:] + eps)
+    return inside, touched
+
+
+def bounds(density, mbb):
+    """Lower and upper bounds of the number of points within mbb: the
+    points of the cells entirely within mbb, and the points of all the cells
+    intersecting mbb, faces included."""
+    counts, edges = density
+    cover = [_cover(edges[k], mbb[0][k], mbb[1][k]) for k in [0, 1, 2]]
+    inside = [c[0].astype(np.float64) for c in cover]
+    touched = [c[1].astype(np.float64) for c in cover]
+    return float(np.einsum('ijk,i,j,k->', counts, *inside)), \
+        float(np.einsum('ijk,i,j,k->', counts, *touched))
+
+
+def partition(mbb, parts, density=None):
+    """Splits mbb into parts boxes holding about the same number of points,
+    according to density, or the same volume without density.
+
+    The box is split recursively along its longest side, at the estimated
+    quantile of the points matching the number of parts on each side.
+    """
+    if parts <= 1:
+        return [mbb]
+
+    d = int(np.argmax([mbb[1][k] - mbb[0][k] for k in [0, 1, 2]]))
+    lo = mbb[0][d]
+    hi = mbb[1][d]
+    left = parts // 2
+    ratio = left / float(parts)
+
+    split = lo + (hi - lo) * ratio
+    if density is not None:
+        positions = np.linspace(lo, hi, 257)
+        below = _marginal(density, mbb, d, positions)
+        if below[-1] > 0:
+            split = float(np.interp(ratio * below[-1], below, positions))
+
+    a = [mbb[0][:], mbb[1][:]]
+    b = [mbb[0][:], mbb[1][:]]
+    a[1][d] = split
+    b[0][d] = split
+    return partition(a, left, density) + partition(b, parts - left, density)
+
+
+def box_fq(box, region):
+    """Filters selecting the points of box, excluding its upper faces
+    inside region, so a point on a face shared by two boxes is exported
+    once."""
+    fq = []
+    for d in [0, 1, 2]:
+        close = ']' if box[1][d] >= region[1][d] else '}'
+        fq.append('%s:[%.17g TO %.17g%s' % (COORDINATES[d], box[0][d],
+                                             box[1][d], close))
+    return fq
+
+
+def _page(docs):
+    """Coordinates and labels of a page of documents."""
+    coordinates = np.array([[doc[f] for f in COORDINATES] for doc in docs],
+                           dtype=np.float64).reshape((len(docs), 3))
+    return coordinates, [doc['properties.id'] for doc in docs]
+
+
+def stream(solr, core, batch=10000, **filters):
+    """See Solr.stream()."""
+    fl = ','.join(['properties.id'] + COORDINATES)
+    cursor = '*'
+    while True:
+        rsp = solr.query(core, fl=fl, rows=batch, indent='off',
+                         params=solr.cursor_params(core, cursor),
+                         **filters)
+        docs = rsp['response']['docs']
+        if docs:
+            yield _page(docs)
+        if not docs or rsp['nextCursorMark'] == cursor:
+            break
+        cursor = rsp['nextCursorMark']
+
+
+def export_region(solr, core, mbb, parts=4, workers=4, catalog=None,
+                  sink=None, page_size=10000, fq=None):
+    """See Solr.export_region()."""
+    density = None
+    if catalog is not None:
+        stats = catalog.stats(core)
+        if stats['histogram'] is not None:
+            density = histogram_density(stats['histogram'])
+
+    boxes = partition([list(mbb[0]), list(mbb[1])], parts, density)
+    fl = ','.join(['properties.id'] + COORDINATES)
+
+    lock = threading.Lock()
+    results = [None] * len(boxes)
+    report = {'parts': [None] * len(boxes)}
+
+    def fetch(i):
+        start = time.time()
+        filters = box_fq(boxes[i], mbb) + (fq or [])
+        cursor = '*'
+        size = 0
+        count = 0
+        coordinates = []
+        labels = []
+
+        while True:
+            r = solr._query(core, fq=filters, fl=fl, rows=page_size,
+                            indent='off',
+                            params=solr.cursor_params(core, cursor))
+            size += len(r.content)
+            rsp = r.json()
+            docs = rsp['response']['docs']
+            count += len(docs)
+
+            if docs:
+                c, l = _page(docs)
+                if sink is not None:
+                    with lock:
+                        sink.write(c, l)
+                else:
+                    coordinates.append(c)
+                    labels += l
+
+            if not docs or rsp['nextCursorMark'] == cursor:
+                break
+            cursor = rsp['nextCursorMark']
+
+        if sink is None:
+            results[i] = (coordinates, labels)
+        report['parts'][i] = {'mbb': boxes[i], 'bytes': size,
+                              'elapsed': time.time() - start,
+                              'estimate': estimate(density, boxes[i])
+                              if density is not None else None,
+                              'points': count}
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(fetch, range(len(boxes))))
+    elapsed = time.time() - start
+
+    points = sum([p['points'] for p in report['parts']])
+    size = sum([p['bytes'] for p in report['parts']])
+    report.update({
+        'points': points,
+        'bytes': size,
+        'elapsed': elapsed,
+        'mb_per_s': size / 1e6 / elapsed if elapsed > 0 else 0.0,
+        'points_per_s': points / elapsed if elapsed > 0 else 0.0
+    })
+
+    if sink is not None:
+        return None, report
+
+    # Merge the parts, dictionary encoding the labels
+    coordinates = [c for part in results for c in part[0]]
+    coordinates = np.concatenate(coordinates) if coordinates \
+        else np.empty((0, 3))
+    labels = [l for part in results for l in part[1]]
+    oids, codes = np.unique(np.array(labels, dtype=object),
+                            return_inverse=True) if labels \
+        else (np.empty(0, dtype=object), np.empty(0, dtype=np.int64))
+
+    return Points(coordinates, codes.astype(np.int32), list(oids)), report
@@ -0,0 +1,252 @@
+import queue
+import requests
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from util.solr import Solr
+
+
+#############################################################################
+# Scatter-gather over several cores and servers
+def merge_mbbs(mbbs):
+    """Smallest box containing all the given boxes, None ones excluded."""
+    mbbs = [m for m in mbbs if m is not None and None not in m[0]]
+    if not mbbs:
+        return None
+    return [[min([m[0][d] for m in mbbs]) for d in [0, 1, 2]],
+            [max([m[1][d] for m in mbbs]) for d in [0, 1, 2]]]
+
+
+def partial(report):
+    """Whether some targets did not answer."""
+    return any([r['status'] != 'ok' for r in report.values()])
+
+
+class Federation:
+    """Runs the same query on a list of (url, core) targets concurrently,
+    and merges the results.
+
+    Every call returns (result, report), report being a dictionary
+    "<url>/<core>" -> {'status', 'elapsed', 'error'}, the status being
+    'ok', 'timeout' or 'error'. Targets which fail or do not answer within
+    timeout seconds are left out of the result, which is then partial, see
+    partial().
+    """
+
+    def __init__(self, targets, timeout=10.0, workers=None, **solr_args):
+        """
+            :param list targets:    (url, core) tuples
+            :param float timeout:   per target timeout, in seconds
+            :param int workers:     maximum number of concurrent requests,
+                                    one per target by default
+            :param solr_args:       additional arguments of the Solr
+                                    clients, for example metrics=...
+        """
+        assert (len(targets) > 0)
+        self.targets = targets
+        self.timeout = timeout
+        self.workers = workers if workers is not None else len(targets)
+
+        clients = {}
+        for url, _ in targets:
+            if url not in clients:
+                clients[url] = Solr(url, timeout=timeout, **solr_args)
+        self.clients = clients
+
+    @staticmethod
+    def name(target):
+        return '%s/%s' % target
+
+    def _report(self):
+        return dict([(self.name(t), {'status': 'timeout', 'elapsed': None,
+                                     'error': None})
+                     for t in self.targets])
+
+    def _scatter(self, call, report):
+        """Yields (target, value) as the targets answer, and fills
+        report."""
+
+        def run(target):
+            start = time.time()
+            try:
+                return call(self.clients[target[0]], target[1])
+            finally:
+                report[self.name(target)]['elapsed'] = time.time() - start
+
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        pending = dict([(executor.submit(run, t), t) for t in self.targets])
+        # The requests time out on their own, this also bounds the time
+        # spent waiting for a free worker.
+        deadline = time.time() + self.timeout * \
+            ((len(self.targets) + self.workers - 1) // self.workers)
+
+        try:
+            while pending:
+                done, _ = wait(list(pending.keys()),
+                               timeout=max(deadline - time.time(), 0),
+                               return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+
+                for f in done:
+                    t = pending.pop(f)
+                    r = report[self.name(t)]
+                    try:
+                        value = f.result()
+                    except requests.Timeout as e:
+                        r['status'] = 'timeout'
+                        r['error'] = str(e)
+                        continue
+                    except Exception as e:
+                        r['status'] = 'error'
+                        r['error'] = str(e)
+                        continue
+                    r['status'] = 'ok'
+                    yield t, value
+        finally:
+            # Do not wait for the targets which timed out
+            executor.shutdown(wait=False)
+
+    def _gather(self, call):
+        report = self._report()
+        return list(self._scatter(call, report)), report
+
+    @staticmethod
+    def _pages(solr, core, fl, batch, rows, filters):
+        """Pages of the matching documents of core, with cursorMark."""
+        cursor = '*'
+        left = rows
+        while left is None or left > 0:
+            n = batch if left is None else min(batch, left)
+            rsp = solr.query(core, fl=fl, rows=n, indent='off',
+                             params=solr.cursor_params(core, cursor),
+                             **filters)
+            docs = rsp['response']['docs']
+            if docs:
+                yield docs
+            if left is not None:
+                left -= len(docs)
+            if not docs or rsp['nextCursorMark'] == cursor:
+                break
+            cursor = rsp['nextCursorMark']
+
+    def stream(self, report=None, fl=None, rows=None, batch=1000,
+               **filters):
+        """Yields (target, doc) for all the matching documents of each
+        target, or the first rows ones, paging through them with cursorMark.
+        The pages of the targets are interleaved as they arrive, so the
+        fastest targets come first. When given, the report dictionary is
+        filled as the targets finish.
+
+        filters are the ones of Solr.query().
+        """
+        if report is None:
+            report = {}
+        report.update(self._report())
+
+        # At most two pages per target are waiting to be consumed
+        pages = queue.Queue(maxsize=2 * len(self.targets))
+        stop = threading.Event()
+        # Bounds the number of concurrent requests, see workers
+        slots = threading.Semaphore(self.workers)
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def run(target):
+            r = report[self.name(target)]
+            start = time.time()
+            try:
+                it = self._pages(self.clients[target[0]], target[1], fl,
+                                 batch, rows, filters)
+                while True:
+                    with slots:
+                        docs = next(it, None)
+                    if docs is None:
+                        r['status'] = 'ok'
+                        break
+                    if not put((target, docs)):
+                        break
+            except requests.Timeout as e:
+                r['status'] = 'timeout'
+                r['error'] = str(e)
+            except Exception as e:
+                r['status'] = 'error'
+                r['error'] = str(e)
+            finally:
+                r['elapsed'] = time.time() - start
+                put((target, None))
+
+        threads = [threading.Thread(target=run, args=(t,), daemon=True)
+                   for t in self.targets]
+        running = len(threads)
+        try:
+            for t in threads:
+                t.start()
+            while running > 0:
+                target, docs = pages.get()
+                if docs is None:
+                    running -= 1
+                    continue
+                for doc in docs:
+                    yield target, doc
+        finally:
+            # The consumer may stop early, the targets stop after their
+            # current page
+            stop.set()
+
+    def query(self, fl=None, rows=10, start=0, **filters):
+        """Returns the matching documents of all the targets, shaped like a
+        Solr response, numFound being the total over the targets which
+        answered.
+
+        Documents are not sorted across targets: start and rows apply to
+        the concatenation of the results, in the order of the targets.
+        """
+        values, report = self._gather(
+            lambda solr, core: solr.query(core, fl=fl, rows=start + rows,
+                                          indent='off', **filters))
+        order = dict([(t, i) for i, t in enumerate(self.targets)])
+        values.sort(key=lambda v: order[v[0]])
+
+        docs = []
+        for t, rsp in values:
+            docs += rsp['response']['docs']
+
+        return {
+            'response': {
+                'numFound': sum([rsp['response']['numFound']
+                                 for t, rsp in values]),
+                'start': start,
+                'docs': docs[start:start + rows]
+            }
+        }, report
+
+    def query_cardinality(self, **filters):
+        """Total number of matching documents."""
+        values, report = self._gather(
+            lambda solr, core: solr.query_cardinality(core, **filters))
+        return sum([v for t, v in values]), report
+
+    def spatial_mbb(self, query='*:*', params=None):
+        """MBB of the matching documents of all the targets."""
+        values, report = self._gather(
+            lambda solr, core: solr.spatial_mbb(core, query, params))
+        return merge_mbbs([v for t, v in values]), report
+
+    def list_field(self, field):
+        """Distinct values of field over all the targets."""
+        values, report = self._gather(
+            lambda solr, core: solr.list_field(core, field))
+        distinct = set()
+        for t, v in values:
+            distinct.update(v)
+        return list(distinct), report
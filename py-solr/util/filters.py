@@ -0,0 +1,116 @@
+import numpy as np
+
+
+#############################################################################
+# Union of boxes filter optimization
+def _volumes(lo, hi):
+    return np.prod(np.maximum(hi - lo, 0.0), axis=-1)
+
+
+class FilterOptimizer:
+    """Simplifies the union of boxes used to filter labels queries, see
+    Solr(url, filter_optimizer=...):
+
+        * boxes contained in another box are dropped,
+        * with slack > 0, two overlapping boxes are replaced by their MBB
+          when it adds at most slack times the volume of their union, this
+          adds false positives, as the labels MBBs already do,
+        * the boxes are sorted, so the same set of boxes always gives the
+          same filter string, and is cached once by Solr,
+        * unions of more than max_clauses boxes are split into groups, each
+          one wrapped into filter(...), which Solr caches separately, so a
+          group is reused by the queries sharing it. With cell_size, the
+          boxes are grouped by the cell of a regular grid holding their
+          center, so that the groups do not depend on the other boxes of
+          the query.
+    """
+
+    def __init__(self, slack=0.0, max_clauses=64, cell_size=None):
+        self.slack = slack
+        self.max_clauses = max_clauses
+        self.cell_size = cell_size
+
+    def simplify(self, mbbs):
+        """Returns an equivalent list of boxes, or a superset of them with
+        slack, sorted. Boxes which are None are ignored."""
+        boxes = [m for m in mbbs if m is not None and None not in m[0]]
+        if not boxes:
+            return []
+        lo = np.array([b[0] for b in boxes], dtype=np.float64)
+        hi = np.array([b[1] for b in boxes], dtype=np.float64)
+
+        changed = True
+        while changed:
+            changed = False
+            # Largest first, so each box is tested against the boxes which
+            # can contain it
+            order = np.argsort(-_volumes(lo, hi), kind='stable')
+            lo = lo[order]
+            hi = hi[order]
+            klo = np.empty_like(lo)
+            khi = np.empty_like(hi)
+            m = 0
+
+            for i in range(len(lo)):
+                a = lo[i]
+                b = hi[i]
+                if m > 0:
+                    inside = np.all(klo[:m] <= a, axis=1) & \
+                        np.all(b <= khi[:m], axis=1)
+                    if inside.any():
+                        continue
+
+                    if self.slack > 0:
+                        ilo = np.maximum(klo[:m], a)
+                        ihi = np.minimum(khi[:m], b)
+                        overlap = np.all(ilo <= ihi, axis=1)
+                        union = _volumes(klo[:m], khi[:m]) + \
+                            _volumes(a, b) - _volumes(ilo, ihi)
+                        mbb = _volumes(np.minimum(klo[:m], a),
+                                       np.maximum(khi[:m], b))
+                        merge = np.nonzero(
+                            overlap & (mbb <= union * (1.0 + self.slack)))[0]
+                        if len(merge) > 0:
+                            j = merge[0]
+                            klo[j] = np.minimum(klo[j], a)
+                            khi[j] = np.maximum(khi[j], b)
+                            changed = True
+                            continue
+
+                klo[m] = a
+                khi[m] = b
+                m += 1
+
+            lo = klo[:m]
+            hi = khi[:m]
+
+        boxes = [[lo[i].tolist(), hi[i].tolist()] for i in range(len(lo))]
+        boxes.sort(key=lambda m: m[0] + m[1])
+        return boxes
+
+    def _groups(self, boxes):
+        if self.cell_size is None:
+            keys = [0] * len(boxes)
+        else:
+            keys = [tuple(int(np.floor((m[0][d] + m[1][d]) / 2.0 /
+                                       self.cell_size)) for d in [0, 1, 2])
+                    for m in boxes]
+
+        groups = {}
+        for k, m in zip(keys, boxes):
+            groups.setdefault(k, []).append(m)
+
+        for k in sorted(groups):
+            g = groups[k]
+            for i in range(0, len(g), self.max_clauses):
+                yield g[i:i + self.max_clauses]
+
+    def union_fq(self, mbbs, clause):
+        """Filter query string selecting the union of mbbs, clause(mbb)
+        being the filter of a single box."""
+        boxes = self.simplify(mbbs)
+        if len(boxes) <= self.max_clauses:
+            return ' OR '.join([clause(m) for m in boxes])
+
+        return ' OR '.join(['filter(%s)' % ' OR '.join([clause(m) for m in g])
+                            for g in self._groups(boxes)])
@@ -0,0 +1,190 @@
+import heapq
+import itertools
+import threading
+import time
+
+from contextlib import contextmanager
+
+
+#############################################################################
+# Adaptive concurrency limiting
+INTERACTIVE = 0
+BULK = 1
+
+PRIORITIES = {INTERACTIVE: 'interactive', BULK: 'bulk'}
+
+
+class QueueFull(Exception):
+    """Raised when a request can not be queued, or waited too long."""
+
+
+class _Waiter:
+    def __init__(self, priority):
+        self.priority = priority
+        self.event = threading.Event()
+        self.granted = False
+        self.rejected = False
+
+
+class AdaptiveLimiter:
+    """Bounds the number of concurrent requests, adapting the bound to the
+    observed latencies and errors (AIMD).
+
+    Every window completed requests, the limit is:
+        * multiplied by decrease if the p99 latency of the window is above
+          target_p99, or if a request failed,
+        * increased by increase if the limit was reached during the window,
+        * otherwise kept as is, as it is not what bounds the throughput.
+
+    Requests over the limit wait in a bounded queue, interactive requests
+    before bulk ones. When the queue is full, an interactive request takes
+    the place of the most recent bulk request, which is rejected.
+    """
+
+    def __init__(self, initial=8, minimum=1, maximum=256, target_p99=0.5,
+                 window=50, increase=1, decrease=0.7, max_queue=1000,
+                 registry=None):
+        assert (minimum <= initial <= maximum)
+
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_p99 = target_p99
+        self.window = window
+        self.increase = increase
+        self.decrease = decrease
+        self.max_queue = max_queue
+
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.queue = []     # heap of (priority, sequence, waiter)
+        self.sequence = itertools.count()
+        self.latencies = []
+        self.failed = False
+        self.saturated = False
+
+        self.rejected = dict([(p, 0) for p in PRIORITIES])
+
+        self.metrics = None
+        if registry is not None:
+            self.metrics = (
+                registry.gauge('solr_client_concurrency_limit',
+                               'Current limit of concurrent requests'),
+                registry.gauge('solr_client_queue_depth',
+                               'Requests waiting for the limiter',
+                               ('priority',)),
+                registry.counter('solr_client_rejected',
+                                 'Requests rejected by the limiter',
+                                 ('priority',)))
+            self.metrics[0].set(value=int(self.limit))
+
+    def _depth_changed(self, priority, delta):
+        if self.metrics is not None:
+            self.metrics[1].inc((PRIORITIES[priority],), delta)
+
+    def _reject(self, priority):
+        self.rejected[priority] += 1
+        if self.metrics is not None:
+            self.metrics[2].inc((PRIORITIES[priority],))
+
+    def acquire(self, priority=INTERACTIVE, timeout=None):
+        """Waits for a slot, raises QueueFull when the request is rejected,
+        or still waiting after timeout seconds."""
+        with self.lock:
+            if self.in_flight < int(self.limit) and not self.queue:
+                self.in_flight += 1
+                self.saturated |= self.in_flight >= int(self.limit)
+                return
+
+            if len(self.queue) >= self.max_queue:
+                bulk = [e for e in self.queue if e[0] == BULK]
+                if priority == BULK or not bulk:
+                    self._reject(priority)
+                    raise QueueFull('limiter queue full')
+                # Make room, by rejecting the most recent bulk request
+                victim = max(bulk, key=lambda e: e[1])
+                self.queue.remove(victim)
+                heapq.heapify(self.queue)
+                victim[2].rejected = True
+                victim[2].event.set()
+                self._reject(BULK)
+                self._depth_changed(BULK, -1)
+
+            waiter = _Waiter(priority)
+            heapq.heappush(self.queue,
+                           (priority, next(self.sequence), waiter))
+            self._depth_changed(priority, 1)
+            self.saturated = True
+
+        waiter.event.wait(timeout)
+
+        with self.lock:
+            if waiter.granted:
+                return
+            if not waiter.rejected:
+                # Timed out
+                self.queue = [e for e in self.queue if e[2] is not waiter]
+                heapq.heapify(self.queue)
+                self._depth_changed(priority, -1)
+                self._reject(priority)
+        raise QueueFull('request rejected by the limiter')
+
+    def _grant(self):
+        while self.queue and self.in_flight < int(self.limit):
+            priority, _, waiter = heapq.heappop(self.queue)
+            self._depth_changed(priority, -1)
+            self.in_flight += 1
+            waiter.granted = True
+            waiter.event.set()
+
+    def release(self, latency, error=False):
+        """Frees a slot, and records the outcome of the request."""
+        with self.lock:
+            self.in_flight -= 1
+            self.latencies.append(latency)
+            self.failed |= error
+
+            if len(self.latencies) >= self.window:
+                self._adjust()
+
+            self._grant()
+
+    def _adjust(self):
+        s = sorted(self.latencies)
+        p99 = s[min(int(len(s) * 0.99), len(s) - 1)]
+
+        if self.failed or p99 > self.target_p99:
+            self.limit = max(self.minimum, self.limit * self.decrease)
+        elif self.saturated:
+            self.limit = min(self.maximum, self.limit + self.increase)
+
+        self.latencies = []
+        self.failed = False
+        self.saturated = self.in_flight >= int(self.limit)
+        if self.metrics is not None:
+            self.metrics[0].set(value=int(self.limit))
+
+    @contextmanager
+    def slot(self, priority=INTERACTIVE, timeout=None):
+        """Holds a slot for the duration of the block. The block must set
+        the 'error' key of the yielded dictionary when the request failed
+        because the server is overloaded."""
+        self.acquire(priority, timeout)
+        outcome = {'error': False}
+        start = time.time()
+        try:
+            yield outcome
+        except Exception:
+            outcome['error'] = True
+            raise
+        finally:
+            self.release(time.time() - start, outcome['error'])
+
+    def stats(self):
+        with self.lock:
+            depth = dict([(n, len([e for e in self.queue if e[0] == p]))
+                          for p, n in PRIORITIES.items()])
+            return {'limit': int(self.limit), 'in_flight': self.in_flight,
+                    'queue_depth': depth,
+                    'rejected': dict([(PRIORITIES[p], n)
+                                      for p, n in self.rejected.items()])}
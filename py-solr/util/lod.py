@@ -0,0 +1,67 @@
+import json
+
+import numpy as np
+
+from util.catalog import histogram_facet
+
+
+#############################################################################
+# Level of detail sampling
+COORDINATES = ['geometry.coordinates_%d___pdouble' % d for d in [0, 1, 2]]
+
+
+def grid_bins(k):
+    """Number of cells per dimension of the largest regular grid with at
+    most k cells."""
+    bins = max(1, int(round(k ** (1.0 / 3))))
+    while bins > 1 and bins ** 3 > k:
+        bins -= 1
+    return bins
+
+
+def extent(solr, core, **filters):
+    """MBB of the points matching filters, None when there are none."""
+    facet = dict([('%s%d' % (f, d), '%s(%s)' % (f, COORDINATES[d]))
+                  for f in ['min', 'max'] for d in [0, 1, 2]])
+    rsp = solr.query(core, rows=0, indent='off',
+                     params=[('json.facet', json.dumps(facet))], **filters)
+    facets = rsp.get('facets', {})
+    if facets.get('count', 0) == 0:
+        return None
+    return [[facets['min%d' % d] for d in [0, 1, 2]],
+            [facets['max%d' % d] for d in [0, 1, 2]]]
+
+
+def voxel_centroids(solr, core, k, mbb=None, **filters):
+    """See Solr.lod()."""
+    if mbb is None:
+        box = extent(solr, core, **filters)
+    else:
+        box = mbb
+        filters['mbb'] = mbb
+    if box is None:
+        return np.empty((0, 3)), np.empty(0, dtype=np.int64)
+
+    bins = grid_bins(k)
+    aggregations = dict([('c%d' % d, 'avg(%s)' % COORDINATES[d])
+                         for d in [0, 1, 2]])
+    rsp = solr.query(core, rows=0, indent='off',
+                     params=[('json.facet', json.dumps(
+                         histogram_facet(box, bins, aggregations,
+                                         mincount=1)))],
+                     **filters)
+
+    # Only the cells holding points are returned, sparse regions give small
+    # responses
+    coordinates = []
+    counts = []
+    facets = rsp.get('facets', {})
+    for bx in facets.get('x', {}).get('buckets', [])[:bins]:
+        for by in bx.get('y', {}).get('buckets', [])[:bins]:
+            for bz in by.get('z', {}).get('buckets', [])[:bins]:
+                if bz['count'] > 0:
+                    coordinates.append([bz['c%d' % d] for d in [0, 1, 2]])
+                    counts.append(bz['count'])
+
+    return np.array(coordinates, dtype=np.float64).reshape((-1, 3)), \
+        np.array(counts, dtype=np.int64)
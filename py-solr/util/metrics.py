@@ -0,0 +1,237 @@
+import bisect
+import threading
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import util.querylog as querylog
+
+
+#############################################################################
+# Metrics primitives
+#
+# Each metric keeps its values per tuple of label values, behind a single
+# lock, so updating a metric costs a dictionary lookup and, for histograms,
+# a bisection over the bucket bounds.
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = ['%s="%s"' % (n, _escape(v)) for n, v in zip(names, values)]
+    if extra is not None:
+        pairs.append('%s="%s"' % extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join(pairs)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, labels=()):
+        return self.values.get(labels, 0)
+
+    def samples(self):
+        with self.lock:
+            values = list(self.values.items())
+        return [('%s_total%s' % (self.name, _labels(self.labels, k)), v)
+                for k, v in sorted(values)]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+    def set(self, labels=(), value=0):
+        with self.lock:
+            self.values[labels] = value
+
+    def samples(self):
+        with self.lock:
+            values = list(self.values.items())
+        return [('%s%s' % (self.name, _labels(self.labels, k)), v)
+                for k, v in sorted(values)]
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = sorted(buckets)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            v = self.values.get(labels)
+            if v is None:
+                # counts per bucket, +Inf included, and the sum
+                v = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            v[0][i] += 1
+            v[1] += value
+
+    def samples(self):
+        with self.lock:
+            values = [(k, (v[0][:], v[1])) for k, v in self.values.items()]
+
+        samples = []
+        for k, (counts, total) in sorted(values):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ['+Inf'], counts):
+                cumulative += count
+                samples.append(('%s_bucket%s' %
+                                (self.name,
+                                 _labels(self.labels, k, ('le', bound))),
+                                cumulative))
+            samples.append(('%s_count%s' % (self.name,
+                                            _labels(self.labels, k)),
+                            cumulative))
+            samples.append(('%s_sum%s' % (self.name, _labels(self.labels, k)),
+                            total))
+        return samples
+
+
+class Registry:
+    """Set of metrics, exposed in the OpenMetrics text format."""
+
+    def __init__(self):
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=()):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def exposition(self):
+        lines = []
+        with self.lock:
+            metrics = self.metrics[:]
+        for m in metrics:
+            lines.append('# TYPE %s %s' % (m.name, m.kind))
+            lines.append('# HELP %s %s' % (m.name, m.documentation))
+            lines.extend(['%s %s' % (n, repr(v) if isinstance(v, float)
+                                     else v)
+                          for n, v in m.samples()])
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, address=''):
+        """Serves the exposition over HTTP, from a background thread.
+
+        Returns the server, call shutdown() on it to stop it.
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.exposition().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type',
+                                 'application/openmetrics-text; '
+                                 'version=1.0.0; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer((address, port), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return server
+
+
+#############################################################################
+# Solr client instrumentation
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+NUM_FOUND_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000, 10000000)
+
+
+def _endpoint(endpoint):
+    # Remove the core name, to keep the number of label values bounded
+    if endpoint.startswith('admin/'):
+        return endpoint
+    return endpoint.split('/', 1)[-1]
+
+
+class SolrMetrics:
+    """Metrics of a Solr client, see Solr(url, metrics=...)."""
+
+    def __init__(self, registry=None, prefix='solr_client'):
+        if registry is None:
+            registry = Registry()
+        self.registry = registry
+
+        self.requests = registry.counter(
+            '%s_requests' % prefix, 'Requests sent',
+            ('endpoint', 'method', 'status'))
+        self.bytes = registry.counter(
+            '%s_response_bytes' % prefix, 'Bytes received', ('endpoint',))
+        self.latency = registry.histogram(
+            '%s_request_seconds' % prefix, 'Request latency',
+            ('endpoint', 'type'), LATENCY_BUCKETS)
+        self.num_found = registry.histogram(
+            '%s_num_found' % prefix, 'Number of documents matched',
+            ('type',), NUM_FOUND_BUCKETS)
+        self.errors = registry.counter(
+            '%s_errors' % prefix, 'Failed requests', ('endpoint', 'error'))
+        self.retries = registry.counter(
+            '%s_retries' % prefix, 'Requests sent again', ('endpoint',))
+        self.in_flight = registry.gauge(
+            '%s_in_flight' % prefix, 'Requests waiting for a response',
+            ('endpoint',))
+
+    def started(self, endpoint):
+        self.in_flight.inc((_endpoint(endpoint),))
+
+    def done(self, method, endpoint, params, latency, status, size):
+        e = _endpoint(endpoint)
+        self.in_flight.dec((e,))
+        self.requests.inc((e, method, str(status)))
+        self.bytes.inc((e,), size)
+        self.latency.observe((e, querylog.classify(endpoint, params)
+                              if method == 'GET' else method), latency)
+        if status != 200:
+            self.errors.inc((e, 'http_%d' % status))
+
+    def failed(self, endpoint, error):
+        e = _endpoint(endpoint)
+        self.in_flight.dec((e,))
+        self.errors.inc((e, type(error).__name__))
+
+    def retried(self, endpoint):
+        self.retries.inc((_endpoint(endpoint),))
+
+    def found(self, query_type, num_found):
+        self.num_found.observe((query_type,), num_found)
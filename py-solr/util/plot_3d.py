@@ -1,103 +1,292 @@
-import matplotlib
-matplotlib.use('GTKAgg')    # Needs to be called before ANY reference to
-                            # matplotlib objects are made.
-
-import matplotlib.pyplot as plt
-import matplotlib.cm as cm
-from mpl_toolkits.mplot3d import Axes3D
+import os
+import sys
+import time
 
 import numpy as np
-import time
 
 
+#############################################################################
+# Lazy loading of the plotting libraries
+_pyplot = None
+
+
+def pyplot():
+    """matplotlib.pyplot, imported on first use.
+
+    Without a display, and unless MPLBACKEND is set, the Agg backend is
+    selected, so figures can be written to files on headless servers.
+    """
+    global _pyplot
+    if _pyplot is None:
+        import matplotlib
+        if 'MPLBACKEND' not in os.environ and sys.platform != 'darwin' \
+                and not os.environ.get('DISPLAY') \
+                and not os.environ.get('WAYLAND_DISPLAY'):
+            matplotlib.use('Agg')
+        import matplotlib.pyplot
+        _pyplot = matplotlib.pyplot
+    return _pyplot
+
+
+def plotly():
+    try:
+        import plotly.graph_objects
+    except ImportError:
+        raise ImportError('Interactive HTML figures require plotly, '
+                          'see https://plotly.com/python/')
+    return plotly.graph_objects
+
+
+def interactive():
+    """Whether figures can be shown on screen."""
+    return pyplot().get_backend().lower() not in ['agg', 'pdf', 'ps', 'svg',
+                                                  'cairo', 'template']
+
+
+#############################################################################
+# Point clouds helpers
+def to_array(points):
+    """Coordinates of points as a (n, 3) array, points being either such an
+    array or a list of Solr documents."""
+    if isinstance(points, np.ndarray):
+        return points.reshape((-1, 3))
+    return np.array([[p['geometry.coordinates_%d___pdouble' % d]
+                      for d in [0, 1, 2]] for p in points],
+                    dtype=np.float64).reshape((-1, 3))
+
+
+def rainbow(n):
+    """n distinct colors, as a (n, 4) RGBA array."""
+    from matplotlib import colormaps
+    return colormaps['rainbow'](np.linspace(0, 1, max(n, 1)))[:n]
+
+
+def splat(coordinates, bins):
+    """Voxel splats of a point cloud: the centroids of the non-empty cells
+    of a bins^3 grid over the cloud, with their number of points."""
+    lo = coordinates.min(axis=0)
+    size = np.maximum(coordinates.max(axis=0) - lo, 1e-12) / bins
+    cell = np.minimum(((coordinates - lo) / size).astype(np.int64), bins - 1)
+    index = (cell[:, 0] * bins + cell[:, 1]) * bins + cell[:, 2]
+    cells, inverse, counts = np.unique(index, return_inverse=True,
+                                       return_counts=True)
+    centroids = np.zeros((len(cells), 3))
+    for d in [0, 1, 2]:
+        centroids[:, d] = np.bincount(inverse, coordinates[:, d]) / counts
+    return centroids, counts
+
+
+class _Points:
+    def __init__(self, coordinates, label, labels, color, s):
+        self.coordinates = coordinates
+        self.label = label
+        self.labels = labels
+        self.color = color
+        self.s = s
+
+
+#############################################################################
+# Figures
 class Fig:
+    """3D figure of point clouds and boxes.
 
-    @staticmethod
-    def show(block=True):
-        t_start = time.clock()
-        plt.show(block)
-        t_end = time.clock()
-        print('Display time: %f [s]' % (t_end - t_start))
-
-    def __init__(self, title=None, figsize=(16, 9), projection='3d'):
-        self.fig = plt.figure(figsize=figsize)
-        self.ax = self.fig.add_subplot(111, projection=projection)
-
-        if title is not None:
-            self.ax.set_title(title)
-
-        self.ax.set_xlabel('X')
-        self.ax.set_ylabel('Y')
-        self.ax.set_zlabel('Z')
+    The points and boxes are recorded as they are added, and drawn when the
+    figure is shown or saved, each cloud with a single call:
+        * on screen, or in a PNG file (or any format known to matplotlib),
+          as a 3D scatter plot, or above raster_threshold points in total
+          as the density of the points projected on the XY, XZ and YZ
+          planes,
+        * in an interactive HTML file, with plotly, above raster_threshold
+          points as voxel splats.
+    """
+
+    def __init__(self, title=None, figsize=(16, 9), raster_threshold=200000,
+                 splat_bins=64):
+        self.title = title
+        self.figsize = figsize
+        self.raster_threshold = raster_threshold
+        self.splat_bins = splat_bins
+        self.points = []
+        self.boxes = []
         self.colors = None
 
-    def create_colors(self, num_points):
-        self.colors = iter(cm.rainbow(np.linspace(0, 1, num_points)))
+    def create_colors(self, num_colors):
+        self.colors = iter(rainbow(num_colors))
 
     def next_color(self):
-        return self.colors.next()
+        return next(self.colors)
 
     def plot_mbb(self, rect, linecolor='red', linestyle="-"):
-        """ Given pyplot axes, draws rectangle (rect) on it.
+        """Draws the edges of the box rect."""
+        self.boxes.append((rect, linecolor, linestyle))
+
+    def add_points(self, points, label=None, color=None, s=1, labels=None):
+        """Adds a point cloud, drawn at once.
+
+            :param points:  (n, 3) array, or list of Solr documents
+            :param label:   name of the cloud, shown in the legend
+            :param color:   color of the cloud, or one per point
+            :param s:       size of the points, or one per point
+            :param labels:  n labels, the points are then colored per label
         """
+        c = to_array(points)
+        if len(c) == 0:
+            return
+        if labels is not None:
+            labels = np.asarray(labels)
+        elif color is None:
+            color = 'green'
+        self.points.append(_Points(c, label, labels, color, s))
+
+    def count(self):
+        return sum([len(p.coordinates) for p in self.points])
+
+    @staticmethod
+    def _label_colors(labels):
+        names, codes = np.unique(labels, return_inverse=True)
+        return names, rainbow(len(names)), codes
+
+    @staticmethod
+    def _edges(rect):
+        lo, hi = rect
+        corners = [[[lo, hi][(i >> d) & 1][d] for d in [0, 1, 2]]
+                   for i in range(8)]
+        return [(corners[i], corners[i | (1 << d)])
+                for i in range(8) for d in [0, 1, 2] if not i & (1 << d)]
+
+    #########################################################################
+    # matplotlib rendering
+    def _render_scatter(self, fig):
+        ax = fig.add_subplot(111, projection='3d')
+        ax.set_xlabel('X')
+        ax.set_ylabel('Y')
+        ax.set_zlabel('Z')
+
+        legend = False
+        for p in self.points:
+            c = p.coordinates
+            color = p.color
+            if p.labels is not None:
+                names, colors, codes = self._label_colors(p.labels)
+                color = colors[codes]
+                # Legend entries, unless there are too many labels
+                if len(names) <= 20:
+                    for n, lc in zip(names, colors):
+                        ax.scatter([], [], zs=[], color=lc, label=str(n))
+                    legend = True
+            ax.scatter(c[:, 0], c[:, 1], zs=c[:, 2], color=color, s=p.s,
+                       label=p.label, depthshade=False)
+            legend |= p.label is not None
+
+        for rect, color, style in self.boxes:
+            ax.scatter(*[[rect[i][d] for i in [0, 1]] for d in [0, 1]],
+                       zs=[rect[0][2], rect[1][2]], color=color, s=10)
+            for a, b in self._edges(rect):
+                ax.plot([a[0], b[0]], [a[1], b[1]], zs=[a[2], b[2]],
+                        color=color, linestyle=style)
+
+        if legend:
+            ax.legend()
+        return ax
+
+    def _render_density(self, fig):
+        from matplotlib.colors import LogNorm
+
+        c = np.concatenate([p.coordinates for p in self.points])
+        for i, (u, v) in enumerate([(0, 1), (0, 2), (1, 2)]):
+            ax = fig.add_subplot(1, 3, i + 1)
+            counts, xe, ye = np.histogram2d(c[:, u], c[:, v], bins=512)
+            ax.imshow(counts.T, origin='lower', aspect='auto',
+                      extent=[xe[0], xe[-1], ye[0], ye[-1]],
+                      norm=LogNorm(vmin=1, vmax=max(counts.max(), 1)),
+                      cmap='viridis', interpolation='nearest')
+            for rect, color, style in self.boxes:
+                ax.plot([rect[0][u], rect[1][u], rect[1][u], rect[0][u],
+                         rect[0][u]],
+                        [rect[0][v], rect[0][v], rect[1][v], rect[1][v],
+                         rect[0][v]], color=color, linestyle=style)
+            ax.set_xlabel('XYZ'[u])
+            ax.set_ylabel('XYZ'[v])
+            ax.set_title('%d points' % len(c) if i == 1 else '')
+
+    def _render(self):
+        plt = pyplot()
+        fig = plt.figure(figsize=self.figsize)
+        if self.count() > self.raster_threshold:
+            self._render_density(fig)
+        else:
+            self._render_scatter(fig)
+        if self.title is not None:
+            fig.suptitle(self.title)
+        return fig
+
+    #########################################################################
+    # plotly rendering
+    def _write_html(self, path):
+        go = plotly()
+        raster = self.count() > self.raster_threshold
+        traces = []
+
+        for p in self.points:
+            c = p.coordinates
+            marker = {'size': 2}
+            if raster:
+                c, counts = splat(c, self.splat_bins)
+                marker = {'size': 2 + 6 * counts / float(counts.max()),
+                          'color': np.log1p(counts), 'colorscale': 'Viridis'}
+            elif p.labels is not None:
+                names, colors, codes = self._label_colors(p.labels)
+                marker['color'] = ['rgb(%d,%d,%d)' % tuple(255 * lc[:3])
+                                   for lc in colors[codes]]
+            elif isinstance(p.color, str):
+                marker['color'] = p.color
+
+            traces.append(go.Scatter3d(x=c[:, 0], y=c[:, 1], z=c[:, 2],
+                                       mode='markers', marker=marker,
+                                       name=p.label))
+
+        for rect, color, style in self.boxes:
+            x, y, z = [], [], []
+            for a, b in self._edges(rect):
+                x += [a[0], b[0], None]
+                y += [a[1], b[1], None]
+                z += [a[2], b[2], None]
+            traces.append(go.Scatter3d(
+                x=x, y=y, z=z, mode='lines', showlegend=False,
+                line={'color': color,
+                      'dash': 'dot' if style == 'dotted' else
+                      'dash' if style == 'dashed' else 'solid'}))
+
+        fig = go.Figure(data=traces)
+        fig.update_layout(title=self.title, scene={
+            'xaxis_title': 'X', 'yaxis_title': 'Y', 'zaxis_title': 'Z'})
+        fig.write_html(path)
+
+    #########################################################################
+    # Output
+    def save(self, path, dpi=100):
+        """Writes the figure to path, as interactive HTML when path ends
+        with .html, otherwise in the image format of its extension."""
+        t_start = time.time()
+        if path.lower().endswith('.html'):
+            self._write_html(path)
+        else:
+            fig = self._render()
+            fig.savefig(path, dpi=dpi)
+            pyplot().close(fig)
+        print('Render time: %f [s], %s' % (time.time() - t_start, path))
+
+    def show(self, block=True, path=None):
+        """Shows the figure, or saves it to path. Without a display, the
+        figure is saved to <title>.png when no path is given."""
+        if path is None and not interactive():
+            path = '%s.png' % ''.join([c if c.isalnum() or c in '-_.' else '_'
+                                       for c in self.title or 'figure'])
+        if path is not None:
+            self.save(path)
+            return
 
-        xlo = rect[0][0]
-        ylo = rect[0][1]
-        zlo = rect[0][2]
-        xhi = rect[1][0]
-        yhi = rect[1][1]
-        zhi = rect[1][2]
-        # x_ext = rect[3] - rect[0]
-        # y_ext = rect[4] - rect[1]
-        # z_ext = rect[5] - rect[2]
-
-        self.ax.scatter(xlo, ylo, zs=zlo, color=linecolor, s=10)
-        self.ax.scatter(xhi, yhi, zs=zhi, color=linecolor, s=10)
-
-        self.ax.plot([xlo, xhi], [ylo, ylo], zs=[zlo, zlo], color=linecolor,
-                     linestyle=linestyle)
-        self.ax.plot([xlo, xlo], [ylo, yhi], zs=[zlo, zlo], color=linecolor,
-                     linestyle=linestyle)
-        self.ax.plot([xlo, xlo], [ylo, ylo], zs=[zlo, zhi], color=linecolor,
-                     linestyle=linestyle)
-
-        self.ax.plot([xhi, xlo], [yhi, yhi], zs=[zhi, zhi], color=linecolor,
-                     linestyle=linestyle)
-        self.ax.plot([xhi, xhi], [yhi, ylo], zs=[zhi, zhi], color=linecolor,
-                     linestyle=linestyle)
-        self.ax.plot([xhi, xhi], [yhi, yhi], zs=[zhi, zlo], color=linecolor,
-                     linestyle=linestyle)
-
-        self.ax.plot([xlo, xlo], [yhi, ylo], zs=[zhi, zhi], color=linecolor,
-                     linestyle=linestyle)
-        self.ax.plot([xhi, xlo], [yhi, yhi], zs=[zlo, zlo], color=linecolor,
-                     linestyle=linestyle)
-        self.ax.plot([xhi, xlo], [ylo, ylo], zs=[zhi, zhi], color=linecolor,
-                     linestyle=linestyle)
-
-        self.ax.plot([xlo, xlo], [yhi, yhi], zs=[zlo, zhi], color=linecolor,
-                     linestyle=linestyle)
-        self.ax.plot([xhi, xhi], [ylo, ylo], zs=[zlo, zhi], color=linecolor,
-                     linestyle=linestyle)
-        self.ax.plot([xhi, xhi], [ylo, yhi], zs=[zlo, zlo], color=linecolor,
-                     linestyle=linestyle)
-
-    def add_points(self, points, label=None, color='green', s=1):
-        for p in points:
-            # print("%f, %f, %f" % (p['geometry.coordinates_0___pdouble'],
-            #                      p['geometry.coordinates_1___pdouble'],
-            #                      p['geometry.coordinates_2___pdouble']))
-
-            self.ax.scatter(p['geometry.coordinates_0___pdouble'],
-                            p['geometry.coordinates_1___pdouble'],
-                            zs=p['geometry.coordinates_2___pdouble'],
-                            color=color, s=s)
-
-        p = points[0]
-        if label is not None:
-            self.ax.scatter(p['geometry.coordinates_0___pdouble'],
-                            p['geometry.coordinates_1___pdouble'],
-                            zs=p['geometry.coordinates_2___pdouble'],
-                            color=color,
-                            s=s, label=label)
-            self.ax.legend()
+        t_start = time.time()
+        self._render()
+        pyplot().show(block=block)
+        print('Display time: %f [s]' % (time.time() - t_start))
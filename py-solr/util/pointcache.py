@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+
+#############################################################################
+# Memory-mapped local point cache
+COORDINATES = ['geometry.coordinates_%d___pdouble' % d for d in [0, 1, 2]]
+
+
+class Points:
+    """Columnar set of points: coordinates as a (N, 3) float64 array and the
+    OIDs dictionary encoded, codes being indices in oids.
+
+    Arrays loaded from the cache are memory mapped, read-only.
+    """
+
+    def __init__(self, coordinates, codes, oids):
+        self.coordinates = coordinates
+        self.codes = codes
+        self.oids = oids
+
+    def __len__(self):
+        return self.coordinates.shape[0]
+
+    def labels(self):
+        """Decoded OIDs, one per point."""
+        return np.asarray(self.oids, dtype=object)[self.codes]
+
+    def box_mask(self, mbb):
+        """Boolean mask of the points within mbb, bounds included, like the
+        Solr range queries."""
+        lo = np.asarray(mbb[0], dtype=np.float64)
+        hi = np.asarray(mbb[1], dtype=np.float64)
+        c = self.coordinates
+        return np.all((c >= lo) & (c <= hi), axis=1)
+
+    def box(self, mbb):
+        """Points within mbb, bounds included."""
+        return self.select(self.box_mask(mbb))
+
+    def select(self, mask):
+        return Points(self.coordinates[mask], self.codes[mask], self.oids)
+
+
+class PointCache:
+    """Local on-disk cache of query results, one folder per query:
+
+        coordinates.npy (N, 3) float64, C order
+        codes.npy       (N,) int32, index of the OID of each point
+        meta.json       index version, query, number of points, OIDs
+
+    The files are exported once, then memory mapped on every read, so reads
+    are served zero-copy from the page cache. Each read re-validates the
+    export against the index version of the core, and exports again if the
+    index changed.
+    """
+
+    def __init__(self, solr, folder, page_size=100000):
+        self.solr = solr
+        self.folder = folder
+        self.page_size = page_size
+        self.lock = threading.Lock()
+
+    def _path(self, core, filters):
+        digest = hashlib.sha1(json.dumps(filters, sort_keys=True)
+                              .encode('utf-8')).hexdigest()
+        return os.path.join(self.folder, core, digest)
+
+    def export(self, core, version=None, **filters):
+        """Exports the points of core matching filters, see Solr.query(),
+        regardless of what is already cached."""
+        if version is None:
+            version = self.solr.index_version(core)
+
+        path = self._path(core, filters)
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        if os.path.isdir(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(tmp)
+
+        fl = ','.join(['properties.id'] + COORDINATES)
+        count = self.solr.query_cardinality(core, **filters)
+
+        coordinates = np.lib.format.open_memmap(
+            os.path.join(tmp, 'coordinates.npy'), mode='w+',
+            dtype=np.float64, shape=(count, 3))
+        codes = np.lib.format.open_memmap(
+            os.path.join(tmp, 'codes.npy'), mode='w+', dtype=np.int32,
+            shape=(count,))
+
+        # Deep paging with a cursor, sorted on the unique key
+        dictionary = {}
+        oids = []
+        n = 0
+        cursor = '*'
+        while n < count:
+            rsp = self.solr.query(core, fl=fl, rows=self.page_size,
+                                  indent='off',
+                                  params=self.solr.cursor_params(core,
+                                                                 cursor),
+                                  **filters)
+            docs = rsp['response']['docs'][:count - n]
+            if not docs:
+                break
+
+            for i, c in enumerate(COORDINATES):
+                coordinates[n:n + len(docs), i] = [d[c] for d in docs]
+
+            page_codes = []
+            for d in docs:
+                oid = d['properties.id']
+                code = dictionary.get(oid)
+                if code is None:
+                    code = dictionary[oid] = len(oids)
+                    oids.append(oid)
+                page_codes.append(code)
+            codes[n:n + len(docs)] = page_codes
+
+            n += len(docs)
+            if rsp.get('nextCursorMark', cursor) == cursor:
+                break
+            cursor = rsp['nextCursorMark']
+
+        coordinates.flush()
+        codes.flush()
+        del coordinates, codes
+
+        with open(os.path.join(tmp, 'meta.json'), 'w') as fd:
+            json.dump({'core': core, 'version': version, 'filters': filters,
+                       'count': n, 'oids': oids}, fd)
+
+        with self.lock:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            os.rename(tmp, path)
+
+        return self._load(path)
+
+    def _load(self, path):
+        with open(os.path.join(path, 'meta.json'), 'r') as fd:
+            meta = json.load(fd)
+
+        n = meta['count']
+        coordinates = np.load(os.path.join(path, 'coordinates.npy'),
+                              mmap_mode='r')[:n]
+        codes = np.load(os.path.join(path, 'codes.npy'), mmap_mode='r')[:n]
+
+        return meta, Points(coordinates, codes, meta['oids'])
+
+    def get(self, core, **filters):
+        """Returns the points of core matching filters, from the cache when
+        it is up to date with the index, exporting them otherwise."""
+        version = self.solr.index_version(core)
+        path = self._path(core, filters)
+
+        if os.path.exists(os.path.join(path, 'meta.json')):
+            meta, points = self._load(path)
+            if meta['version'] == version:
+                return points
+
+        return self.export(core, version, **filters)[1]
+
+    def space(self, core, reference_space):
+        """Returns all the points of a reference space."""
+        return self.get(core, reference_space=reference_space)
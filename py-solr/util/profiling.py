@@ -0,0 +1,142 @@
+import os
+import signal
+import tracemalloc
+
+from contextlib import contextmanager
+
+
+#############################################################################
+# Client-side profiling
+class Profiler:
+    """Sampling CPU profiler and memory tracker, per query type.
+
+    The call stacks are sampled every `interval` seconds of CPU time
+    consumed by the process (SIGPROF), so time spent waiting for the server
+    is not accounted for: the samples measure the client overhead only. The
+    peak of memory allocated by Python is tracked with tracemalloc.
+
+    Only the main thread of a process is sampled, which is where the
+    benchmark processes run the queries.
+    """
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.stacks = {}
+        self.peaks = {}
+        self.label = None
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append('%s:%s' % (os.path.basename(code.co_filename),
+                                    code.co_name))
+            frame = frame.f_back
+        stack.reverse()
+
+        folded = ';'.join(stack)
+        counts = self.stacks.setdefault(self.label, {})
+        counts[folded] = counts.get(folded, 0) + 1
+
+    def start(self, label):
+        self.label = label
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.clear_traces()
+        tracemalloc.reset_peak()
+
+        signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+        peak = tracemalloc.get_traced_memory()[1]
+        self.peaks[self.label] = max(peak, self.peaks.get(self.label, 0))
+        self.label = None
+
+    @contextmanager
+    def profile(self, label):
+        self.start(label)
+        try:
+            yield self
+        finally:
+            self.stop()
+
+    def state(self):
+        """Returns the collected data, (stacks, peaks), to send it back from
+        a worker process."""
+        return self.stacks, self.peaks
+
+
+@contextmanager
+def profile(profiler, label):
+    """Profiles the block if profiler is not None."""
+    if profiler is None:
+        yield None
+    else:
+        with profiler.profile(label):
+            yield profiler
+
+
+def merge(states):
+    """Aggregates the (stacks, peaks) of several processes.
+
+    Samples are summed, for the memory both the largest and the total of the
+    per-process peaks are kept.
+
+        :return: (stacks, peaks) with peaks: label -> (max, sum)
+    """
+    stacks = {}
+    peaks = {}
+    for s, p in states:
+        for label, counts in s.items():
+            merged = stacks.setdefault(label, {})
+            for stack, count in counts.items():
+                merged[stack] = merged.get(stack, 0) + count
+
+        for label, peak in p.items():
+            m, t = peaks.get(label, (0, 0))
+            peaks[label] = (max(m, peak), t + peak)
+
+    return stacks, peaks
+
+
+def write(folder, stacks, peaks, interval=0.001):
+    """Writes one flamegraph-compatible folded stacks file per label,
+    <label>.folded, and a summary of the CPU and memory usage, profile.csv.
+
+    Returns the summary as a list of (label, cpu seconds, max peak bytes,
+    total peak bytes).
+    """
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    summary = []
+    for label in sorted(stacks.keys()):
+        with open(os.path.join(folder, '%s.folded' % label), 'w') as fd:
+            for stack in sorted(stacks[label].keys()):
+                fd.write('%s %d\n' % (stack, stacks[label][stack]))
+
+    for label in sorted(set(stacks.keys()) | set(peaks.keys())):
+        cpu = sum(stacks.get(label, {}).values()) * interval
+        m, t = peaks.get(label, (0, 0))
+        summary.append((label, cpu, m, t))
+
+    with open(os.path.join(folder, 'profile.csv'), 'w') as fd:
+        fd.write('query,cpu seconds,max peak bytes,total peak bytes\n')
+        for s in summary:
+            fd.write('%s,%f,%d,%d\n' % s)
+
+    return summary
+
+
+def print_summary(summary):
+    # The lines are prefixed, so they are not mistaken for timings when the
+    # output of the benchmarks is parsed.
+    print("")
+    print("Profile,query,cpu seconds,max peak bytes,total peak bytes")
+    for s in summary:
+        print("P,%s,%f,%d,%d" % s)
@@ -0,0 +1,104 @@
+import fcntl
+import json
+import os
+import threading
+
+from urllib.parse import urlencode, parse_qsl
+
+
+#############################################################################
+# Query log
+#
+# One request per line, tab separated:
+#   start  latency  status  bytes  method  endpoint  parameters
+#
+# start is the UNIX timestamp at which the request was sent and latency the
+# time to get the whole response, both in seconds. For GET requests,
+# parameters are URL encoded, for POST requests this is the JSON payload.
+class QueryLog:
+    """Append-only log of the requests sent to Solr."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        # Unbuffered appends, each record written with a single write()
+        # while holding an exclusive lock on the file, so concurrent
+        # processes appending to the same file do not interleave partial
+        # records, whatever their size. Local filesystems only, flock() is
+        # not reliable over NFS.
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                          0o644)
+
+    def record(self, method, endpoint, params, start, latency, status, size):
+        if method == 'GET':
+            p = urlencode(params if params is not None else [])
+        else:
+            p = json.dumps(params, separators=(',', ':'))
+
+        line = ('%.6f\t%.6f\t%d\t%d\t%s\t%s\t%s\n' %
+                (start, latency, status, size, method, endpoint, p))\
+            .encode('utf-8')
+
+        with self.lock:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                while line:
+                    line = line[os.write(self.fd, line):]
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def close(self):
+        with self.lock:
+            os.close(self.fd)
+
+
+def read(path):
+    """Iterates over the records of a query log, as dictionaries."""
+    with open(path, 'r') as fd:
+        for line in fd:
+            fields = line.rstrip('\n').split('\t', 6)
+            if len(fields) != 7:
+                continue
+
+            method = fields[4]
+            if method == 'GET':
+                params = parse_qsl(fields[6], keep_blank_values=True)
+            else:
+                params = json.loads(fields[6])
+
+            yield {
+                'start': float(fields[0]),
+                'latency': float(fields[1]),
+                'status': int(fields[2]),
+                'bytes': int(fields[3]),
+                'method': method,
+                'endpoint': fields[5],
+                'params': params
+            }
+
+
+def classify(endpoint, params):
+    """Returns the type of a request, i.e. 'oid' or 'mbb' for select
+    queries, or the last part of the endpoint otherwise."""
+    if not endpoint.endswith('select'):
+        return endpoint.split('/')[-1]
+
+    if isinstance(params, dict):
+        params = list(params.items())
+
+    fqs = ' '.join([v for k, v in params if k == 'fq'])
+    if ('stats', 'true') in params:
+        return 'stats'
+    if ('facet', 'on') in params:
+        return 'facet'
+    if ' OR geometry.coordinates:' in fqs:
+        return 'labels'
+    if 'geometry.coordinates:' in fqs:
+        return 'mbb'
+    if '___pdouble:' in fqs:
+        return 'geometry'
+    if 'properties.id:' in fqs:
+        return 'oid'
+    if 'geometry.referenceSpace:' in fqs:
+        return 'space'
+    return 'select'
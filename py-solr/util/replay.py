@@ -0,0 +1,105 @@
+import queue
+import threading
+import time
+
+import requests
+
+import util.querylog as querylog
+
+
+#############################################################################
+# Query log replay
+def _retarget(endpoint, core):
+    # Replace the core name, the first component of the core endpoints.
+    if core is None or endpoint.startswith('admin/'):
+        return endpoint
+    return '%s/%s' % (core, endpoint.split('/', 1)[1])
+
+
+def _send(url, record):
+    endpoint = '%s/%s' % (url, record['endpoint'])
+    if record['method'] == 'GET':
+        return requests.get(endpoint, record['params'])
+    return requests.post(endpoint, json=record['params'],
+                         headers={'content-type': 'application/json',
+                                  'charset': 'utf-8'})
+
+
+def replay(url, records, speed=1.0, concurrency=1, core=None, writes=False):
+    """Re-issues recorded requests against a Solr server.
+
+    The requests are sent at their original inter-arrival times, divided by
+    speed, independently of how long the previous requests take (open loop).
+    With speed=None, the requests are sent as fast as the concurrency
+    allows (closed loop).
+
+        :param str url:         base url of the Solr server
+        :param records:         iterable of records, see util.querylog.read
+        :param float speed:     time scaling factor, 1.0 for the original
+                                rate, 2.0 for twice as fast, None for max
+        :param int concurrency: number of requests in flight, at most
+        :param str core:        replay against this core instead of the
+                                recorded one
+        :param bool writes:     replay POST requests as well, which modify
+                                the index. Disabled by default.
+        :return:                (elapsed, list of (type, latency, status,
+                                lag)), where lag is how late the request was
+                                sent compared to its schedule.
+    """
+    assert (concurrency > 0)
+
+    pending = queue.Queue(maxsize=0 if speed is not None else concurrency)
+    results = []
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            item = pending.get()
+            if item is None:
+                break
+
+            record, due = item
+            start = time.time()
+            try:
+                status = _send(url, record).status_code
+            except requests.RequestException:
+                status = 0
+            latency = time.time() - start
+
+            with lock:
+                results.append((querylog.classify(record['endpoint'],
+                                                  record['params']),
+                                latency, status,
+                                max(0.0, start - due) if due else 0.0))
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.daemon = True
+        t.start()
+
+    t0 = None
+    origin = time.time()
+    for record in records:
+        if record['method'] != 'GET' and not writes:
+            continue
+
+        record = dict(record)
+        record['endpoint'] = _retarget(record['endpoint'], core)
+
+        due = None
+        if speed is not None:
+            if t0 is None:
+                t0 = record['start']
+            due = origin + (record['start'] - t0) / speed
+            delay = due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+        pending.put((record, due))
+
+    for _ in threads:
+        pending.put(None)
+    for t in threads:
+        t.join()
+
+    return time.time() - origin, results
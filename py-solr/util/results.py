@@ -0,0 +1,208 @@
+import json
+import random
+import sqlite3
+import time
+
+import util.stat as stat
+
+
+#############################################################################
+# Benchmark results store
+_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created REAL NOT NULL,
+        benchmark TEXT NOT NULL,
+        core TEXT NOT NULL,
+        dataset_size INTEGER,
+        solr_version TEXT,
+        metadata TEXT NOT NULL
+    )''',
+    '''CREATE TABLE IF NOT EXISTS samples (
+        run_id INTEGER NOT NULL REFERENCES runs(id),
+        query TEXT NOT NULL,
+        timing REAL NOT NULL
+    )''',
+    '''CREATE INDEX IF NOT EXISTS samples_run ON samples (run_id, query)'''
+]
+
+
+class ResultStore:
+    """Local SQLite database of benchmark runs.
+
+    Each run records the timings of every query type, as well as the
+    metadata required to compare runs with each other: dataset size, core,
+    client settings and Solr version.
+    """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        for statement in _SCHEMA:
+            self.db.execute(statement)
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def add_run(self, benchmark, core, timings, metadata=None):
+        """Stores a run and returns its identifier.
+
+            :param str benchmark:   name of the benchmark, i.e. 'serial'
+            :param str core:        core the queries were run against
+            :param dict timings:    query label -> list of timings [s]
+            :param dict metadata:   free-form metadata, the 'dataset_size'
+                                    and 'solr_version' keys are also stored
+                                    in their own columns.
+            :return:                the run identifier
+        """
+        if metadata is None:
+            metadata = {}
+
+        c = self.db.cursor()
+        c.execute('INSERT INTO runs (created, benchmark, core, dataset_size, '
+                  'solr_version, metadata) VALUES (?, ?, ?, ?, ?, ?)',
+                  (time.time(), benchmark, core,
+                   metadata.get('dataset_size'),
+                   metadata.get('solr_version'),
+                   json.dumps(metadata, sort_keys=True)))
+        run_id = c.lastrowid
+
+        c.executemany('INSERT INTO samples (run_id, query, timing) '
+                      'VALUES (?, ?, ?)',
+                      [(run_id, q, t)
+                       for q in timings for t in timings[q]])
+        self.db.commit()
+
+        return run_id
+
+    def runs(self, benchmark=None, core=None):
+        """Lists the stored runs, oldest first, as a list of dictionaries."""
+        sql = 'SELECT id, created, benchmark, core, dataset_size, ' \
+              'solr_version FROM runs'
+        where = []
+        args = []
+        if benchmark is not None:
+            where.append('benchmark = ?')
+            args.append(benchmark)
+        if core is not None:
+            where.append('core = ?')
+            args.append(core)
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY id'
+
+        keys = ['id', 'created', 'benchmark', 'core', 'dataset_size',
+                'solr_version']
+        return [dict(zip(keys, r)) for r in self.db.execute(sql, args)]
+
+    def run(self, run_id):
+        """Returns (metadata, timings) for the given run."""
+        r = self.db.execute('SELECT benchmark, core, metadata FROM runs '
+                            'WHERE id = ?', (run_id,)).fetchone()
+        if r is None:
+            raise KeyError('No run with id %s' % run_id)
+
+        metadata = json.loads(r[2])
+        metadata['benchmark'] = r[0]
+        metadata['core'] = r[1]
+
+        timings = {}
+        for q, t in self.db.execute('SELECT query, timing FROM samples '
+                                    'WHERE run_id = ? ORDER BY rowid',
+                                    (run_id,)):
+            timings.setdefault(q, []).append(t)
+
+        return metadata, timings
+
+
+def run_metadata(solr, core, **settings):
+    """Collects the metadata of a run from the Solr server.
+
+    The client settings (threads, repetitions, ...) are passed as keyword
+    arguments and stored as is.
+    """
+    metadata = dict(settings)
+    metadata['url'] = solr.service_url
+
+    index = solr.core_status(core, index_info=True)[core].get('index', {})
+    metadata['dataset_size'] = index.get('numDocs')
+    metadata['index_version'] = index.get('version')
+    metadata['index_size'] = index.get('sizeInBytes')
+
+    lucene = solr.system_info().get('lucene', {})
+    metadata['solr_version'] = lucene.get('solr-spec-version')
+
+    return metadata
+
+
+#############################################################################
+# Statistical comparison of runs
+def throughput(values):
+    # Queries per second, for a single client
+    return len(values) / float(sum(values))
+
+
+def bootstrap_ci(baseline, candidate, statistic, iterations=2000,
+                 confidence=0.95, seed=None):
+    """Bootstrap confidence interval of statistic(candidate) -
+    statistic(baseline).
+
+    Both samples are resampled independently, with replacement.
+
+        :return: (difference, low, high)
+    """
+    rnd = random.Random(seed)
+
+    diffs = []
+    for _ in range(iterations):
+        b = [rnd.choice(baseline) for _ in baseline]
+        c = [rnd.choice(candidate) for _ in candidate]
+        diffs.append(statistic(c) - statistic(b))
+    diffs.sort()
+
+    alpha = (1.0 - confidence) / 2.0
+    low = diffs[int(alpha * (iterations - 1))]
+    high = diffs[int((1.0 - alpha) * (iterations - 1))]
+
+    return statistic(candidate) - statistic(baseline), low, high
+
+
+def compare(baseline, candidate, iterations=2000, confidence=0.95,
+            threshold=0.05, seed=None):
+    """Compares two runs, per query type.
+
+    A regression is flagged when the confidence interval of the difference
+    excludes zero in the wrong direction, and the relative change is larger
+    than threshold, to ignore statistically significant but negligible
+    changes.
+
+        :param dict baseline:   query label -> list of timings
+        :param dict candidate:  query label -> list of timings
+        :return: list of dictionaries, one per query type found in both runs.
+    """
+    report = []
+    for q in sorted(set(baseline.keys()) & set(candidate.keys())):
+        b = baseline[q]
+        c = candidate[q]
+
+        entry = {'query': q, 'baseline_n': len(b), 'candidate_n': len(c)}
+
+        # Latency, higher is worse
+        base = stat.median(b)
+        diff, low, high = bootstrap_ci(b, c, stat.median, iterations,
+                                       confidence, seed)
+        entry['latency'] = (base, base + diff, low, high)
+        entry['latency_regression'] = \
+            low > 0 and diff > threshold * base
+
+        # Throughput, lower is worse
+        base = throughput(b)
+        diff, low, high = bootstrap_ci(b, c, throughput, iterations,
+                                       confidence, seed)
+        entry['throughput'] = (base, base + diff, low, high)
+        entry['throughput_regression'] = \
+            high < 0 and -diff > threshold * base
+
+        report.append(entry)
+
+    return report
@@ -0,0 +1,182 @@
+import itertools
+import json
+import uuid
+
+from util.summaries import iter_batches
+
+
+#############################################################################
+# Spatial routing of documents in SolrCloud
+#
+# Collections are created with the compositeId router, and router.field set
+# to the routing field of the documents, see Solr.collection_create(). The
+# value of the routing field is a three-level composite key:
+#
+#     <reference space>/<bits>!<i>.<j>.<k>/<cell bits>!<id>
+#
+# where (i, j, k) is the coarse cell of the point on a regular grid over
+# the universe. The top <bits> bits of the hash come from the reference
+# space, the next <cell bits> from the cell and the rest from the document
+# id, so the points of a reference space are spread over 1 / 2^bits of the
+# hash ring, and the points of a cell of that space over a contiguous
+# 1 / 2^(bits + cell bits) slice of it, held by a single shard.
+#
+# Queries are sent to the shards of the cells they overlap only, through
+# the _route_ parameter, whose keys are the first two levels of the
+# routing keys, <space>/<bits>!<cell>/<cell bits>!. Without a box, the
+# queries on a reference space use <space>/<bits>! instead. Box queries
+# without a reference space are routed to the cells of every reference
+# space loaded in the collection.
+#
+# Cell routing only narrows the shards when the slice of a reference space
+# spans several of them, that is when 2^bits is below the number of shards.
+#
+# The settings of the router are stored with the collection, as a user
+# property of its configuration, see save_settings() and load_router(), so
+# later loads and query clients use the same grid.
+SETTINGS_PROPERTY = 'spatial.routing.%s'
+
+
+def _escape(value):
+    # '!' and '/' are the separators of the composite keys
+    return value.replace('!', '_').replace('/', '_')
+
+
+class SpatialRouter:
+    """Computes the routing keys of the points, and the _route_ parameter
+    of the queries.
+
+        :param mbb:         universe, the grid is defined over it, points
+                            outside are routed to the closest cell
+        :param int cells:   number of cells of the grid, per dimension
+        :param int bits:    number of bits of the hash taken from the
+                            reference space, from 0 (placement by cell
+                            only) to 16
+        :param int cell_bits: number of bits of the hash taken from the
+                            cell, from 0 (placement by reference space
+                            only) to 16
+        :param int max_keys: above this number of overlapped cells, queries
+                            are routed by reference space only
+        :param str field:   name of the routing field
+        :param spaces:      reference spaces loaded in the collection, used
+                            to route box queries without reference space
+    """
+
+    def __init__(self, mbb=None, cells=4, bits=4, cell_bits=8, max_keys=64,
+                 field='route_s', spaces=None):
+        assert (0 <= bits <= 16)
+        assert (0 <= cell_bits <= 16)
+        self.mbb = mbb if mbb is not None else [[0., 0., 0.], [1., 1., 1.]]
+        self.cells = cells
+        self.bits = bits
+        self.cell_bits = cell_bits
+        self.max_keys = max_keys
+        self.field = field
+        self.spaces = sorted(spaces) if spaces is not None else []
+
+    def _index(self, d, v):
+        lo = self.mbb[0][d]
+        hi = self.mbb[1][d]
+        i = int((v - lo) / (hi - lo) * self.cells) if hi > lo else 0
+        return min(max(i, 0), self.cells - 1)
+
+    def cell(self, point):
+        return tuple([self._index(d, point[d]) for d in [0, 1, 2]])
+
+    def prefix(self, reference_space):
+        return '%s/%d!' % (_escape(reference_space), self.bits)
+
+    def _cell_prefix(self, reference_space, cell):
+        return '%s%d.%d.%d/%d!' % ((self.prefix(reference_space),) + cell +
+                                   (self.cell_bits,))
+
+    def key(self, reference_space, point, doc_id):
+        """Value of the routing field of a point."""
+        return self._cell_prefix(reference_space, self.cell(point)) + \
+            _escape(doc_id)
+
+    def keys(self, reference_space, mbb):
+        """Route keys of the cells of reference_space overlapping mbb."""
+        lo = self.cell(mbb[0])
+        hi = self.cell(mbb[1])
+        return [self._cell_prefix(reference_space, c)
+                for c in itertools.product(
+                    *[range(lo[d], hi[d] + 1) for d in [0, 1, 2]])]
+
+    def route(self, reference_space, mbb=None):
+        """Value of the _route_ parameter of a query, None when it has to be
+        sent to all the shards."""
+        if reference_space is None:
+            if mbb is None or not self.spaces:
+                return None
+            keys = []
+            for space in self.spaces:
+                keys += self.keys(space, mbb)
+                if len(keys) > self.max_keys:
+                    return None
+            return ','.join(keys)
+
+        if mbb is not None:
+            keys = self.keys(reference_space, mbb)
+            if len(keys) <= self.max_keys:
+                return ','.join(keys)
+
+        return self.prefix(reference_space)
+
+    def settings(self):
+        return {'mbb': self.mbb, 'cells': self.cells, 'bits': self.bits,
+                'cell_bits': self.cell_bits, 'max_keys': self.max_keys,
+                'field': self.field, 'spaces': self.spaces}
+
+
+def save_settings(solr, collection, router):
+    """Stores the settings of router with collection."""
+    solr.user_property_set(collection, SETTINGS_PROPERTY % collection,
+                           json.dumps(router.settings()))
+
+
+def load_router(solr, collection):
+    """SpatialRouter of collection, as stored by save_settings(), None when
+    the collection is not routed spatially."""
+    value = solr.user_properties(collection).get(
+        SETTINGS_PROPERTY % collection)
+    if value is None:
+        return None
+    return SpatialRouter(**json.loads(value))
+
+
+def load(solr, collection, data_file, router, batch=10000, commit=True):
+    """Loads a GeoJSON-like file, as written by generate_rnd_uniform.py, in
+    collection, adding the routing field to every document.
+
+    The documents are flattened the way index_spatial_json() does it with
+    split=/, as the routing field has to be set on the client side.
+    """
+    loaded = set()
+    count = 0
+    for labels, spaces, coordinates in iter_batches(data_file, batch):
+        docs = []
+        for l, s, c in zip(labels, spaces, coordinates.tolist()):
+            doc_id = uuid.uuid4().hex
+            docs.append({
+                'id': doc_id,
+                'type': 'Feature',
+                'geometry.type': 'Point',
+                'geometry.referenceSpace': s,
+                'geometry.coordinates': ['%r,%r,%r' % tuple(c)],
+                'properties.id': l,
+                router.field: router.key(s, c, doc_id)
+            })
+        solr.index_docs(collection, docs, commit=False)
+        loaded.update(spaces)
+        count += len(labels)
+
+    if commit:
+        solr.commit(collection)
+
+    # Box queries without reference space are routed to the cells of every
+    # loaded reference space
+    router.spaces = sorted(set(router.spaces) | loaded)
+    save_settings(solr, collection, router)
+
+    return count
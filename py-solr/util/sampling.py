@@ -0,0 +1,138 @@
+import json
+import random
+
+from concurrent.futures import ThreadPoolExecutor
+
+from util.catalog import histogram_facet, parse_histogram
+from util.export import box_fq
+from util.lod import extent
+
+
+#############################################################################
+# Server-side random sampling
+def allocate(counts, k):
+    """Splits k samples over strata of the given sizes, proportionally to
+    their size, rounding with the largest remainders. When k allows it,
+    every stratum gets at least one sample."""
+    strata = [s for s in counts if counts[s] > 0]
+    alloc = dict([(s, 0) for s in counts])
+
+    if k < len(strata):
+        # Fewer samples than strata, the largest ones get one each
+        for s in sorted(strata, key=lambda s: -counts[s])[:k]:
+            alloc[s] = 1
+        return alloc
+
+    # One each, the rest proportionally to what is left
+    for s in strata:
+        alloc[s] = 1
+    sizes = dict([(s, counts[s] - 1) for s in strata])
+    total = sum(sizes.values())
+    k = min(k - len(strata), total)
+    if k == 0:
+        return alloc
+
+    quotas = dict([(s, k * sizes[s] / float(total)) for s in strata])
+    for s in strata:
+        alloc[s] += int(quotas[s])
+    left = k - sum([int(quotas[s]) for s in strata])
+    for s in sorted(strata, key=lambda s: int(quotas[s]) - quotas[s])[:left]:
+        alloc[s] += 1
+    return alloc
+
+
+def _label_counts(solr, core, **filters):
+    rsp = solr.query(core, rows=0, indent='off',
+                     params=[('facet', 'on'), ('facet.field', 'properties.id'),
+                             ('facet.limit', '-1'), ('facet.mincount', '1')],
+                     **filters)
+    values = rsp['facet_counts']['facet_fields']['properties.id']
+    return rsp['response']['numFound'], dict(zip(values[::2], values[1::2]))
+
+
+def _cell_counts(solr, core, cells, mbb, **filters):
+    """Number of points per cell of a cells^3 grid over mbb, or over the
+    MBB of the matching points, as (total, {cell: count}, {cell: fq})."""
+    if mbb is None:
+        mbb = extent(solr, core, **filters)
+    else:
+        filters['mbb'] = mbb
+    if mbb is None:
+        return 0, {}, {}
+
+    rsp = solr.query(core, rows=0, indent='off',
+                     params=[('json.facet',
+                              json.dumps(histogram_facet(mbb, cells)))],
+                     **filters)
+    counts = parse_histogram(rsp.get('facets', {}), cells)
+
+    size = [(mbb[1][d] - mbb[0][d]) / float(cells) for d in [0, 1, 2]]
+    strata = {}
+    fqs = {}
+    for index, count in enumerate(counts):
+        if count == 0:
+            continue
+        c = [index // (cells * cells), (index // cells) % cells,
+             index % cells]
+        name = '%d,%d,%d' % tuple(c)
+        box = [[mbb[0][d] + c[d] * size[d] for d in [0, 1, 2]],
+               [mbb[1][d] if c[d] == cells - 1 else
+                mbb[0][d] + (c[d] + 1) * size[d] for d in [0, 1, 2]]]
+        strata[name] = count
+        fqs[name] = ' AND '.join(box_fq(box, mbb))
+    return sum(counts), strata, fqs
+
+
+def sample(solr, core, k, seed=None, stratify=None, cells=4, mbb=None,
+           fl=None, workers=8, **filters):
+    """See Solr.sample()."""
+    assert (stratify in [None, 'label', 'cell'])
+    if seed is None:
+        seed = random.randrange(1 << 31)
+    order = 'random_%d asc' % seed
+    result = {'seed': seed, 'strata': None}
+
+    if stratify is None:
+        if mbb is not None:
+            filters['mbb'] = mbb
+        rsp = solr.query(core, fl=fl, rows=k, indent='off',
+                         params=[('sort', order)], **filters)
+        result['numFound'] = rsp['response']['numFound']
+        result['docs'] = rsp['response']['docs']
+        return result
+
+    if stratify == 'label':
+        if mbb is not None:
+            filters['mbb'] = mbb
+        total, counts = _label_counts(solr, core, **filters)
+        fqs = dict([(s, 'properties.id:"%s"' % s.replace('"', '\\"'))
+                    for s in counts])
+    else:
+        total, counts, fqs = _cell_counts(solr, core, cells, mbb, **filters)
+        if mbb is not None:
+            filters['mbb'] = mbb
+
+    alloc = allocate(counts, k)
+    result['numFound'] = total
+    result['strata'] = dict([(s, {'count': counts[s], 'sampled': 0})
+                             for s in counts])
+    result['docs'] = []
+
+    # One request per sampled stratum, of exactly its allocation, so about
+    # k documents are transferred in total, whatever the number of strata
+    def fetch(s):
+        rsp = solr.query(core, fl=fl, rows=alloc[s], indent='off',
+                         params=[('sort', order), ('fq', fqs[s])],
+                         **filters)
+        return rsp['response']['docs']
+
+    sampled = sorted([s for s in alloc if alloc[s] > 0])
+    if not sampled:
+        return result
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(sampled))) as pool:
+        for s, docs in zip(sampled, pool.map(fetch, sampled)):
+            result['strata'][s]['sampled'] = len(docs)
+            result['docs'] += docs
+
+    return result
@@ -0,0 +1,136 @@
+import asyncio
+import threading
+
+
+#############################################################################
+# Coalescing of identical concurrent calls
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Collapses identical concurrent calls into a single one.
+
+    The first caller for a given key executes the function, the callers
+    arriving while it is in flight wait for it and share its result, or its
+    exception. Once the call is done, the next caller executes the function
+    again: nothing is cached.
+
+    do() returns the result and whether the caller was the leader, i.e.
+    executed the function. The leader gets the object returned by the
+    function, the followers share share(result) when share is given, made
+    once by the leader before they are released and only if some of them
+    waited, so the leader can modify its result freely. The followers copy
+    the shared result before modifying it, as Solr.query() and
+    Solr.spatial_mbb() do.
+    """
+
+    def __init__(self, registry=None):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.executed = 0
+        self.collapsed = 0
+
+        self.metrics = None
+        if registry is not None:
+            self.metrics = (
+                registry.counter('solr_client_coalesced_executed',
+                                 'Calls actually executed'),
+                registry.counter('solr_client_coalesced_collapsed',
+                                 'Calls served by an identical call in '
+                                 'flight'))
+
+    def do(self, key, fn, share=None):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+                self.executed += 1
+            else:
+                call.waiters += 1
+                self.collapsed += 1
+
+        if self.metrics is not None:
+            self.metrics[0 if leader else 1].inc()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, False
+
+        result = None
+        try:
+            result = call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+                waiters = call.waiters
+            # No follower can join once the call is removed
+            if waiters and share is not None and call.error is None:
+                call.result = share(result)
+            call.event.set()
+
+        return result, True
+
+    def stats(self):
+        with self.lock:
+            return {'executed': self.executed, 'collapsed': self.collapsed,
+                    'in_flight': len(self.calls)}
+
+
+class AsyncSingleFlight:
+    """asyncio flavour of SingleFlight, for coroutines sharing an event loop.
+
+    fn must return an awaitable, for example a Solr call run in an executor:
+
+        await group.do(key, lambda: loop.run_in_executor(
+            None, solr.query, core))
+    """
+
+    def __init__(self, registry=None):
+        self.calls = {}
+        self.executed = 0
+        self.collapsed = 0
+
+        self.metrics = None
+        if registry is not None:
+            self.metrics = (
+                registry.counter('solr_client_async_coalesced_executed',
+                                 'Calls actually executed'),
+                registry.counter('solr_client_async_coalesced_collapsed',
+                                 'Calls served by an identical call in '
+                                 'flight'))
+
+    async def do(self, key, fn):
+        future = self.calls.get(key)
+        if future is not None:
+            self.collapsed += 1
+            if self.metrics is not None:
+                self.metrics[1].inc()
+            # Shield the shared call from the cancellation of a waiter
+            return await asyncio.shield(future)
+
+        self.executed += 1
+        if self.metrics is not None:
+            self.metrics[0].inc()
+
+        future = asyncio.ensure_future(fn())
+        self.calls[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if self.calls.get(key) is future:
+                del self.calls[key]
+
+    def stats(self):
+        return {'executed': self.executed, 'collapsed': self.collapsed,
+                'in_flight': len(self.calls)}
@@ -0,0 +1,290 @@
+import json
+import os
+import struct
+
+import numpy as np
+
+
+#############################################################################
+# Streaming export sinks
+#
+# A sink receives the exported points batch by batch, through
+# write(coordinates, labels), coordinates being a (n, 3) float64 array and
+# labels a list of n OIDs, and writes them incrementally: only the current
+# batch and the OIDs dictionary are kept in memory.
+class Sink:
+    def __init__(self):
+        self.oids = []
+        self.codes = {}
+        self.count = 0
+
+    def encode(self, labels):
+        """Dictionary encodes labels, as an int32 array of codes."""
+        codes = np.empty(len(labels), dtype=np.int32)
+        for i, l in enumerate(labels):
+            c = self.codes.get(l)
+            if c is None:
+                c = self.codes[l] = len(self.oids)
+                self.oids.append(l)
+            codes[i] = c
+        return codes
+
+    def write(self, coordinates, labels):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+#############################################################################
+# NumPy .npy
+NPY_HEADER_SIZE = 128
+
+
+def _npy_header(dtype, shape):
+    """Version 1.0 .npy header of a fixed size, so it can be rewritten in
+    place once the final shape is known."""
+    header = repr({'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                   'fortran_order': False, 'shape': shape})
+    length = NPY_HEADER_SIZE - 10
+    assert (len(header) < length)
+    header = header + ' ' * (length - len(header) - 1) + '\n'
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', length) + \
+        header.encode('latin1')
+
+
+class _NpyWriter:
+    def __init__(self, path, dtype, columns=None):
+        self.dtype = np.dtype(dtype)
+        self.columns = columns
+        self.rows = 0
+        self.fd = open(path, 'wb')
+        self.fd.write(_npy_header(self.dtype, self._shape()))
+
+    def _shape(self):
+        if self.columns is None:
+            return (self.rows,)
+        return (self.rows, self.columns)
+
+    def append(self, array):
+        array = np.ascontiguousarray(array, dtype=self.dtype)
+        self.fd.write(array.tobytes())
+        self.rows += array.shape[0]
+
+    def close(self):
+        self.fd.seek(0)
+        self.fd.write(_npy_header(self.dtype, self._shape()))
+        self.fd.close()
+
+
+class NpySink(Sink):
+    """Writes the points in folder, with the layout of util.pointcache:
+    coordinates.npy, (N, 3) float64, codes.npy, (N,) int32, and the OIDs
+    dictionary in meta.json.
+
+    The arrays are appended to as the batches arrive, and their headers
+    rewritten with the final shape on close().
+    """
+
+    def __init__(self, folder):
+        Sink.__init__(self)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        self.folder = folder
+        self.coordinates = _NpyWriter(os.path.join(folder, 'coordinates.npy'),
+                                      np.float64, 3)
+        self.labels = _NpyWriter(os.path.join(folder, 'codes.npy'), np.int32)
+
+    def write(self, coordinates, labels):
+        self.coordinates.append(coordinates)
+        self.labels.append(self.encode(labels))
+        self.count += len(labels)
+
+    def close(self):
+        self.coordinates.close()
+        self.labels.close()
+        with open(os.path.join(self.folder, 'meta.json'), 'w') as fd:
+            json.dump({'count': self.count, 'oids': self.oids}, fd)
+
+
+#############################################################################
+# Binary PLY
+PLY_COUNT_WIDTH = 12
+
+
+class PlySink(Sink):
+    """Writes the points as the vertices of a binary little endian PLY
+    file, with x, y, z as doubles and the OID code as an int property. The
+    OIDs dictionary is written next to it, in <path>.oids.json.
+
+    The vertex count is written in a fixed-width field of the header, which
+    is patched on close().
+    """
+
+    def __init__(self, path):
+        Sink.__init__(self)
+        self.path = path
+        self.fd = open(path, 'wb')
+        self.fd.write(self._header())
+        self.dtype = np.dtype([('x', '<f8'), ('y', '<f8'), ('z', '<f8'),
+                               ('label', '<i4')])
+
+    def _header(self):
+        return ('ply\n'
+                'format binary_little_endian 1.0\n'
+                'comment OIDs dictionary in %s.oids.json\n'
+                'element vertex %s\n'
+                'property double x\n'
+                'property double y\n'
+                'property double z\n'
+                'property int label\n'
+                'end_header\n' %
+                (os.path.basename(self.path),
+                 str(self.count).ljust(PLY_COUNT_WIDTH))).encode('ascii')
+
+    def write(self, coordinates, labels):
+        vertices = np.empty(len(labels), dtype=self.dtype)
+        for d, name in enumerate(['x', 'y', 'z']):
+            vertices[name] = coordinates[:, d]
+        vertices['label'] = self.encode(labels)
+        self.fd.write(vertices.tobytes())
+        self.count += len(labels)
+
+    def close(self):
+        self.fd.seek(0)
+        self.fd.write(self._header())
+        self.fd.close()
+        with open(self.path + '.oids.json', 'w') as fd:
+            json.dump(self.oids, fd)
+
+
+#############################################################################
+# Arrow IPC and Parquet, requires pyarrow
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('The Arrow and Parquet sinks require pyarrow, '
+                          'see https://arrow.apache.org/docs/python/')
+    return pyarrow
+
+
+class ArrowSink(Sink):
+    """Writes the points as an Arrow IPC file (format='arrow') or a Parquet
+    file (format='parquet'), one record batch or row group per batch.
+
+    Columns: x, y, z as doubles, and label as the OID string, so the file
+    is self-describing. Parquet dictionary encodes the label column on its
+    own, and a dictionary column of the Arrow IPC file format could not
+    grow with the batches.
+    """
+
+    def __init__(self, path, format='parquet'):
+        assert (format in ['arrow', 'parquet'])
+        Sink.__init__(self)
+        self.pa = _pyarrow()
+        self.path = path
+        self.format = format
+        self.schema = self.pa.schema([
+            ('x', self.pa.float64()), ('y', self.pa.float64()),
+            ('z', self.pa.float64()), ('label', self.pa.string())])
+
+        if format == 'parquet':
+            self.writer = self.pa.parquet.ParquetWriter(path, self.schema)
+        else:
+            self.sink = self.pa.OSFile(path, 'wb')
+            self.writer = self.pa.ipc.new_file(self.sink, self.schema)
+
+    def write(self, coordinates, labels):
+        pa = self.pa
+        batch = pa.RecordBatch.from_arrays(
+            [pa.array(coordinates[:, d]) for d in [0, 1, 2]] +
+            [pa.array(labels, type=pa.string())],
+            schema=self.schema)
+
+        if self.format == 'parquet':
+            self.writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            self.writer.write_batch(batch)
+        self.count += len(batch)
+
+    def close(self):
+        self.writer.close()
+        if self.format == 'arrow':
+            self.sink.close()
+
+
+def open_sink(path):
+    """Sink matching the extension of path: .parquet, .arrow, .ply, and a
+    folder of .npy files otherwise."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.parquet':
+        return ArrowSink(path, 'parquet')
+    if ext in ['.arrow', '.feather']:
+        return ArrowSink(path, 'arrow')
+    if ext == '.ply':
+        return PlySink(path)
+    return NpySink(path)
+
+
+def read_sink(path):
+    """Reads back what the sink of path wrote, as (coordinates, labels)."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in ['.parquet', '.arrow', '.feather', '.ply']:
+        with open(os.path.join(path, 'meta.json'), 'r') as fd:
+            oids = json.load(fd)['oids']
+        coordinates = np.load(os.path.join(path, 'coordinates.npy'))
+        codes = np.load(os.path.join(path, 'codes.npy'))
+        return coordinates, [oids[c] for c in codes]
+
+    if ext == '.ply':
+        with open(path + '.oids.json', 'r') as fd:
+            oids = json.load(fd)
+        with open(path, 'rb') as fd:
+            data = fd.read()
+        end = data.index(b'end_header\n') + len(b'end_header\n')
+        vertices = np.frombuffer(data[end:], dtype=[
+            ('x', '<f8'), ('y', '<f8'), ('z', '<f8'), ('label', '<i4')])
+        coordinates = np.column_stack([vertices[a] for a in 'xyz'])
+        return coordinates, [oids[c] for c in vertices['label']]
+
+    pa = _pyarrow()
+    if ext == '.parquet':
+        table = pa.parquet.read_table(path)
+    else:
+        with pa.OSFile(path, 'rb') as fd:
+            table = pa.ipc.open_file(fd).read_all()
+    coordinates = np.column_stack([table.column(a).to_numpy()
+                                   for a in 'xyz'])
+    return coordinates, table.column('label').to_pylist()
+
+
+def check(path, batches=4, batch=1000, seed=0):
+    """Writes random batches, each one bringing new OIDs, with the sink of
+    path, reads them back and returns whether they are unchanged. Returns
+    None when the sink is not available, i.e. pyarrow is missing."""
+    try:
+        sink = open_sink(path)
+    except ImportError:
+        return None
+
+    rng = np.random.RandomState(seed)
+    coordinates = rng.uniform(-1.0, 1.0, (batches * batch, 3))
+    labels = ['oid-%d' % rng.randint((b + 1) * 10)
+              for b in range(batches) for _ in range(batch)]
+    with sink:
+        for b in range(batches):
+            s = slice(b * batch, (b + 1) * batch)
+            sink.write(coordinates[s], labels[s])
+
+    read_coordinates, read_labels = read_sink(path)
+    return bool(np.array_equal(read_coordinates, coordinates) and
+                read_labels == labels)
@@ -1,5 +1,18 @@
+import contextlib
+import io
 import json
+import os
 import requests
+import time
+import zipfile
+
+from util.balancer import Balancer
+from util.cache import ResultCache, copy
+from util.limiter import INTERACTIVE, QueueFull
+from util.querylog import QueryLog
+
+# Answers telling the server is overloaded, on top of the 5xx ones
+OVERLOADED = [requests.codes.too_many_requests]
 
 
 class Solr:
@@ -41,6 +54,16 @@ class Solr:
     def labels_to_q(labels):
         return ' OR '.join(['properties.id:%s' % l for l in labels])
 
+    @staticmethod
+    def labels_core(core):
+        """Name of the companion core holding the label summaries of core."""
+        return '%s_labels' % core
+
+    @staticmethod
+    def summary_to_mbb(summary):
+        return [[summary['min_%d_d' % d] for d in [0, 1, 2]],
+                [summary['max_%d_d' % d] for d in [0, 1, 2]]]
+
     @staticmethod
     def point_to_str(coordinate):
         assert (len(coordinate) > 0)
@@ -63,18 +86,146 @@ class Solr:
 
         return mbb_str
 
-    def __init__(self, url='', cloud_mode=False):
+    def __init__(self, url='', cloud_mode=False, query_log=None,
+                 metrics=None, cache=None, coalesce=None,
+                 label_summaries=False, backend=None, router=None,
+                 timeout=None, balancer=None, limiter=None,
+                 priority=INTERACTIVE, limiter_timeout=None,
+                 filter_optimizer=None):
+        """
+            :param url:             base url of the Solr server, or list of
+                                    base urls of replicas of the same data,
+                                    the queries are then balanced over them,
+                                    and the other requests sent to the
+                                    first one.
+            :param bool cloud_mode: SolrCloud deployment, the cores are
+                                    the collections of the cluster.
+            :param query_log:       path or QueryLog instance, when provided
+                                    every request is recorded, see
+                                    util.querylog.
+            :param metrics:         SolrMetrics instance, when provided the
+                                    requests are instrumented, see
+                                    util.metrics.
+            :param cache:           ResultCache instance, when provided the
+                                    results of query() are cached, see
+                                    util.cache.
+            :param coalesce:        SingleFlight instance, when provided
+                                    identical concurrent query(),
+                                    query_cardinality() and spatial_mbb()
+                                    calls share a single request and its
+                                    decoded result, see util.singleflight.
+            :param bool label_summaries:
+                                    use the label summary documents of the
+                                    companion core, see labels_core(), to
+                                    get the MBB of labels instead of
+                                    computing it, see util.summaries.
+            :param backend:         Backend instance, when provided
+                                    query(), query_cardinality(),
+                                    spatial_mbb() and list_field() calls
+                                    on the cores it serves are answered by
+                                    it instead of the server, see
+                                    util.backends.
+            :param router:          SpatialRouter instance, when provided
+                                    the box queries are only sent to the
+                                    shards holding the cells they overlap,
+                                    see util.routing.load_router().
+            :param float timeout:   timeout of the requests, in seconds,
+                                    None to wait forever.
+            :param balancer:        Balancer instance over the replicas, to
+                                    configure the balancing policy, the
+                                    health checks or the hedging, see
+                                    util.balancer.
+            :param limiter:         AdaptiveLimiter instance, possibly
+                                    shared between clients, when provided
+                                    it bounds the number of concurrent
+                                    requests, see util.limiter.
+            :param priority:        priority of the requests of this
+                                    client in the limiter queue,
+                                    util.limiter.INTERACTIVE or BULK.
+            :param float limiter_timeout:
+                                    maximum time spent in the limiter
+                                    queue, util.limiter.QueueFull is
+                                    raised after that.
+            :param filter_optimizer:
+                                    FilterOptimizer instance, when provided
+                                    the union of the labels MBBs of
+                                    query(labels=...) is simplified, and
+                                    canonicalized, see util.filters.
+        """
+        if balancer is None and isinstance(url, (list, tuple)):
+            balancer = Balancer(url)
+        if balancer is not None:
+            url = balancer.primary
         assert (url != '')
         self.service_url = url
+        self.balancer = balancer
         self.cloud_mode = cloud_mode
 
+        if query_log is not None and not isinstance(query_log, QueryLog):
+            query_log = QueryLog(query_log)
+        self.query_log = query_log
+        self.metrics = metrics
+        self.cache = cache
+        self.coalesce = coalesce
+        self.label_summaries = label_summaries
+        self.backend = backend
+        self.router = router
+        self.timeout = timeout
+        self.limiter = limiter
+        self.priority = priority
+        self.limiter_timeout = limiter_timeout
+        self.filter_optimizer = filter_optimizer
+        self.unique_keys = {}   # core -> name of its uniqueKey field
+
+    def _slot(self):
+        """Context holding a slot of the limiter during a request."""
+        if self.limiter is None:
+            return contextlib.nullcontext({'error': False})
+        return self.limiter.slot(self.priority, self.limiter_timeout)
+
+    def _backend_for(self, core):
+        if self.backend is not None and self.backend.serves(core):
+            return self.backend
+        return None
+
     #########################################################################
     # GET APIs
     #########################################################################
     def _get(self, endpoint, params, print_timing=False, verbose=False):
         """Execute a REST API call."""
 
-        r = requests.get('%s/%s' % (self.service_url, endpoint), params)
+        if self.metrics is not None:
+            self.metrics.started(endpoint)
+
+        start = time.time()
+        try:
+            with self._slot() as outcome:
+                if self.balancer is not None and endpoint.endswith('select'):
+                    # Only the queries are balanced over the replicas
+                    r = self.balancer.call(
+                        lambda base: requests.get(
+                            '%s/%s' % (base, endpoint), params,
+                            timeout=self.timeout),
+                        on_retry=None if self.metrics is None
+                        else lambda: self.metrics.retried(endpoint))
+                else:
+                    r = requests.get('%s/%s' % (self.service_url, endpoint),
+                                     params, timeout=self.timeout)
+                outcome['error'] = r.status_code >= 500 or \
+                    r.status_code in OVERLOADED
+        except (requests.RequestException, QueueFull) as e:
+            if self.metrics is not None:
+                self.metrics.failed(endpoint, e)
+            raise
+        latency = time.time() - start
+
+        if self.query_log is not None:
+            self.query_log.record('GET', endpoint, params, start, latency,
+                                  r.status_code, len(r.content))
+
+        if self.metrics is not None:
+            self.metrics.done('GET', endpoint, params, latency,
+                              r.status_code, len(r.content))
 
         if verbose or r.status_code != requests.codes.ok:
             print('get: %s : %s' % (r.url, r.status_code))
@@ -98,9 +249,7 @@ class Solr:
                   print_timing=False, verbose=False):
         """API Calls to a specific core."""
 
-        # if self.cloud_mode:
-        #     existing_cores = getClusterCollections()
-        # else:
+        # In cloud mode, these are the collections
         existing_cores = self.cores()
 
         if core not in existing_cores:
@@ -111,7 +260,11 @@ class Solr:
                          print_timing, verbose)
 
     def cores(self, verbose=False):
-        """Returns list of currently running (existing) cores."""
+        """Returns list of currently running (existing) cores, or of the
+        collections in cloud mode."""
+
+        if self.cloud_mode:
+            return self.collections(verbose)
 
         params = {
             'action': 'STATUS',
@@ -128,7 +281,7 @@ class Solr:
 
         return keys
 
-    def core_status(self, core=None, verbose=False):
+    def core_status(self, core=None, index_info=False, verbose=False):
         """The STATUS action returns the status of all running Solr cores, or
         status for only the named core.
 
@@ -136,11 +289,14 @@ class Solr:
         Otherwise, returns status of a named core:
 
             http://localhost:8983/solr/admin/cores?action=STATUS&core=core0
+
+        When index_info is True, the status of each core also contains the
+        'index' section (numDocs, version, segmentCount, sizeInBytes, ...).
         """
 
         params = {
             'action': 'STATUS',
-            'indexInfo': 'false',
+            'indexInfo': str(index_info).lower(),
             'wt': 'json'
         }
 
@@ -155,6 +311,31 @@ class Solr:
 
         return status
 
+    def index_version(self, core):
+        """Returns the version of the index of core, which changes with every
+        commit modifying the index."""
+
+        return self.core_status(core, index_info=True)[core]['index'][
+            'version']
+
+    def system_info(self, verbose=False):
+        """Returns the system information of the Solr server (versions, JVM,
+        memory, ...):
+
+            http://localhost:8983/solr/admin/info/system?wt=json
+        """
+
+        params = {
+            'wt': 'json'
+        }
+
+        if verbose:
+            print('Solr system_info:')
+
+        r = self._get('admin/info/system', params, verbose=verbose)
+
+        return r.json()
+
     # config_set='data_driven_schema_configs'
     def core_load(self, core, config_set='_default', verbose=False):
         """Creates a new core and registers it.
@@ -271,6 +452,178 @@ class Solr:
 
         self._get('admin/cores', params, verbose)
 
+    #########################################################################
+    # COLLECTION APIs (SolrCloud)
+    #########################################################################
+    def collections(self, verbose=False):
+        """Returns the list of the collections of the cluster."""
+
+        params = {
+            'action': 'LIST',
+            'wt': 'json'
+        }
+
+        r = self._get('admin/collections', params, verbose=verbose)
+
+        return r.json()['collections']
+
+    def collection_create(self, collection, shards=1, replicas=1,
+                          config_set='_default', router_field=None,
+                          max_shards_per_node=None, verbose=False):
+        """Creates a new collection, with the compositeId router:
+
+            http://localhost:8983/solr/admin/collections?action=CREATE&name=coll&numShards=2&replicationFactor=1&collection.configName=_default
+
+        When router_field is given, documents are placed according to the
+        value of that field instead of their id, see util.routing.
+
+        The config set must already be known by the cluster, see
+        configset_upload().
+        """
+
+        existing = self.collections(verbose)
+        if collection in existing:
+            print('Solr create: collection with "%s" name already exist!' %
+                  collection)
+            return
+
+        params = {
+            'action': 'CREATE',
+            'wt': 'json',
+            'name': collection,
+            'numShards': shards,
+            'replicationFactor': replicas,
+            'collection.configName': config_set,
+            'router.name': 'compositeId'
+        }
+
+        if router_field is not None:
+            params['router.field'] = router_field
+
+        if max_shards_per_node is not None:
+            params['maxShardsPerNode'] = max_shards_per_node
+
+        if verbose:
+            print('Solr collection_create:')
+
+        self._get('admin/collections', params, verbose=verbose)
+
+    def collection_delete(self, collection, verbose=False):
+        """Deletes a collection, and all its replicas."""
+
+        existing = self.collections(verbose)
+        if collection not in existing:
+            print('Solr delete: no collection with "%s" name' % collection)
+            return
+
+        params = {
+            'action': 'DELETE',
+            'wt': 'json',
+            'name': collection
+        }
+
+        if verbose:
+            print('Solr collection_delete:')
+
+        self._get('admin/collections', params, verbose=verbose)
+
+    def configset_upload(self, name, folder, verbose=False):
+        """Uploads the config set found in folder (the folder containing
+        solrconfig.xml and managed-schema) to the cluster, as name.
+
+        Config sets uploaded through the API without authentication are
+        untrusted, and Solr refuses to create collections from an untrusted
+        config set using <lib> directives. Use `solr zk upconfig` for those,
+        see bin/create-collection.sh.
+        """
+
+        data = io.BytesIO()
+        with zipfile.ZipFile(data, 'w', zipfile.ZIP_DEFLATED) as z:
+            for root, _, files in os.walk(folder):
+                for f in files:
+                    path = os.path.join(root, f)
+                    z.write(path, os.path.relpath(path, folder))
+
+        params = {
+            'action': 'UPLOAD',
+            'wt': 'json',
+            'name': name
+        }
+
+        if verbose:
+            print('Solr configset_upload:')
+
+        # The zip file is sent as is, which the regular post helpers do not
+        # support, as they encode the payload as JSON.
+        r = requests.post('%s/admin/configs' % self.service_url,
+                          params=params, data=data.getvalue(),
+                          headers={'Content-Type': 'application/octet-stream'})
+
+        if verbose or r.status_code != requests.codes.ok:
+            print('post: %s : %s' % (r.url, r.status_code))
+            print('result: %s' % r.reason)
+
+        if r.status_code != requests.codes.ok:
+            r.raise_for_status()
+
+    def user_properties(self, core, verbose=False):
+        """Returns the user properties of the configuration of a core, see
+        user_property_set()."""
+
+        params = {
+            'wt': 'json'
+        }
+
+        r = self._get_core(core, 'config/overlay', params, verbose=verbose)
+
+        return r.json()['overlay'].get('userProps', {})
+
+    def user_property_set(self, core, name, value, verbose=False):
+        """Sets a user property of the configuration of a core, through the
+        Config API. In cloud mode, it is stored in ZooKeeper with the config
+        set of the collection, and shared by the collections using it."""
+
+        post_header = {
+            'Content-type': 'application/json',
+            'charset': 'utf-8'
+        }
+
+        binary_data = {
+            'set-user-property': {name: value}
+        }
+
+        if verbose:
+            print('Solr user_property_set:')
+
+        self._post_core(core, 'config', post_header, binary_data, verbose)
+
+    def unique_key(self, core, verbose=False):
+        """Returns the name of the uniqueKey field of core, fetched once.
+
+        It is 'uuid' with the kg configset, 'id' with the _default one.
+        """
+
+        key = self.unique_keys.get(core)
+        if key is not None:
+            return key
+
+        if self._backend_for(core) is not None:
+            # The in-process backends ignore the sort
+            key = 'id'
+        else:
+            r = self._get_core(core, 'schema/uniquekey', {'wt': 'json'},
+                               verbose=verbose)
+            key = r.json()['uniqueKey']
+
+        self.unique_keys[core] = key
+        return key
+
+    def cursor_params(self, core, cursor='*'):
+        """Parameters of a deep paging query with cursorMark, which must be
+        sorted on the uniqueKey of core."""
+        return [('sort', '%s asc' % self.unique_key(core)),
+                ('cursorMark', cursor)]
+
     def schema_fields(self, core, fields=None, show_defaults=False,
                       verbose=False):
         """List schema fields of a given collection.
@@ -340,8 +693,30 @@ class Solr:
     def _post(self, endpoint, headers, payload, verbose=False):
         """Execute a REST API call."""
 
-        r = requests.post('%s/%s' % (self.service_url, endpoint), json=payload,
-                          headers=headers)
+        if self.metrics is not None:
+            self.metrics.started(endpoint)
+
+        start = time.time()
+        try:
+            with self._slot() as outcome:
+                r = requests.post('%s/%s' % (self.service_url, endpoint),
+                                  json=payload, headers=headers,
+                                  timeout=self.timeout)
+                outcome['error'] = r.status_code >= 500 or \
+                    r.status_code in OVERLOADED
+        except (requests.RequestException, QueueFull) as e:
+            if self.metrics is not None:
+                self.metrics.failed(endpoint, e)
+            raise
+        latency = time.time() - start
+
+        if self.query_log is not None:
+            self.query_log.record('POST', endpoint, payload, start, latency,
+                                  r.status_code, len(r.content))
+
+        if self.metrics is not None:
+            self.metrics.done('POST', endpoint, payload, latency,
+                              r.status_code, len(r.content))
 
         if verbose or r.status_code != requests.codes.ok:
             print('post: %s : %s' % (r.url, r.status_code))
@@ -359,9 +734,7 @@ class Solr:
     def _post_core(self, core, endpoint, headers, payload, verbose=False):
         """API Calls to a specific core."""
 
-        # if self.cloud_mode:
-        #     existing_cores = getClusterCollections()
-        # else:
+        # In cloud mode, these are the collections
         existing_cores = self.cores()
 
         if core not in existing_cores:
@@ -527,6 +900,9 @@ class Solr:
 
         self._post_core(core, 'update', post_header, binary_data, verbose)
 
+        if self.cache is not None:
+            self.cache.invalidate(core)
+
     def index_spatial_json(self, url, core, commit=True, print_timing=False,
                            verbose=False):
 
@@ -571,6 +947,22 @@ class Solr:
             rsp_json = r.json()
             print('QTime: %d[ms]' % (rsp_json['responseHeader']['QTime']))
 
+    def index_docs(self, core, docs, commit=True, verbose=False):
+        """Index/load a list of documents, given as dictionaries."""
+
+        post_header = {
+            'Content-Type': 'application/json',
+            'charset': 'utf-8'
+        }
+
+        if verbose:
+            print('Solr index_docs:')
+
+        r = self._post_core(core, 'update', post_header, docs, verbose)
+
+        if commit and r is not None and r.status_code == requests.codes.ok:
+            self.commit(core, verbose)
+
     def delete(self, core, query='*:*', verbose=False):
         """Delete elements from a core."""
 
@@ -614,6 +1006,17 @@ class Solr:
                              (d, point[d])
                              for d in [0, 1, 2, 3][:len(point)]])
 
+    @staticmethod
+    def query_type(oid=None, labels=None, geometry=None, mbb=None,
+                   reference_space=None):
+        """Name of the type of a query, based on the filters used."""
+        for name, value in [('labels', labels), ('mbb', mbb),
+                            ('geometry', geometry), ('oid', oid),
+                            ('space', reference_space)]:
+            if value is not None:
+                return name
+        return 'all'
+
     @staticmethod
     def mbb_to_fq(mbb):
         # FIXME: Take into account the reference space to compute
@@ -624,6 +1027,15 @@ class Solr:
         # geometry?
         return 'geometry.coordinates:%s' % Solr.mbb_to_str(mbb)
 
+    def labels_to_fq(self, labels_mbbs):
+        """Filter of the union of the labels MBBs."""
+        if self.filter_optimizer is None:
+            return ' OR '.join([self.mbb_to_fq(m) for m in labels_mbbs])
+
+        fq = self.filter_optimizer.union_fq(labels_mbbs, self.mbb_to_fq)
+        # None of the labels has points
+        return fq if fq != '' else '-*:*'
+
     def _query(self, core, q='*:*', fq=None, fl=None, params=None,
                rows=10, start=0, wt='json', indent='on',
                print_timing=False, verbose=False):
@@ -695,6 +1107,11 @@ class Solr:
         Returns:
             BBox: the bounding box of the query results.
         """
+        backend = self._backend_for(core)
+        if backend is not None:
+            return backend.spatial_mbb(core, query, params, print_timing,
+                                       verbose)
+
         p = []
         if params is not None:
             p = params[:]
@@ -704,12 +1121,24 @@ class Solr:
          for d in [0, 1, 2]]
         p.append(('rows', 0))
 
-        if verbose:
-            print('spatial_bounds:')
-        r = self._query(core, query, params=p, print_timing=print_timing,
-                        verbose=verbose)
-
-        return self.stats_to_mbb(r.json()['stats'])
+        def fetch():
+            if verbose:
+                print('spatial_bounds:')
+            r = self._query(core, query, params=p, print_timing=print_timing,
+                            verbose=verbose)
+            return self.stats_to_mbb(r.json()['stats'])
+
+        if self.coalesce is not None:
+            mbb, leader = self.coalesce.do(
+                ('spatial_mbb', core, query,
+                 tuple([(k, str(v)) for k, v in p])), fetch,
+                share=lambda m: [m[0][:], m[1][:]])
+            if leader:
+                return mbb
+            # Copy, as the result is shared among the concurrent followers
+            return [mbb[0][:], mbb[1][:]]
+
+        return fetch()
 
     def query(self, core,
               oid=None, labels=None,
@@ -744,6 +1173,11 @@ class Solr:
             :param verbose:
             :return:
         """
+        backend = self._backend_for(core)
+        if backend is not None:
+            return backend.query(core, oid, labels, geometry, mbb,
+                                 reference_space, fl, q, params, rows, start,
+                                 indent, print_timing, verbose)
 
         fq = []  # Query filters, list of predicates
         p = []  # make sure we do not modify caller's object
@@ -797,25 +1231,184 @@ class Solr:
             #        effectively asked for by the user.
 
             # Compute the mbb of each label
-            labels_mbbs = [self.spatial_mbb(core, self.label_to_q(l),
-                                            verbose=verbose) for l in labels]
+            labels_mbbs = self.label_mbbs(core, labels, verbose=verbose)
+
+            fq.append(self.labels_to_fq(labels_mbbs))
+
+        if self.router is not None:
+            # Only the shards holding the overlapped cells are queried
+            route_mbb = mbb
+            if geometry is not None:
+                route_mbb = [geometry, geometry]
+            route = self.router.route(reference_space, route_mbb)
+            if route is not None:
+                self._append_if_not_found(p, '_route_', route, verbose)
+
+        key = None
+        if self.cache is not None or self.coalesce is not None:
+            key = ResultCache.key(core, q, fq, fl, p, rows, start)
+
+        if self.cache is not None:
+            version = self.cache.version(core,
+                                         lambda: self.index_version(core))
+            rsp = self.cache.get(key, version)
+            if rsp is not None:
+                return copy(rsp)
+
+        def fetch():
+            if verbose:
+                print('Solr query:')
+            r = self._query(core, q, fq, fl, params=p, rows=rows,
+                            start=start, indent=indent,
+                            print_timing=print_timing, verbose=verbose)
+            return r.json()
+
+        if self.coalesce is not None:
+            # Identical concurrent queries share a single request, the
+            # followers share a snapshot of the response and get a copy of it
+            rsp, leader = self.coalesce.do(('query',) + key, fetch,
+                                           share=copy)
+            if not leader:
+                rsp = copy(rsp)
+        else:
+            rsp = fetch()
 
-            fq.append(' OR '.join([self.mbb_to_fq(m)
-                                   for m in labels_mbbs]))
+        if self.cache is not None:
+            self.cache.put(key, version, rsp)
 
-        if verbose:
-            print('Solr query:')
-        r = self._query(core, q, fq, fl, params=p, rows=rows,
-                        start=start, indent=indent,
-                        print_timing=print_timing, verbose=verbose)
+        if self.metrics is not None and 'response' in rsp:
+            self.metrics.found(self.query_type(oid, labels, geometry, mbb,
+                                               reference_space),
+                               rsp['response']['numFound'])
 
-        return r.json()
+        return rsp
+
+    def export_region(self, core, mbb, parts=4, workers=4, catalog=None,
+                      sink=None, page_size=10000, fq=None):
+        """Exports all the points within mbb, bounds included.
+
+        The box is split into parts sub-boxes, fetched concurrently by
+        workers threads, each one paging through its points with a cursor.
+        With a Catalog, the sub-boxes are balanced according to the density
+        histogram of the core, otherwise they have the same volume. The
+        upper faces of the sub-boxes inside mbb are excluded from them, so
+        points on shared faces are exported once.
+
+        Returns (points, report): points is a util.pointcache.Points, or
+        None when the pages are written to sink instead, through
+        sink.write(coordinates, labels). report gives the number of points,
+        bytes, elapsed time, MB/s and points/s, overall and per part.
+
+            :param list fq: additional filters of the exported points
+        """
+        from util.export import export_region
+        return export_region(self, core, mbb, parts, workers, catalog, sink,
+                             page_size, fq)
+
+    def stream(self, core, batch=10000, **filters):
+        """Yields the matching points, batch at a time, as (coordinates,
+        labels): a (n, 3) array of float64 and the list of the n OIDs.
+
+        The documents are paged through with a cursor, so only one batch is
+        held in memory however many points match. filters are the ones of
+        query(), for example oid=, reference_space= or mbb=.
+        """
+        from util.export import stream
+        return stream(self, core, batch, **filters)
+
+    def lod(self, core, k=10000, mbb=None, **filters):
+        """Level of detail view of the matching points: at most k points,
+        the centroids of the non-empty cells of a regular grid over mbb.
+
+        The centroids and number of points per cell are aggregated by Solr
+        through JSON facets, so a single request is needed, and the size of
+        the answer depends on k, not on the number of matching points.
+        Without mbb, the grid covers the MBB of the matching points, which
+        costs one more request.
+
+        Returns (coordinates, counts): a (n, 3) array of float64 and the
+        number of points of each of the n cells, n <= k.
+
+            :param filters: the ones of query(), for example
+                            reference_space= or oid=
+        """
+        from util.lod import voxel_centroids
+        return voxel_centroids(self, core, k, mbb, **filters)
+
+    def sample(self, core, k, seed=None, stratify=None, cells=4, mbb=None,
+               fl=None, workers=8, **filters):
+        """Returns k matching documents picked at random by Solr, sorting
+        on the random_<seed> dynamic field (RandomSortField), so the same
+        seed gives the same sample for a given index version.
+
+        With stratify='label' the k documents are spread over the OIDs, and
+        with stratify='cell' over the cells of a cells^3 grid over mbb, or
+        over the MBB of the matching points, proportionally to their number
+        of points and with at least one document per stratum when k allows
+        it. The stratum sizes come from a facet request, and the documents
+        from one request per stratum, of its allocation, up to workers of
+        them being sent concurrently.
+
+        Returns a dictionary:
+            numFound    total number of matching documents, to scale
+                        estimates computed on the sample
+            docs        the sampled documents
+            seed        the seed used, random when not given
+            strata      None, or stratum -> {'count', 'sampled'}, the
+                        weight of a document of the stratum being
+                        count / sampled
+
+            :param filters: the ones of query(), for example
+                            reference_space= or oid=
+        """
+        from util.sampling import sample
+        return sample(self, core, k, seed, stratify, cells, mbb, fl, workers,
+                      **filters)
+
+    def fetch_label_summaries(self, core, labels, verbose=False):
+        """Returns the summary documents of the given labels, as a dictionary
+        label -> document, using a single request to the companion core.
+
+        Labels without summary are missing from the result.
+        """
+        if not labels:
+            return {}
+
+        q = 'id:(%s)' % ' OR '.join(['"%s"' % l.replace('"', '\\"')
+                                     for l in labels])
+        r = self._query(self.labels_core(core), q, rows=len(labels),
+                        indent='off', verbose=verbose)
+        if r is None:
+            return {}
+
+        return dict([(d['id'], d) for d in r.json()['response']['docs']])
+
+    def label_mbbs(self, core, labels, verbose=False):
+        """Returns the MBB of each label, in the same order.
+
+        When label_summaries is enabled the MBBs are read from the summary
+        documents, otherwise, or for labels without summary, they are
+        computed with a stats query per label.
+        """
+        summaries = {}
+        if self.label_summaries:
+            summaries = self.fetch_label_summaries(core, labels, verbose)
+
+        return [self.summary_to_mbb(summaries[l]) if l in summaries
+                else self.spatial_mbb(core, self.label_to_q(l),
+                                      verbose=verbose)
+                for l in labels]
 
     def query_cardinality(self, core,
                           oid=None, labels=None,
                           geometry=None, mbb=None, reference_space=None,
                           fl=None, q='*:*', params=None,
                           print_timing=False, verbose=False):
+        backend = self._backend_for(core)
+        if backend is not None:
+            return backend.query_cardinality(core, oid, labels, geometry,
+                                             mbb, reference_space, fl, q,
+                                             params, print_timing, verbose)
 
         # Run the query, but force the number of returned results to zero as
         # we are only interested in the number of hits
@@ -825,6 +1418,10 @@ class Solr:
                           verbose=verbose)["response"]["numFound"]
 
     def list_field(self, core, field):
+        backend = self._backend_for(core)
+        if backend is not None:
+            return backend.list_field(core, field)
+
         params = []
         params.append(("facet", 'on'))
         params.append(("facet.field", field))
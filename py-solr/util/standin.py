@@ -0,0 +1,274 @@
+import json
+import multiprocessing
+import random
+import sys
+import threading
+import time
+
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+
+#############################################################################
+# Local Solr stand-in
+#
+# Answers the endpoints used by util.solr.Solr with synthetic responses,
+# to measure the costs of the client without those of a real server:
+#   admin/cores, admin/info/system,
+#   <core>/select, <core>/schema[/...], <core>/update[/json/docs]
+COORDINATES = ['geometry.coordinates_%d___pdouble' % d for d in [0, 1, 2]]
+
+
+def synthetic_doc(i, labels):
+    """Deterministic document number i, shaped like the indexed points."""
+    rnd = random.Random(i)
+    c = [rnd.random() for d in [0, 1, 2]]
+    doc = {
+        'id': '%08x-0000-0000-0000-%012x' % (i, i),
+        'properties.id': 'oid%d' % (i % labels),
+        'geometry.referenceSpace': 'space0',
+        'geometry.type': 'Point',
+        'geometry.coordinates': '%r,%r,%r' % tuple(c)
+    }
+    for d in [0, 1, 2]:
+        doc[COORDINATES[d]] = c[d]
+    return doc
+
+
+class Settings:
+    """Shape of the synthetic responses.
+
+        :param int num_found:   number of documents of each core
+        :param int labels:      number of distinct properties.id values
+        :param float latency:   added delay, in seconds, before each answer
+        :param float jitter:    uniform random delay added to latency
+        :param list cores:      names of the cores
+        :param dict canned:     endpoint -> JSON document, answered as is
+                                instead of the synthetic response
+        :param int memo_size:   number of encoded responses kept, the least
+                                recently used ones are dropped first
+    """
+
+    def __init__(self, num_found=1000, labels=10, latency=0.0, jitter=0.0,
+                 cores=None, canned=None, memo_size=1024):
+        self.num_found = num_found
+        self.labels = labels
+        self.latency = latency
+        self.jitter = jitter
+        self.cores = cores if cores is not None else ['standin']
+        self.canned = canned if canned is not None else {}
+        self.memo_size = memo_size
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, without this small answers
+    # wait for the delayed ACK of the client
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, body, status=200):
+        if self.server.settings.latency > 0 or self.server.settings.jitter > 0:
+            time.sleep(self.server.settings.latency +
+                       random.random() * self.server.settings.jitter)
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self):
+        url = urlsplit(self.path)
+        parts = [p for p in url.path.split('/') if p != '']
+        if parts and parts[0] == 'solr':
+            parts = parts[1:]
+        return '/'.join(parts), parse_qsl(url.query, keep_blank_values=True)
+
+    def do_GET(self):
+        endpoint, params = self._route()
+        self._reply(self.server.answer('GET', endpoint, params))
+
+    def do_POST(self):
+        endpoint, params = self._route()
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        self._reply(self.server.answer('POST', endpoint, params))
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, settings):
+        ThreadingHTTPServer.__init__(self, address, _Handler)
+        self.settings = settings
+        self.versions = dict([(c, 1) for c in settings.cores])
+        self.lock = threading.Lock()
+        # Encoded responses, they are deterministic for a given request,
+        # bounded as benchmarks with random boxes never repeat a request
+        self.memo = OrderedDict()
+
+    def handle_error(self, request, client_address):
+        # Clients giving up on slow answers are expected, see latency,
+        # anything else is a bug of the stand-in
+        if isinstance(sys.exc_info()[1], (BrokenPipeError,
+                                          ConnectionResetError)):
+            return
+        ThreadingHTTPServer.handle_error(self, request, client_address)
+
+    def answer(self, method, endpoint, params):
+        if endpoint in self.settings.canned:
+            return json.dumps(self.settings.canned[endpoint]).encode('utf-8')
+
+        if method == 'POST':
+            core = endpoint.split('/')[0]
+            if endpoint.startswith('%s/update' % core):
+                with self.lock:
+                    self.versions[core] = self.versions.get(core, 0) + 1
+            return self._encode(self._header())
+
+        key = (endpoint, tuple(params))
+        with self.lock:
+            body = self.memo.get(key)
+            if body is not None:
+                self.memo.move_to_end(key)
+        if body is None:
+            body = self._encode(self._get(endpoint, dict(params), params))
+            if not endpoint.startswith('admin/cores'):
+                with self.lock:
+                    self.memo[key] = body
+                    while len(self.memo) > self.settings.memo_size:
+                        self.memo.popitem(last=False)
+        return body
+
+    @staticmethod
+    def _encode(rsp):
+        return json.dumps(rsp).encode('utf-8')
+
+    @staticmethod
+    def _header():
+        return {'responseHeader': {'status': 0, 'QTime': 0}}
+
+    def _get(self, endpoint, p, params):
+        s = self.settings
+        rsp = self._header()
+
+        if endpoint == 'admin/cores':
+            cores = s.cores if 'core' not in p else [p['core']]
+            rsp['status'] = dict([(c, {
+                'name': c,
+                'index': {'numDocs': s.num_found,
+                          'version': self.versions.get(c, 0),
+                          'sizeInBytes': s.num_found * 256}})
+                for c in cores])
+            return rsp
+
+        if endpoint == 'admin/info/system':
+            rsp['lucene'] = {'solr-spec-version': 'standin'}
+            return rsp
+
+        core, _, rest = endpoint.partition('/')
+        if rest == 'schema/uniquekey':
+            rsp['uniqueKey'] = 'id'
+            return rsp
+
+        if rest.startswith('schema'):
+            for k in ['fields', 'dynamicFields', 'fieldTypes', 'copyFields']:
+                rsp[k] = []
+            return rsp
+
+        if rest != 'select':
+            return rsp
+
+        rows = min(int(p.get('rows', 10)), s.num_found)
+        start = int(p.get('start', 0))
+        if p.get('cursorMark', '*').startswith('standin'):
+            start = int(p['cursorMark'][len('standin'):])
+        docs = [synthetic_doc(i, s.labels)
+                for i in range(start, min(start + rows, s.num_found))]
+        fl = p.get('fl')
+        if fl is not None and fl not in ['*', 'field']:
+            fields = fl.split(',')
+            docs = [dict([(f, d[f]) for f in fields if f in d])
+                    for d in docs]
+        rsp['response'] = {'numFound': s.num_found, 'start': start,
+                           'docs': docs}
+
+        if 'cursorMark' in p:
+            rsp['nextCursorMark'] = p['cursorMark'] \
+                if start >= s.num_found or rows == 0 \
+                else 'standin%d' % min(start + rows, s.num_found)
+
+        if p.get('stats') == 'true':
+            rsp['stats'] = {'stats_fields': dict([
+                (v, {'min': 0.0, 'max': 1.0, 'mean': 0.5,
+                     'count': s.num_found})
+                for k, v in params if k == 'stats.field'])}
+
+        if p.get('facet') == 'on':
+            rsp['facet_counts'] = {'facet_fields': {}}
+            for k, v in params:
+                if k == 'facet.field':
+                    values = ['oid%d' % i for i in range(s.labels)] \
+                        if v == 'properties.id' else ['space0']
+                    counts = []
+                    for name in values:
+                        counts += [name, s.num_found // len(values)]
+                    rsp['facet_counts']['facet_fields'][v] = counts
+
+        if 'json.facet' in p:
+            rsp['facets'] = {'count': s.num_found}
+
+        return rsp
+
+
+def serve(port, settings, ready=None):
+    """Runs the stand-in on localhost:port until interrupted."""
+    server = StandInServer(('127.0.0.1', port), settings)
+    if ready is not None:
+        ready.put(server.server_address[1])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+class StandIn:
+    """Stand-in running in a separate process, so that it does not compete
+    with the measured client for the interpreter:
+
+        with StandIn(Settings(num_found=10000)) as standin:
+            solr = Solr(standin.url)
+    """
+
+    def __init__(self, settings=None, port=0):
+        self.settings = settings if settings is not None else Settings()
+        self.port = port
+        self.process = None
+        self.url = None
+
+    def start(self):
+        ready = multiprocessing.Queue()
+        self.process = multiprocessing.Process(
+            target=serve, args=(self.port, self.settings, ready), daemon=True)
+        self.process.start()
+        self.port = ready.get(timeout=10)
+        self.url = 'http://127.0.0.1:%d/solr' % self.port
+        return self
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -1,4 +1,4 @@
-from math import sqrt
+from math import exp, log, sqrt
 
 
 #############################################################################
@@ -23,3 +23,18 @@ def stddev(values):
     mn = mean(values)
     v = sum([(float(x) - mn)**2 for x in values]) / (len(values) - 1.0)
     return sqrt(v)
+
+
+def power_fit(x, y):
+    """ Least squares fit of y = a * x^b, in log-log space.
+
+    Returns (a, b), b being the scaling exponent.
+    """
+    lx = [log(float(v)) for v in x]
+    ly = [log(float(v)) for v in y]
+    mx = mean(lx)
+    my = mean(ly)
+    b = sum([(u - mx) * (v - my) for u, v in zip(lx, ly)]) / \
+        sum([(u - mx)**2 for u in lx])
+    a = exp(my - b * mx)
+    return a, b
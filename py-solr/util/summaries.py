@@ -0,0 +1,230 @@
+import json
+
+import numpy as np
+
+
+#############################################################################
+# Per-label summary documents
+#
+# For each label (properties.id) we keep a small document in the companion
+# core, see Solr.labels_core(), with the number of points, the MBB, the
+# centroid and the reference space of the label. The field names use the
+# dynamic fields of the default schema:
+#   id, label_s, space_s, count_l, min_<d>_d, max_<d>_d, centroid_<d>_d
+def _coordinates(geometry):
+    # Coordinates are stored as ["x,y,z"] by generate_rnd_uniform.py, but
+    # accept lists of numbers as well.
+    c = geometry['coordinates']
+    if len(c) == 1 and not isinstance(c[0], (int, float)):
+        c = c[0].split(',')
+    return [float(v) for v in c[:3]]
+
+
+def iter_features(data_file, chunk_size=1 << 20):
+    """Iterates over the features of a GeoJSON-like file, as written by
+    generate_rnd_uniform.py, a JSON array of features, reading it by chunks
+    instead of loading the whole file."""
+    decoder = json.JSONDecoder()
+    with open(data_file, 'r') as fd:
+        buf = ''
+        pos = 0
+        started = False
+        eof = False
+        while True:
+            # Skip the separators between the features
+            while pos < len(buf) and buf[pos] in ' \t\r\n,[]':
+                if buf[pos] == '[':
+                    started = True
+                pos += 1
+            if pos == len(buf):
+                if eof:
+                    return
+                buf = fd.read(chunk_size)
+                pos = 0
+                eof = buf == ''
+                continue
+
+            assert (started)
+            try:
+                feature, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof:
+                    raise
+                # Incomplete feature, read more of the file
+                more = fd.read(chunk_size)
+                eof = more == ''
+                buf = buf[pos:] + more
+                pos = 0
+                continue
+
+            yield feature
+            pos = end
+
+
+def iter_batches(data_file, batch=100000):
+    """Iterates over the features of data_file by batches of (labels,
+    spaces, coordinates), coordinates being a (n, 3) array."""
+    labels = []
+    spaces = []
+    coordinates = []
+    for f in iter_features(data_file):
+        labels.append(f['properties']['id'])
+        spaces.append(f['geometry'].get('referenceSpace', ''))
+        coordinates.append(_coordinates(f['geometry']))
+        if len(labels) == batch:
+            yield labels, spaces, np.array(coordinates, dtype=np.float64)
+            labels = []
+            spaces = []
+            coordinates = []
+
+    if labels:
+        yield labels, spaces, np.array(coordinates, dtype=np.float64)
+
+
+def load_features(data_file):
+    """Reads a GeoJSON-like file, as written by generate_rnd_uniform.py.
+
+    Returns (labels, spaces, coordinates), coordinates being a (N, 3)
+    array.
+    """
+    labels = []
+    spaces = []
+    coordinates = [np.empty((0, 3))]
+    for l, s, c in iter_batches(data_file):
+        labels += l
+        spaces += s
+        coordinates.append(c)
+
+    return labels, spaces, np.concatenate(coordinates)
+
+
+def _aggregate(labels, spaces, coordinates):
+    """Per-label aggregates of a batch of points, as (names, spaces, counts,
+    mins, maxs, sums). The first reference space of each label is kept."""
+    names, first, inverse = np.unique(np.array(labels, dtype=object),
+                                      return_index=True,
+                                      return_inverse=True)
+    n = len(names)
+
+    counts = np.bincount(inverse, minlength=n)
+    mins = np.full((n, 3), np.inf)
+    maxs = np.full((n, 3), -np.inf)
+    np.minimum.at(mins, inverse, coordinates)
+    np.maximum.at(maxs, inverse, coordinates)
+    sums = np.stack([np.bincount(inverse, weights=coordinates[:, d],
+                                 minlength=n)
+                     for d in range(3)], axis=1)
+
+    return names, [spaces[i] for i in first], counts, mins, maxs, sums
+
+
+def _doc(label, space, count, mins, maxs, sums):
+    doc = {
+        'id': label,
+        'label_s': label,
+        'space_s': space,
+        'count_l': int(count)
+    }
+    for d in range(3):
+        doc['min_%d_d' % d] = float(mins[d])
+        doc['max_%d_d' % d] = float(maxs[d])
+        doc['centroid_%d_d' % d] = float(sums[d] / count)
+    return doc
+
+
+def compute(labels, spaces, coordinates):
+    """Computes the summary documents of all the labels at once.
+
+    When a label has points in several reference spaces, the first one is
+    kept.
+    """
+    if len(labels) == 0:
+        return []
+
+    return [_doc(*a) for a in zip(*_aggregate(labels, spaces, coordinates))]
+
+
+def compute_file(data_file, batch=100000):
+    """Computes the summary documents of the labels of data_file, reading
+    it by batches."""
+    summaries = {}
+    for b in iter_batches(data_file, batch):
+        for label, space, count, mins, maxs, sums in zip(*_aggregate(*b)):
+            s = summaries.get(label)
+            if s is None:
+                summaries[label] = [space, count, mins, maxs, sums]
+            else:
+                s[1] += count
+                s[2] = np.minimum(s[2], mins)
+                s[3] = np.maximum(s[3], maxs)
+                s[4] = s[4] + sums
+
+    return [_doc(l, *summaries[l]) for l in sorted(summaries)]
+
+
+def build(solr, core, data_file, commit=True):
+    """Computes the summaries of the labels of data_file, and writes them in
+    the companion core of core.
+
+    The summaries are computed on the file only, so this is meant for
+    labels which are entirely contained in data_file, i.e. the first load of
+    a core; use update() when loading more points in a core.
+    """
+    docs = compute_file(data_file)
+    solr.index_docs(solr.labels_core(core), docs, commit)
+    return docs
+
+
+def update(solr, core, data_file, commit=True):
+    """Refreshes the summaries of the labels of data_file, once its points
+    are loaded and committed in core, which may already hold points of
+    these labels."""
+    labels = set()
+    for l, _, _ in iter_batches(data_file):
+        labels.update(l)
+    return refresh(solr, core, sorted(labels), commit)
+
+
+def refresh(solr, core, labels, commit=True):
+    """Recomputes the summaries of the given labels from the points stored
+    in core, to be called when the points of these labels change.
+
+    Summaries of labels without points any more are deleted.
+    """
+    fields = ['geometry.coordinates_%d___pdouble' % d for d in [0, 1, 2]]
+
+    docs = []
+    deleted = []
+    for l in labels:
+        params = [('stats', 'true'), ('facet', 'on'),
+                  ('facet.field', 'geometry.referenceSpace'),
+                  ('facet.limit', '1'), ('facet.mincount', '1')]
+        params += [('stats.field', f) for f in fields]
+
+        rsp = solr.query(core, oid=l, params=params, rows=0, indent='off')
+        count = rsp['response']['numFound']
+        if count == 0:
+            deleted.append(l)
+            continue
+
+        stats = rsp['stats']['stats_fields']
+        spaces = rsp['facet_counts']['facet_fields']['geometry.referenceSpace']
+        doc = {
+            'id': l,
+            'label_s': l,
+            'space_s': spaces[0] if spaces else '',
+            'count_l': count
+        }
+        for d in range(3):
+            doc['min_%d_d' % d] = stats[fields[d]]['min']
+            doc['max_%d_d' % d] = stats[fields[d]]['max']
+            doc['centroid_%d_d' % d] = stats[fields[d]]['mean']
+        docs.append(doc)
+
+    labels_core = solr.labels_core(core)
+    for l in deleted:
+        solr.delete(labels_core, 'id:"%s"' % l.replace('"', '\\"'))
+    if docs:
+        solr.index_docs(labels_core, docs, commit)
+
+    return docs
@@ -0,0 +1,126 @@
+import os
+import subprocess
+import time
+
+from multiprocessing import Pool
+
+from util.solr import Solr
+import util.benchmarks as bench
+import util.stat as stat
+
+
+#############################################################################
+# Datasets management
+def core_name(oids):
+    # Same naming scheme as bin/generate.sh and bin/load.sh, with 1000 points
+    # per OID.
+    return '%dk' % oids
+
+
+def generate(folder, oids, points_per_oid=1000, reuse=True):
+    """ Generates a dataset of oids * points_per_oid points, unless it is
+        already present in folder.
+    """
+    data_file = os.path.join(folder, '%s.json' % core_name(oids))
+    if reuse and os.path.exists(data_file):
+        return data_file
+
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    generator = os.path.join(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), 'generate_rnd_uniform.py')
+
+    with open(data_file, 'w') as fd:
+        subprocess.check_call([generator, '-o', str(points_per_oid),
+                               '-p', str(oids)], stdout=fd)
+
+    return data_file
+
+
+def load(solr, core, data_file, project_bin, reuse=True):
+    """ Creates and loads the core, unless it already contains documents.
+
+    The core creation requires a copy of the default core configuration on
+    the server side, so we go through bin/create-db.sh. Without reuse, an
+    existing core is unloaded first, with its index and instance folder,
+    so it is created again from scratch.
+    """
+    if core in solr.cores():
+        if reuse:
+            index = solr.core_status(core, index_info=True)[core]['index']
+            if index['numDocs'] > 0:
+                return index['numDocs']
+        solr.core_unload(core)
+
+    subprocess.check_call([os.path.join(project_bin, 'create-db.sh'),
+                           core, data_file])
+
+    return solr.core_status(core, index_info=True)[core]['index']['numDocs']
+
+
+#############################################################################
+# Workload execution
+def _init_worker(url, core):
+    # Each process uses its own connection to the server
+    bench.init(Solr(url), core)
+
+
+def _run_tasks(tasks):
+    rs = []
+    for l, f, a in tasks:
+        _, t = bench.timed(lambda: f(*a))
+        rs.append((l, t))
+    return rs
+
+
+def run_workload(url, core, threads, repetitions):
+    """ Runs the reference workload with the given number of client
+        processes.
+
+    Returns (throughput, timings), where throughput is the number of queries
+    per second over the whole run, and timings a dictionary of query label ->
+    list of latencies.
+    """
+    bench.init(Solr(url), core)
+    workload = bench.workload()
+
+    # Warm up, sequentially, not timed
+    _run_tasks(workload)
+
+    cookies = [[] for _ in range(threads)]
+    i = 0
+    for _ in range(repetitions):
+        for task in workload:
+            cookies[i].append(task)
+            i = (i + 1) % threads
+
+    pool = Pool(processes=threads, initializer=_init_worker,
+                initargs=(url, core))
+    start = time.time()
+    rs = pool.map(_run_tasks, cookies)
+    elapsed = time.time() - start
+    pool.close()
+    pool.join()
+
+    timings = {}
+    for r in rs:
+        for l, t in r:
+            timings.setdefault(l, []).append(t)
+
+    return len(workload) * repetitions / elapsed, timings
+
+
+#############################################################################
+# Analysis
+def summarize(values, bands=(5, 50, 95)):
+    return [stat.percentile(values, b) for b in bands]
+
+
+def fit_scaling(sizes, values, predict=1e9):
+    """ Fits values = a * size^b, and extrapolates to the predict size.
+
+    Returns (a, b, prediction)
+    """
+    a, b = stat.power_fit(sizes, values)
+    return a, b, a * predict ** b
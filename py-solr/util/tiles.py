@@ -0,0 +1,278 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from util.pointcache import PointCache, Points
+
+
+#############################################################################
+# Octree tile pyramid
+ARRAYS = ['keys', 'counts', 'centroids', 'offsets', 'samples', 'codes']
+
+
+class Tiles:
+    """Tiles of one level of a pyramid, tile i being:
+        keys[i]         (i, j, k) position of the tile in the level grid
+        counts[i]       number of points in the tile
+        centroids[i]    centroid of these points
+        sample(i)       at most the sample size of these points, picked at
+                        random, as a util.pointcache.Points
+    """
+
+    def __init__(self, level, origin, size, keys, counts, centroids,
+                 offsets, samples, codes, oids):
+        self.level = level
+        self.origin = origin
+        self.size = size
+        self.keys = keys
+        self.counts = counts
+        self.centroids = centroids
+        self.offsets = offsets
+        self.samples = samples
+        self.codes = codes
+        self.oids = oids
+
+    def __len__(self):
+        return len(self.counts)
+
+    def mbb(self, i):
+        lo = self.origin + self.keys[i] * self.size
+        return [lo.tolist(), (lo + self.size).tolist()]
+
+    def sample(self, i):
+        s = slice(self.offsets[i], self.offsets[i + 1])
+        return Points(self.samples[s], self.codes[s], self.oids)
+
+    @staticmethod
+    def empty(level, origin, size, oids):
+        return Tiles(level, origin, size, np.empty((0, 3), dtype=np.int64),
+                     np.empty(0, dtype=np.int64), np.empty((0, 3)),
+                     np.zeros(1, dtype=np.int64), np.empty((0, 3)),
+                     np.empty(0, dtype=np.int32), oids)
+
+
+class TilePyramid:
+    """Pre-computed octree tile pyramids of the reference spaces of cores,
+    to browse them without querying the raw points.
+
+    Level l splits the bounding cube of the space into 2^l tiles per
+    dimension, and stores for each non-empty tile its number of points,
+    their centroid and a capped random sample of them. The levels are
+    stored in local files, one folder per level:
+
+        keys.npy        (n,) int64, (i * 2^l + j) * 2^l + k, sorted
+        counts.npy      (n,) int64
+        centroids.npy   (n, 3) float64
+        offsets.npy     (n + 1,) int64, range of the sample of each tile
+        samples.npy     (m, 3) float64, coordinates of the samples
+        codes.npy       (m,) int32, index of the OID of each sample
+
+    and meta.json with the index version, the cube, the OIDs dictionary,...
+    The pyramid is built from the points of the PointCache, exported from
+    the core if needed, and rebuilt when the index version changes.
+    """
+
+    def __init__(self, solr, folder, levels=8, sample=64, seed=0,
+                 cache=None):
+        self.solr = solr
+        self.folder = folder
+        self.levels = levels
+        self.sample = sample
+        self.seed = seed
+        self.cache = cache if cache is not None else \
+            PointCache(solr, os.path.join(folder, 'points'))
+        self.lock = threading.Lock()
+        self.loaded = {}    # path -> meta
+
+    def _path(self, core, space):
+        digest = hashlib.sha1(json.dumps(space).encode('utf-8')).hexdigest()
+        return os.path.join(self.folder, core, digest)
+
+    @staticmethod
+    def cube(coordinates):
+        """Bounding cube of the points, as (origin, side)."""
+        lo = coordinates.min(axis=0)
+        side = float(max(np.max(coordinates.max(axis=0) - lo), 1e-12))
+        return lo, side
+
+    def _build_level(self, cells, depth, level, points, rng):
+        shift = depth - level
+        n = 1 << level
+        c = cells >> shift
+        keys = (c[:, 0] * n + c[:, 1]) * n + c[:, 2]
+
+        # Points grouped by tile, in random order within each tile
+        order = rng.permutation(len(keys))
+        order = order[np.argsort(keys[order], kind='stable')]
+        keys = keys[order]
+        tiles, starts, counts = np.unique(keys, return_index=True,
+                                          return_counts=True)
+
+        coordinates = points.coordinates[order]
+        inverse = np.repeat(np.arange(len(tiles)), counts)
+        centroids = np.empty((len(tiles), 3))
+        for d in [0, 1, 2]:
+            centroids[:, d] = np.bincount(inverse, coordinates[:, d]) / counts
+
+        rank = np.arange(len(keys)) - np.repeat(starts, counts)
+        kept = rank < self.sample
+        kept_counts = np.minimum(counts, self.sample)
+        offsets = np.concatenate([[0], np.cumsum(kept_counts)])
+
+        return {
+            'keys': tiles.astype(np.int64),
+            'counts': counts.astype(np.int64),
+            'centroids': centroids,
+            'offsets': offsets.astype(np.int64),
+            'samples': np.ascontiguousarray(coordinates[kept]),
+            'codes': np.asarray(points.codes)[order][kept].astype(np.int32)
+        }
+
+    def build(self, core, space, version=None):
+        """Builds the pyramid of a reference space of core, regardless of
+        what is already built."""
+        if version is None:
+            version = self.solr.index_version(core)
+        points = self.cache.space(core, space)
+
+        path = self._path(core, space)
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        if os.path.isdir(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(tmp)
+
+        meta = {'core': core, 'space': space, 'version': version,
+                'levels': self.levels, 'sample': self.sample,
+                'count': len(points), 'oids': list(points.oids),
+                'origin': None, 'side': None}
+
+        if len(points) > 0:
+            origin, side = self.cube(points.coordinates)
+            meta['origin'] = list(origin)
+            meta['side'] = side
+
+            # Cell of each point at the deepest level, the upper faces of
+            # the cube falling in the last cell
+            depth = self.levels - 1
+            n = 1 << depth
+            cells = np.minimum(((points.coordinates - origin) / side * n)
+                               .astype(np.int64), n - 1)
+
+            rng = np.random.RandomState(self.seed)
+            for level in range(self.levels):
+                arrays = self._build_level(cells, depth, level, points, rng)
+                folder = os.path.join(tmp, 'level-%d' % level)
+                os.makedirs(folder)
+                for name in ARRAYS:
+                    np.save(os.path.join(folder, '%s.npy' % name),
+                            arrays[name])
+
+        with open(os.path.join(tmp, 'meta.json'), 'w') as fd:
+            json.dump(meta, fd)
+
+        with self.lock:
+            self.loaded.pop(path, None)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            os.rename(tmp, path)
+
+        return meta
+
+    def _load_level(self, path, level):
+        folder = os.path.join(path, 'level-%d' % level)
+        return dict([(name, np.load(os.path.join(folder, '%s.npy' % name),
+                                    mmap_mode='r'))
+                     for name in ARRAYS])
+
+    def _get(self, core, space):
+        """(meta, path) of the pyramid of space, built if missing or out of
+        date with the index."""
+        version = self.solr.index_version(core)
+        path = self._path(core, space)
+
+        with self.lock:
+            meta = self.loaded.get(path)
+        if meta is None and os.path.exists(os.path.join(path, 'meta.json')):
+            with open(os.path.join(path, 'meta.json'), 'r') as fd:
+                meta = json.load(fd)
+
+        if meta is None or meta['version'] != version:
+            meta = self.build(core, space, version)
+
+        with self.lock:
+            self.loaded[path] = meta
+        return meta, path
+
+    @staticmethod
+    def _span(meta, level, mbb):
+        """Range of tile positions of level overlapped by mbb, per
+        dimension, None when mbb is outside of the cube."""
+        n = 1 << level
+        origin = np.asarray(meta['origin'])
+        if np.any(np.asarray(mbb[1]) < origin) or \
+                np.any(np.asarray(mbb[0]) > origin + meta['side']):
+            return None
+        size = meta['side'] / n
+        lo = np.floor((np.asarray(mbb[0]) - origin) / size).astype(np.int64)
+        hi = np.floor((np.asarray(mbb[1]) - origin) / size).astype(np.int64)
+        return np.clip(lo, 0, n - 1), np.clip(hi, 0, n - 1)
+
+    def tiles(self, core, space, level=None, mbb=None, max_tiles=4096):
+        """Returns the non-empty tiles of level overlapped by mbb, as Tiles.
+
+        At most max_tiles tiles are returned: when the viewport covers more
+        tiles of level, or when level is None, the deepest level within
+        that bound is used instead, so the answer size is bounded by
+        max_tiles times the sample size. A space without points gives no
+        tile, with a zero origin and size.
+        """
+        meta, path = self._get(core, space)
+        if level is None:
+            level = meta['levels'] - 1
+        level = min(level, meta['levels'] - 1)
+        if meta['count'] == 0:
+            return Tiles.empty(level, np.zeros(3), 0.0, meta['oids'])
+        if mbb is None:
+            origin = meta['origin']
+            mbb = [origin, [o + meta['side'] for o in origin]]
+
+        n = 1 << level
+        if self._span(meta, level, mbb) is None:
+            return Tiles.empty(level, np.asarray(meta['origin']),
+                               meta['side'] / n, meta['oids'])
+
+        while level > 0:
+            lo, hi = self._span(meta, level, mbb)
+            if np.prod(hi - lo + 1) <= max_tiles:
+                break
+            level -= 1
+
+        a = self._load_level(path, level)
+        lo, hi = self._span(meta, level, mbb)
+        n = 1 << level
+
+        # Keys are sorted, i first, so only the tiles within the range of i
+        # are looked at
+        start, end = np.searchsorted(a['keys'], [lo[0] * n * n,
+                                                 (hi[0] + 1) * n * n])
+        keys = np.column_stack(np.unravel_index(a['keys'][start:end],
+                                                (n, n, n)))
+        inside = np.nonzero(np.all((keys >= lo) & (keys <= hi), axis=1))[0]
+        selected = start + inside
+
+        # Samples of the selected tiles, made contiguous
+        first = a['offsets'][selected]
+        last = a['offsets'][selected + 1]
+        rows = np.concatenate([np.arange(f, l) for f, l in zip(first, last)]) \
+            if len(selected) > 0 else np.empty(0, dtype=np.int64)
+
+        return Tiles(level, np.asarray(meta['origin']), meta['side'] / n,
+                     keys[inside], np.asarray(a['counts'][selected]),
+                     np.asarray(a['centroids'][selected]),
+                     np.concatenate([[0], np.cumsum(last - first)]),
+                     np.asarray(a['samples'][rows]),
+                     np.asarray(a['codes'][rows]), meta['oids'])
@@ -0,0 +1,192 @@
+import multiprocessing
+import queue
+import threading
+import time
+
+from util.solr import Solr
+import util.benchmarks as bench
+import util.profiling as profiling
+
+
+#############################################################################
+# Persistent pool of benchmark workers
+def _task(index, task, barrier, profiler):
+    label, query, args, duration, count, warmup = task
+    try:
+        for _ in range(warmup):
+            query(*args)
+    except Exception as e:
+        barrier.abort()
+        return (index, label, None, 0.0, 0.0, repr(e))
+
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        return (index, label, None, 0.0, 0.0, 'aborted')
+
+    timings = []
+    error = None
+    cpu = time.process_time()
+    start = time.time()
+    try:
+        with profiling.profile(profiler, label):
+            if duration is not None:
+                deadline = start + duration
+                while time.time() < deadline:
+                    timings.append(bench.timed(lambda: query(*args))[1])
+            else:
+                for _ in range(count):
+                    timings.append(bench.timed(lambda: query(*args))[1])
+    except Exception as e:
+        error = repr(e)
+    elapsed = time.time() - start
+    cpu = time.process_time() - cpu
+
+    return (index, label, timings, elapsed, cpu, error)
+
+
+def _worker(index, url, core, barrier, tasks, results, profile):
+    # Each worker uses its own client, instead of the one inherited from the
+    # parent process.
+    bench.init(Solr(url), core)
+
+    profiler = None
+    if profile:
+        profiler = profiling.Profiler()
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+
+        if task == 'profile':
+            results.put((index, profiler.state()))
+            continue
+
+        # Every task gets a result record, so the parent never waits for a
+        # worker which gave up.
+        try:
+            result = _task(index, task, barrier, profiler)
+        except Exception as e:
+            barrier.abort()
+            result = (index, task[0], None, 0.0, 0.0, repr(e))
+        results.put(result)
+
+
+def fairness(values):
+    """ Jain's fairness index, 1.0 when all the values are equal, 1/n when a
+        single worker got everything.
+    """
+    if sum(values) == 0:
+        return 0.0
+    return sum(values)**2 / float(len(values) * sum([v**2 for v in values]))
+
+
+class WorkerPool:
+    """Pool of benchmark processes, started once and reused for every query
+    type.
+
+    For each run, the workers warm up, wait for each other on a barrier and
+    then run the query either for a fixed wall-clock window or a fixed number
+    of times. Each worker reports its own timings, so the client-side
+    behaviour (throughput per worker, fairness, CPU usage) can be told apart
+    from the server limits.
+    """
+
+    def __init__(self, url, core, workers, profile=False, poll=1.0):
+        """
+            :param float poll:  interval, in seconds, at which the workers
+                                are checked to be alive while waiting for
+                                their results
+        """
+        assert (workers > 0)
+
+        self.workers = workers
+        self.poll = poll
+        self.profile = profile
+        self.barrier = multiprocessing.Barrier(workers)
+        self.results = multiprocessing.Queue()
+        self.tasks = [multiprocessing.Queue() for _ in range(workers)]
+        self.processes = [
+            multiprocessing.Process(target=_worker,
+                                    args=(i, url, core, self.barrier,
+                                          self.tasks[i], self.results,
+                                          profile))
+            for i in range(workers)]
+
+        for p in self.processes:
+            p.daemon = True
+            p.start()
+
+    def run(self, label, query, args, duration=None, count=None, warmup=1):
+        """Runs query(*args) on all the workers at once.
+
+            :param str label:       query label, i.e. 'Q1'
+            :param float duration:  wall-clock window, in seconds
+            :param int count:       total number of queries, evenly split
+                                    among the workers, used when duration is
+                                    None
+            :param int warmup:      number of untimed queries, per worker
+            :return:                list of per-worker dictionaries, sorted
+                                    by worker index
+        """
+        assert (duration is not None or count is not None)
+
+        for i in range(self.workers):
+            c = None
+            if duration is None:
+                c = count // self.workers + (1 if i < count % self.workers
+                                             else 0)
+            self.tasks[i].put((label, query, args, duration, c, warmup))
+
+        rs = self._collect(label)
+        rs.sort()
+
+        errors = [(i, e) for i, _, _, _, _, e in rs if e is not None]
+        if errors:
+            self.barrier.reset()
+            raise RuntimeError('%s: worker errors %s' % (label, errors))
+
+        return [{'worker': i,
+                 'timings': timings,
+                 'elapsed': elapsed,
+                 'cpu': cpu,
+                 'throughput': len(timings) / elapsed if elapsed > 0 else 0.0}
+                for i, _, timings, elapsed, cpu, _ in rs]
+
+    def _collect(self, label):
+        """One result per worker, raises RuntimeError instead of waiting
+        forever when a worker process died."""
+        rs = []
+        while len(rs) < self.workers:
+            try:
+                rs.append(self.results.get(timeout=self.poll))
+            except queue.Empty:
+                dead = [i for i, p in enumerate(self.processes)
+                        if not p.is_alive()]
+                if dead:
+                    self.barrier.abort()
+                    raise RuntimeError('%s: workers %s exited' % (label, dead))
+        return rs
+
+    def profiles(self):
+        """Returns the profiling data of all the workers, aggregated, see
+        util.profiling.merge."""
+        assert (self.profile)
+
+        for q in self.tasks:
+            q.put('profile')
+        return profiling.merge(
+            [state for _, state in self._collect('profile')])
+
+    def close(self):
+        for q in self.tasks:
+            q.put(None)
+        for p in self.processes:
+            p.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
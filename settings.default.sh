@@ -25,6 +25,20 @@ PYTHONPATH="${PYTHONPATH}:${PYTHON_ROOT}" # Add to the Python PATH, even if it i
 : ${KG_CONF_FILE_JETTY:="${SPATIAL_SEARCH_HOME}/config/jetty.xml"}
 : ${KG_CONF_FILE_CONTEXT:="${SPATIAL_SEARCH_HOME}/config/solr-jetty-context.xml"}
 
+#############################################################################
+# SolrCloud settings, see docker-compose.cloud.yml
+: ${KG_SPATIAL_SEARCH_ZOOKEEPER_IMAGE:="zookeeper:3.4"}
+: ${KG_SPATIAL_SEARCH_CLOUD_PORT:="8984"} # Port of the second node
+: ${KG_SPATIAL_SEARCH_CLOUD_HEAP_SIZE:="2g"}
+: ${KG_SPATIAL_SEARCH_CLOUD_SERVICE_NAME:="${COMPOSE_PROJECT_NAME}_spatial-search-1_1"}
+: ${KG_SPATIAL_SEARCH_CONFIG_SET:="kg-basic"}
+: ${KG_SPATIAL_SEARCH_SHARDS:="2"}
+: ${KG_SPATIAL_SEARCH_REPLICAS:="1"}
+
+#############################################################################
+# Benchmark settings
+: ${KG_SPATIAL_SEARCH_RESULTS:="${SPATIAL_SEARCH_HOME}/results.db"}
+
 #############################################################################
 # Build settings
 : ${KG_SPATIAL_SEARCH_SRC:="git@github.com:HumanBrainProject/kg-spatial-search"}